@@ -0,0 +1,98 @@
+"""Benchmark of the batched eFEL invocation against the per-sweep one.
+
+Run from the root of the repository:
+
+    python benchmarks/efel_batching.py --n_sweeps 300
+"""
+
+import argparse
+import copy
+import glob
+import time
+
+import bluepyefe.cell
+from bluepyefe.tools import DEFAULT_EFEL_SETTINGS
+
+EFEATURES = [
+    "Spikecount", "mean_frequency", "ISI_CV", "AP1_amp", "AP_width",
+    "voltage_base", "steady_state_voltage_stimend"
+]
+
+
+def make_cell(n_sweeps):
+    """Create a cell with n_sweeps IDRest recordings by duplicating the
+    recordings available in the test data."""
+
+    files_metadata = []
+    for file in sorted(glob.glob("./tests/exp_data/B6/B6_Ch0_IDRest_*.ibw")):
+        files_metadata.append({
+            "i_file": file,
+            "v_file": file.replace("Ch0", "Ch3"),
+            "i_unit": "pA",
+            "v_unit": "mV",
+            "t_unit": "s",
+            "dt": 0.00025,
+            "ljp": 14.0,
+        })
+
+    cell = bluepyefe.cell.Cell(name="benchmark")
+    cell.read_recordings(
+        files_metadata, "IDRest", efel_settings=DEFAULT_EFEL_SETTINGS
+    )
+
+    recordings = cell.recordings
+    cell.recordings = [
+        copy.copy(recordings[i % len(recordings)]) for i in range(n_sweeps)
+    ]
+    for rec in cell.recordings:
+        rec.efeatures = {}
+
+    return cell
+
+
+def per_sweep(cell):
+    for rec in cell.get_recordings_by_protocol_name("IDRest"):
+        rec.compute_efeatures(
+            EFEATURES, list(EFEATURES), DEFAULT_EFEL_SETTINGS
+        )
+
+
+def batched(cell):
+    cell.extract_efeatures(
+        "IDRest", EFEATURES, list(EFEATURES), DEFAULT_EFEL_SETTINGS
+    )
+
+
+def timeit(func, cell, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(cell)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n_sweeps", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cell = make_cell(args.n_sweeps)
+
+    t_per_sweep = timeit(per_sweep, cell, args.repeat)
+    values_per_sweep = [dict(r.efeatures) for r in cell.recordings]
+
+    t_batched = timeit(batched, cell, args.repeat)
+    values_batched = [dict(r.efeatures) for r in cell.recordings]
+
+    assert values_per_sweep == values_batched
+
+    print(f"{args.n_sweeps} sweeps, {len(EFEATURES)} efeatures")
+    print(f"per-sweep: {t_per_sweep:.3f} s")
+    print(f"batched:   {t_batched:.3f} s")
+    print(f"speedup:   {t_per_sweep / t_batched:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark of the parsing of LCCR text files: csv.reader with a float()
+per cell (previous implementation) against numpy's C parser
+(bluepyefe.reader._read_lccr_columns).
+
+Run from the root of the repository:
+
+    python benchmarks/lccr_read.py --size_mb 100 --placeholders 0.01
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import numpy
+
+from bluepyefe.reader import _read_lccr_columns
+
+N_COLUMNS = 27
+
+
+def make_file(path, size_mb, placeholders):
+    """Create a tab-separated file of N_COLUMNS columns of voltages of about
+    size_mb. A fraction placeholders of the fields are replaced by "-"."""
+
+    # Each field is written as "-65.08\t", 7 bytes
+    n_rows = int(size_mb * 1024 ** 2 / (7 * N_COLUMNS))
+
+    rng = numpy.random.default_rng(0)
+    values = rng.normal(-65., 5., size=(n_rows, N_COLUMNS))
+    fields = numpy.char.mod("%.2f", values)
+    fields[rng.random(size=fields.shape) < placeholders] = "-"
+
+    with open(path, "w") as f:
+        for row in fields:
+            f.write("\t".join(row) + "\n")
+
+    return n_rows
+
+
+def read_previous(path, n_columns):
+    with open(path, 'rt') as f:
+        reader = csv.reader(f, delimiter='\t')
+        columns = list(zip(*reader))
+        voltages = numpy.array([
+            [
+                float(string) if string not in ["-", ""] else 0
+                for string in column
+            ]
+            for column in columns
+        ])
+    return voltages[:n_columns]
+
+
+def read_new(path, n_columns):
+    return _read_lccr_columns(path, n_columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size_mb", type=float, default=100.)
+    parser.add_argument("--placeholders", type=float, default=0.)
+    parser.add_argument("--n_amplitudes", type=int, default=N_COLUMNS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "benchmark.txt")
+        n_rows = make_file(path, args.size_mb, args.placeholders)
+        size_mb = os.path.getsize(path) / 1024 ** 2
+
+        timings = {}
+        results = {}
+        for name, read_function in [
+            ("previous", read_previous), ("new", read_new)
+        ]:
+            start = time.perf_counter()
+            results[name] = read_function(path, args.n_amplitudes)
+            timings[name] = time.perf_counter() - start
+
+    assert numpy.array_equal(results["previous"], results["new"])
+
+    print(f"{n_rows} rows x {N_COLUMNS} columns, {size_mb:.1f} MB")
+    for name, timing in timings.items():
+        print(f"{name + ':':<13} {timing:8.2f} s    {size_mb / timing:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark of the reading of NWB time series: full read followed by a
+conversion (previous implementation) against read_direct into float32
+buffers (bluepyefe.nwbreader.read_nwb_series).
+
+Run from the root of the repository:
+
+    python benchmarks/nwb_read.py --size_gb 1 --dtype int16
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import h5py
+import numpy
+
+from bluepyefe.nwbreader import read_nwb_series
+
+SWEEP_LENGTH = 2 ** 20
+
+
+def make_file(path, size_gb, dtype):
+    """Create an HDF5 file containing sweeps of random data totalling
+    size_gb of raw data."""
+
+    itemsize = numpy.dtype(dtype).itemsize
+    n_sweeps = max(1, int(size_gb * 1024 ** 3 / (SWEEP_LENGTH * itemsize)))
+
+    rng = numpy.random.default_rng(0)
+    with h5py.File(path, "w") as content:
+        for i in range(n_sweeps):
+            data = (rng.normal(size=SWEEP_LENGTH) * 3000).astype(dtype)
+            dataset = content.create_dataset(f"sweep_{i}", data=data)
+            dataset.attrs["conversion"] = 3.0517578125e-05
+
+    return n_sweeps
+
+
+def read_previous(dataset):
+    return numpy.array(
+        dataset[()] * dataset.attrs["conversion"], dtype="float32"
+    )
+
+
+def read_new(dataset):
+    return read_nwb_series(dataset, dataset.attrs["conversion"])
+
+
+def run(path, read_function, file_kwargs):
+    """Read all the sweeps of the file, returns the time and the peak memory
+    needed to read a single sweep."""
+
+    peak = 0
+    start = time.perf_counter()
+    with h5py.File(path, "r", **file_kwargs) as content:
+        for name in content:
+            tracemalloc.start()
+            read_function(content[name])
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    return time.perf_counter() - start, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size_gb", type=float, default=1.)
+    parser.add_argument("--dtype", type=str, default="int16")
+    parser.add_argument("--rdcc_nbytes", type=int, default=None)
+    parser.add_argument("--rdcc_nslots", type=int, default=None)
+    args = parser.parse_args()
+
+    file_kwargs = {
+        k: getattr(args, k) for k in ["rdcc_nbytes", "rdcc_nslots"]
+        if getattr(args, k) is not None
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "benchmark.h5")
+        n_sweeps = make_file(path, args.size_gb, args.dtype)
+
+        # Warm up the page cache so that both methods read from memory
+        run(path, read_new, file_kwargs)
+
+        t_previous, peak_previous = run(path, read_previous, file_kwargs)
+        t_new, peak_new = run(path, read_new, file_kwargs)
+
+    sweep_mb = SWEEP_LENGTH * numpy.dtype(args.dtype).itemsize / 1024 ** 2
+    print(f"{n_sweeps} sweeps of {sweep_mb:.1f} MB ({args.dtype})")
+    print("              time per GB    peak memory per sweep")
+    print(
+        f"previous:     {t_previous / args.size_gb:8.3f} s     "
+        f"{peak_previous / 1024 ** 2:8.1f} MB"
+    )
+    print(
+        f"new:          {t_new / args.size_gb:8.3f} s     "
+        f"{peak_new / 1024 ** 2:8.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+"""On-disk caches of the efeature values and of the recordings data"""
+
+"""
+Copyright (c) 2022, EPFL/Blue Brain Project
+
+ This file is part of BluePyEfe <https://github.com/BlueBrain/BluePyEfe>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import hashlib
+import importlib.metadata
+import json
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+
+import efel
+import h5py
+import numpy
+
+from .tools import NumpyEncoder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MAX_SIZE = 2 * 1024 ** 3
+
+
+def _canonical(value):
+    """Converts a value to a form whose JSON representation only depends on
+    the value itself (e.g: numpy.float64(1.) and 1. are the same)"""
+
+    if isinstance(value, (list, tuple, numpy.ndarray)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+def hash_arrays(arrays):
+    """Returns a hash of the content, type and shape of a list of arrays.
+
+    Args:
+        arrays (list of arrays): arrays to hash. None entries are allowed.
+    """
+
+    h = hashlib.sha256()
+    for array in arrays:
+        if array is None:
+            h.update(b"None")
+            continue
+        array = numpy.ascontiguousarray(array)
+        h.update(f"{array.dtype.str}{array.shape}".encode())
+        h.update(array.view(numpy.uint8))
+
+    return h.hexdigest()
+
+
+class FeatureCache():
+
+    """Cache of efeature values stored as one pickle file per entry in a
+    directory.
+
+    Entries are written to a temporary file and then moved into place, so
+    several processes (e.g: the workers of a map_function) can read and write
+    in the same directory at the same time. When the total size of the
+    directory exceeds max_size, the least recently used entries are deleted.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_MAX_SIZE, evict_every=100):
+        """
+        Constructor
+
+        Args:
+            cache_dir (str): path to the directory of the cache.
+            max_size (int): maximum size of the cache in bytes.
+            evict_every (int): number of entries written by the present
+                object between two checks of the size of the cache.
+        """
+
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_size = max_size
+        self.evict_every = evict_every
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_writes = 0
+
+    def key(self, trace_hash, efeature, context):
+        """Key of the entry for an efeature computed on a trace.
+
+        Args:
+            trace_hash (str): hash of the content of the trace.
+            efeature (str): name of the efeature in eFEL.
+            context (tuple): eFEL settings and stimulus information, as
+                returned by Recording.efel_memo_context.
+        """
+
+        description = json.dumps(
+            [trace_hash, efel.__version__, efeature, _canonical(context)]
+        )
+
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.pkl"
+
+    def load(self, key):
+        """Returns the value of an entry. Raises a KeyError if the entry is
+        not in the cache.
+
+        Args:
+            key (str): key of the entry, see FeatureCache.key.
+        """
+
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.n_misses += 1
+            raise KeyError(key)
+        except (EOFError, pickle.UnpicklingError, OSError):
+            logger.warning(f"Could not read cache entry {path}, ignoring it.")
+            self.n_misses += 1
+            raise KeyError(key)
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.n_hits += 1
+        return value
+
+    def save(self, key, value):
+        """Write an entry in the cache.
+
+        Args:
+            key (str): key of the entry, see FeatureCache.key.
+            value (object): picklable value.
+        """
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self.n_writes += 1
+        if self.n_writes % self.evict_every == 0:
+            self.evict()
+
+    def size(self):
+        """Total size in bytes of the entries of the cache"""
+
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        """List of (mtime, path, size) of the entries of the cache"""
+
+        entries = []
+        for path in self.cache_dir.glob("*/*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+
+        return entries
+
+    def evict(self):
+        """Delete the least recently used entries until the size of the cache
+        is below max_size."""
+
+        entries = self._entries()
+        total_size = sum(size for _, _, size in entries)
+
+        if total_size <= self.max_size:
+            return
+
+        for _, path, size in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            if total_size <= self.max_size:
+                break
+
+    def clear(self):
+        """Delete all the entries of the cache"""
+
+        for _, path, _ in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def get_feature_cache(cache_dir, max_size=DEFAULT_CACHE_MAX_SIZE):
+    """Returns the FeatureCache matching cache_dir, which can be None (no
+    cache), a path or an existing FeatureCache.
+
+    The size of the cache is only checked every FeatureCache.evict_every
+    writes of a same FeatureCache object. An object should therefore be
+    created once and passed to all the calls of a same run.
+
+    Args:
+        cache_dir (str or FeatureCache): path to the cache directory.
+        max_size (int): maximum size of the cache in bytes, used if a new
+            FeatureCache is created.
+    """
+
+    if cache_dir is None or isinstance(cache_dir, FeatureCache):
+        return cache_dir
+
+    return FeatureCache(cache_dir, max_size=max_size)
+
+
+def _bluepyefe_version():
+    try:
+        return importlib.metadata.version("bluepyefe")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+class TraceCache():
+
+    """Cache of the data returned by the recording readers, stored as one
+    HDF5 file per file_metadata entry. An entry is keyed by the content of the
+    file_metadata, the reader used and the path, modification time and size
+    of the files it points to. It is therefore invalidated as soon as one of
+    the files is modified.
+
+    The time series are stored compressed, as float32 when this can be done
+    without loss of precision, such that the recordings built from the cache
+    are identical to the ones built from the original files. As for the
+    FeatureCache, entries are written atomically so the cache can be shared
+    by the workers of a map_function.
+    """
+
+    def __init__(self, cache_dir, compression="gzip"):
+        """
+        Constructor
+
+        Args:
+            cache_dir (str): path to the directory of the cache.
+            compression (str): compression filter used for the time series.
+        """
+
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.compression = compression
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def key(self, config_data, reader_name):
+        """Key of the entry for a file_metadata. Returns None if the files
+        cannot be found, in which case the data should not be cached.
+
+        Args:
+            config_data (dict): file_metadata of the recordings.
+            reader_name (str): name of the reader used to read the files.
+        """
+
+        files = []
+        for file_key in ["filepath", "i_file", "v_file"]:
+            if config_data.get(file_key, None) is None:
+                continue
+            path = pathlib.Path(config_data[file_key])
+            try:
+                stat = path.stat()
+            except OSError:
+                return None
+            files.append([str(path.resolve()), stat.st_mtime_ns, stat.st_size])
+
+        if not files:
+            return None
+
+        description = json.dumps(
+            [
+                _bluepyefe_version(),
+                reader_name,
+                files,
+                json.loads(json.dumps(config_data, sort_keys=True, default=str))
+            ],
+            sort_keys=True
+        )
+
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.h5"
+
+    def load(self, key):
+        """Returns the list of reader data of an entry. Raises a KeyError if
+        the entry is not in the cache.
+
+        Args:
+            key (str): key of the entry, see TraceCache.key.
+        """
+
+        return list(self.iter_load(key))
+
+    def iter_load(self, key):
+        """Returns an iterator over the reader data of an entry, which are
+        read from the disk one at a time. Raises a KeyError if the entry is
+        not in the cache.
+
+        Args:
+            key (str): key of the entry, see TraceCache.key.
+        """
+
+        path = self._path(key)
+
+        try:
+            f = h5py.File(path, "r")
+            n = int(f.attrs["n"])
+        except FileNotFoundError:
+            self.n_misses += 1
+            raise KeyError(key)
+        except (OSError, KeyError):
+            logger.warning(f"Could not read cache entry {path}, ignoring it.")
+            self.n_misses += 1
+            raise KeyError(key)
+
+        self.n_hits += 1
+        return self._iter_groups(f, n)
+
+    def _iter_groups(self, f, n):
+        with f:
+            for i in range(n):
+                yield self._read_group(f[str(i)])
+
+    @staticmethod
+    def _read_group(group):
+
+        reader_data = {}
+
+        for name, dataset in group.items():
+            array = dataset[()]
+            dtype = dataset.attrs.get("dtype", None)
+            if dtype is not None:
+                array = array.astype(dtype)
+            reader_data[name] = array
+
+        for name, value in group.attrs.items():
+            if name in ["json", "none"]:
+                continue
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+            reader_data[name] = value
+
+        for name in json.loads(group.attrs["none"]):
+            reader_data[name] = None
+        reader_data.update(json.loads(group.attrs["json"]))
+
+        return reader_data
+
+    def save(self, key, data):
+        """Write the data returned by a reader in the cache.
+
+        Args:
+            key (str): key of the entry, see TraceCache.key.
+            data (list of dict): data returned by the reader.
+        """
+
+        for _ in self.iter_save(key, data):
+            pass
+
+    def iter_save(self, key, data):
+        """Write the data returned by a reader in the cache while passing
+        them through, one at a time. The entry is only added to the cache
+        once all the data have been consumed.
+
+        Args:
+            key (str): key of the entry, see TraceCache.key.
+            data (iterable of dict): data returned by the reader.
+        """
+
+        path = self._path(key)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            with h5py.File(tmp_path, "w") as f:
+                n = 0
+                for reader_data in data:
+                    self._write_group(f.create_group(str(n)), reader_data)
+                    n += 1
+                    yield reader_data
+                f.attrs["n"] = n
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _write_group(self, group, reader_data):
+
+        none_keys = []
+        json_values = {}
+
+        for name, value in reader_data.items():
+
+            if value is None:
+                none_keys.append(name)
+
+            elif isinstance(value, numpy.ndarray) and value.ndim:
+                dtype = None
+                if value.dtype == numpy.float64 and numpy.array_equal(
+                    value.astype(numpy.float32), value
+                ):
+                    dtype = value.dtype.str
+                    value = value.astype(numpy.float32)
+                dataset = group.create_dataset(
+                    name,
+                    data=value,
+                    chunks=True if value.size > 1 else None,
+                    compression=self.compression if value.size > 1 else None
+                )
+                if dtype is not None:
+                    dataset.attrs["dtype"] = dtype
+
+            elif isinstance(value, (str, bool, int, float, numpy.generic)):
+                group.attrs[name] = value
+
+            else:
+                json_values[name] = value
+
+        group.attrs["none"] = json.dumps(none_keys)
+        group.attrs["json"] = json.dumps(json_values, cls=NumpyEncoder)
+
+
+def get_trace_cache(cache_dir):
+    """Returns the TraceCache matching cache_dir, which can be None (no
+    cache), a path or an existing TraceCache.
+
+    Args:
+        cache_dir (str or TraceCache): path to the cache directory.
+    """
+
+    if cache_dir is None or isinstance(cache_dir, TraceCache):
+        return cache_dir
+
+    return TraceCache(cache_dir)
@@ -23,7 +23,9 @@ import numpy
 import matplotlib.pyplot as plt
 import pathlib
 
+from bluepyefe.cache import get_trace_cache
 from bluepyefe.ecode import eCodes
+from bluepyefe.recording import compute_efeatures_batch
 from bluepyefe.reader import *
 from bluepyefe.plotting import _save_fig
 from matplotlib.backends.backend_pdf import PdfPages
@@ -31,6 +33,15 @@ from matplotlib.backends.backend_pdf import PdfPages
 logger = logging.getLogger(__name__)
 
 
+def _give_buffers(data):
+    """Flags the reader data of an iterator as owning their time series,
+    which allows the recordings to modify them in place."""
+
+    for reader_data in data:
+        reader_data["owns_buffers"] = True
+        yield reader_data
+
+
 class Cell(object):
 
     """Contains the metadata related to a cell as well as the
@@ -60,6 +71,15 @@ class Cell(object):
                 used will be chosen automatically based on the extension
                 of the file.
         """
+
+        if recording_reader:
+            self._get_filepath(config_data)
+            return recording_reader(config_data)
+
+        return list(self.iter_reader(config_data))
+
+    @staticmethod
+    def _get_filepath(config_data):
         # if both present: use filepath.
         # e.g. for some nwb that 'contain' igor files
         filepath = None
@@ -73,22 +93,99 @@ class Cell(object):
                 "No 'filepath' or 'v_file' provided in the metadata for the recording."
             )
 
+        return filepath
+
+    def iter_reader(self, config_data, recording_reader=None):
+        """Same as Cell.reader, but returns an iterator over the data
+        contained in the file. The built-in readers read the traces one at a
+        time. A recording_reader can return either a list or an iterator.
+
+        Args:
+            config_data (dict): metadata for the recording considered.
+            recording_reader (callable or None): see Cell.reader.
+        """
+
+        filepath = self._get_filepath(config_data)
+
         if recording_reader:
-            return recording_reader(config_data)
+            return iter(recording_reader(config_data))
         if ".abf" in filepath:
-            return axon_reader(config_data)
+            return iter_axon_reader(config_data)
         if ".ibw" in filepath or ".bwav" in filepath:
-            return igor_reader(config_data)
+            return iter_igor_reader(config_data)
         if ".nwb" in filepath:
-            return nwb_reader(config_data)
+            return iter_nwb_reader(config_data)
         if ".txt" in filepath:
-            return csv_lccr_reader(config_data)
+            return iter_csv_lccr_reader(config_data)
 
         raise Exception(
             "The format of the ephys files is unknown and no custom reader"
             "were provided."
         )
 
+    def read_data(self, config_data, recording_reader=None, trace_cache=None):
+        """Returns the data contained in the file(s) of a recording, using the
+        trace cache if one is provided.
+
+        Args:
+            config_data (dict): metadata for the recording considered.
+            recording_reader (callable or None): see Cell.reader.
+            trace_cache (TraceCache): cache of the data returned by the
+                readers.
+        """
+
+        return list(
+            self.iter_data(config_data, recording_reader, trace_cache)
+        )
+
+    def iter_data(self, config_data, recording_reader=None, trace_cache=None):
+        """Same as Cell.read_data, but returns an iterator over the data
+        such that the traces can be processed one at a time.
+
+        Args:
+            config_data (dict): metadata for the recording considered.
+            recording_reader (callable or None): see Cell.reader.
+            trace_cache (TraceCache): cache of the data returned by the
+                readers.
+        """
+
+        # The arrays returned by the built-in readers and the trace cache are
+        # not referenced anywhere else and can be standardized in place
+        owned = recording_reader is None
+
+        # Lazy series point to the original files, there is nothing to cache,
+        # and compact series are as small as the content of the files
+        if (
+            trace_cache is None
+            or config_data.get("lazy", False)
+            or config_data.get("compact", False)
+        ):
+            data = self.iter_reader(config_data, recording_reader)
+
+        else:
+            reader_name = "auto"
+            if recording_reader is not None:
+                reader_name = "{}.{}".format(
+                    getattr(recording_reader, "__module__", ""),
+                    getattr(recording_reader, "__qualname__", repr(recording_reader))
+                )
+
+            key = trace_cache.key(config_data, reader_name)
+            if key is None:
+                data = self.iter_reader(config_data, recording_reader)
+            else:
+                try:
+                    data = trace_cache.iter_load(key)
+                    owned = True
+                except KeyError:
+                    data = trace_cache.iter_save(
+                        key, self.iter_reader(config_data, recording_reader)
+                    )
+
+        if owned:
+            return _give_buffers(data)
+        return data
+
     def get_protocol_names(self):
         """List of all the protocols available for the present cell."""
 
@@ -129,7 +226,9 @@ class Cell(object):
         protocol_data,
         protocol_name,
         recording_reader=None,
-        efel_settings=None
+        efel_settings=None,
+        trace_cache_dir=None,
+        lazy=False
     ):
         """
         For each member of a list of recordings metadata, instantiate a Recording object and
@@ -146,14 +245,36 @@ class Cell(object):
                 of the file.
             efel_settings (dict): eFEL settings in the form
                 {setting_name: setting_value}.
+            trace_cache_dir (str): Optional. Path to a directory used to cache
+                the data read from the files. On later calls, the files that
+                were not modified are not parsed again.
+            lazy (bool): default value of "lazy" for the metadata that do not
+                inform it.
+
+        If "lazy" is True in the metadata of an NWB or .abf recording, its
+        voltage series is not read with the current. It is only read when
+        needed (e.g: for the rheobase, by eFEL or for plotting) and kept in
+        memory while it is being used.
+
+        If "compact" is True in the metadata of an NWB or .abf recording, the
+        series stored as integers in the file are kept as their raw samples
+        and only converted to float when needed.
         """
 
+        trace_cache = get_trace_cache(trace_cache_dir)
+
         for config_data in protocol_data:
 
             if "protocol_name" not in config_data:
                 config_data["protocol_name"] = protocol_name
 
-            for reader_data in self.reader(config_data, recording_reader):
+            if lazy and "lazy" not in config_data:
+                config_data = {**config_data, "lazy": True}
+
+            # The traces are read and turned into recordings one at a time
+            for reader_data in self.iter_data(
+                config_data, recording_reader, trace_cache
+            ):
 
                 for ecode in eCodes.keys():
                     if ecode.lower() in protocol_name.lower():
@@ -163,6 +284,9 @@ class Cell(object):
                             protocol_name,
                             efel_settings
                         )
+                        # The voltage of lazy recordings was only needed for
+                        # spike detection, it will be read again if needed
+                        rec.release_voltage()
                         self.recordings.append(rec)
                         break
                 else:
@@ -172,15 +296,22 @@ class Cell(object):
                         f"the available stimuli names"
                     )
 
+                # Do not hold the raw trace while the next one is read
+                del reader_data
+
     def extract_efeatures(
         self,
         protocol_name,
         efeatures,
         efeature_names=None,
-        efel_settings=None
+        efel_settings=None,
+        cache_dir=None,
+        recordings=None
     ):
         """
         Extract the efeatures for the recordings matching the protocol name.
+        The recordings are sent to eFEL together, the eFEL settings being
+        applied only once per group of recordings sharing the same settings.
 
         Args:
             protocol_name (str): name of the protocol for which to extract
@@ -191,11 +322,36 @@ class Cell(object):
                 features. Can and should be used if the same feature
                 is to be extracted several time on different sections
                 of the same recording.
+            efel_settings (dict): eFEL settings in the form
+                {setting_name: setting_value}.
+            cache_dir (str): Optional. Path to a directory used to cache the
+                efeature values on disk.
+            recordings (list of Recording): Optional. Subset of the
+                recordings of the protocol for which to extract the
+                efeatures. If None, all the recordings of the protocol are
+                used.
         """
 
-        for i in self.get_recordings_id_by_protocol_name(protocol_name):
-            self.recordings[i].compute_efeatures(
-                efeatures, efeature_names, efel_settings)
+        if recordings is None:
+            recordings = self.get_recordings_by_protocol_name(protocol_name)
+
+        # Lazy voltages read only for the extraction are released after
+        loaded = [rec._voltage is not None for rec in recordings]
+
+        compute_efeatures_batch(
+            recordings,
+            efeatures,
+            efeature_names,
+            efel_settings,
+            cache_dir
+        )
+
+        # The threshold is needed when grouping the recordings, compute it
+        # before the voltage is released
+        for rec, was_loaded in zip(recordings, loaded):
+            if not was_loaded and rec.is_lazy:
+                rec.detect_spikes(threshold_only=True)
+                rec.release_voltage()
 
     def compute_relative_amp(self):
         """Compute the relative current amplitude for all the recordings as a
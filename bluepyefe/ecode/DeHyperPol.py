@@ -77,14 +77,12 @@ class DeHyperPol(Recording):
         self.amp2_rel = None
         self.hypamp_rel = None
 
-        if self.t is not None and self.current is not None:
+        if self.time_axis is not None and self.current is not None:
             self.interpret(
-                self.t, self.current, self.config_data, self.reader_data
+                self.time_axis, self.current, self.config_data, self.reader_data
             )
 
-        if self.voltage is not None:
-            self.set_autothreshold()
-            self.compute_spikecount(efel_settings)
+        self.defer_spike_detection(efel_settings)
 
         self.export_attr = ["ton", "tmid", "toff", "tend", "amp", "amp2", "hypamp",
                             "dt", "amp_rel", "amp2_rel", "hypamp_rel"]
@@ -90,14 +90,12 @@ class NegCheops(Recording):
         self.amp_rel = None
         self.hypamp_rel = None
 
-        if self.t is not None and self.current is not None:
+        if self.time_axis is not None and self.current is not None:
             self.interpret(
-                self.t, self.current, self.config_data, self.reader_data
+                self.time_axis, self.current, self.config_data, self.reader_data
             )
 
-        if self.voltage is not None:
-            self.set_autothreshold()
-            self.compute_spikecount(efel_settings)
+        self.defer_spike_detection(efel_settings)
 
         self.export_attr = ["ton", "t1", "t2", "t3", "t4", "toff", "tend",
                             "amp", "hypamp", "dt", "amp_rel", "hypamp_rel"]
@@ -76,14 +76,12 @@ class SAHP(Recording):
         self.amp2_rel = None
         self.hypamp_rel = None
 
-        if self.t is not None and self.current is not None:
+        if self.time_axis is not None and self.current is not None:
             self.interpret(
-                self.t, self.current, self.config_data, self.reader_data
+                self.time_axis, self.current, self.config_data, self.reader_data
             )
 
-        if self.voltage is not None:
-            self.set_autothreshold()
-            self.compute_spikecount(efel_settings)
+        self.defer_spike_detection(efel_settings)
 
         self.export_attr = ["ton", "tmid", "tmid2", "toff", "tend", "amp",
                             "amp2", "hypamp", "dt", "amp_rel", "amp2_rel",
@@ -129,14 +127,14 @@ class SAHP(Recording):
         self.set_amplitudes_ecode("amp2", config_data, reader_data, amp2_value)
 
         if config_data.get("tend", None) is None:
-            self.tend = len(self.t) * self.dt
+            self.tend = len(self.time_axis) * self.dt
         else:
             self.tend = config_data["tend"]
 
-        self.ton = self.t[int(round(self.ton))]
-        self.toff = self.t[int(round(self.toff))]
-        self.tmid = self.t[int(round(self.tmid))]
-        self.tmid2 = self.t[int(round(self.tmid2))]
+        self.ton = self.time_axis[int(round(self.ton))]
+        self.toff = self.time_axis[int(round(self.toff))]
+        self.tmid = self.time_axis[int(round(self.tmid))]
+        self.tmid2 = self.time_axis[int(round(self.tmid2))]
 
     def step_detection(self, current, config_data, reader_data):
 
@@ -197,11 +195,11 @@ class SAHP(Recording):
         self.amp2 = numpy.median(smooth_current[self.tmid:self.tmid2]) - self.hypamp
 
         # Converting back ton and toff to ms
-        self.ton = self.t[int(round(self.ton))]
-        self.toff = self.t[int(round(self.toff))]
-        self.tmid = self.t[int(round(self.tmid))]
-        self.tmid2 = self.t[int(round(self.tmid2))]
-        self.tend = len(self.t) * self.dt
+        self.ton = self.time_axis[int(round(self.ton))]
+        self.toff = self.time_axis[int(round(self.toff))]
+        self.tmid = self.time_axis[int(round(self.tmid))]
+        self.tmid2 = self.time_axis[int(round(self.tmid2))]
+        self.tend = len(self.time_axis) * self.dt
 
         # Check for some common step detection failures when the current
         # is constant.
@@ -232,7 +230,7 @@ class SAHP(Recording):
             try:
                 self.step_detection(current, config_data, reader_data)
             except ValueError:  # when numpy.argmax gets an empty sequence
-                self.tend = len(self.t) * self.dt
+                self.tend = len(self.time_axis) * self.dt
                 self.ton = 0
                 self.toff = self.tend
                 self.tmid = 0
@@ -19,6 +19,7 @@ Copyright (c) 2022, EPFL/Blue Brain Project
  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 import os
+import copy
 import pickle
 import functools
 import logging
@@ -28,7 +29,13 @@ import gc
 import numpy
 
 from bluepyefe import tools
+from bluepyefe.cache import DEFAULT_CACHE_MAX_SIZE, FeatureCache
+from bluepyefe.cache import get_feature_cache
 from bluepyefe.cell import Cell
+from bluepyefe.file_pool import file_pool
+from bluepyefe.parallel import executor_map_function, load_shared_series
+from bluepyefe.parallel import runs_in_threads, pipeline_map
+from bluepyefe.parallel import DEFAULT_MEMORY_BUDGET
 from bluepyefe.plotting import plot_all_recordings
 from bluepyefe.plotting import plot_all_recordings_efeatures
 from bluepyefe.protocol import Protocol
@@ -37,11 +44,16 @@ from bluepyefe.rheobase import compute_rheobase_absolute
 from bluepyefe.rheobase import compute_rheobase_flush
 from bluepyefe.rheobase import compute_rheobase_majority_bin
 from bluepyefe.rheobase import compute_rheobase_interpolation
+from bluepyefe.rheobase import count_recordings_spikes, SPIKECOUNT_METHODS
 from bluepyefe.tools import DEFAULT_EFEL_SETTINGS, PRESET_PROTOCOLS_RHEOBASE
 from bluepyefe.auto_targets import default_auto_targets
 
 logger = logging.getLogger(__name__)
 
+# Counts of the recordings of the last extraction made with in_target_only,
+# see extraction_stats
+_extraction_stats = {}
+
 
 def cells_pickle_output_path(output_directory):
     """Returns the cells.pkl output file path
@@ -61,7 +73,13 @@ def protocols_pickle_output_path(output_directory):
     return output_directory / "protocols.pkl"
 
 
-def _create_cell(cell_definition, recording_reader, efel_settings=None):
+def _create_cell(
+    cell_definition,
+    recording_reader,
+    efel_settings=None,
+    trace_cache_dir=None,
+    lazy=False
+):
     """
     Initialize a Cell object and populate it with the content of the associated
     recording files.
@@ -77,6 +95,10 @@ def _create_cell(cell_definition, recording_reader, efel_settings=None):
             of the file.
         efel_settings (dict): eFEL settings in the form
             {setting_name: setting_value}.
+        trace_cache_dir (str): Optional. Path to a directory used to cache
+            the data read from the files.
+        lazy (bool): if True, the voltage of the recordings is only read
+            when needed (see Cell.read_recordings).
     """
 
     cell_name = cell_definition[0]
@@ -89,30 +111,115 @@ def _create_cell(cell_definition, recording_reader, efel_settings=None):
             protocol_data=cell[prot_name],
             protocol_name=prot_name,
             recording_reader=recording_reader,
-            efel_settings=efel_settings
+            efel_settings=efel_settings,
+            trace_cache_dir=trace_cache_dir,
+            lazy=lazy
         )
 
     return out_cell
 
 
-def _extract_efeatures_cell(cell, targets, efel_settings=None):
-    """
-    Compute the efeatures on all the recordings of a Cell.
+def _longest_first(costs):
+    """Indexes of the tasks sorted from the most to the least costly. Tasks
+    of same cost keep their order."""
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
 
-    The present function exists to be use by the map_function.
 
-    Args:
-        cell (Cell): cell for which to extract the efeatures.
-        targets (list of Target): targets to extract from the recordings of
-            the present cell.
-        efel_settings (dict): eFEL settings in the form
-            {setting_name: setting_value}.
-    """
+def _file_size(config_data):
+    """Size in bytes of the files of a recording, used as an estimate of the
+    cost of reading it"""
 
-    if efel_settings is None:
-        efel_settings = {}
+    size = 0
+    for key in ["filepath", "i_file", "v_file"]:
+        path = config_data.get(key, None)
+        if isinstance(path, (str, os.PathLike)) and os.path.isfile(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def _cell_files_size(cell_definition):
+    """Size in bytes of the files of a cell, each file being counted once
+    even if it holds the data of several protocols"""
+
+    sizes = {}
+    for protocol_data in cell_definition[1].values():
+        for config_data in protocol_data:
+            key = tuple(
+                config_data.get(k, None) for k in ["filepath", "i_file", "v_file"]
+            )
+            sizes[key] = _file_size(config_data)
+    return sum(sizes.values())
+
+
+def _read_file(
+    task, recording_reader, efel_settings=None, trace_cache_dir=None,
+    lazy=False
+):
+    """Read the recordings of a single file of a cell. Returns a Cell only
+    containing these recordings.
+
+    The present function exists to be use by the map_function."""
+
+    cell_name, protocol_name, config_data = task
+
+    cell = Cell(name=cell_name)
+    cell.read_recordings(
+        protocol_data=[config_data],
+        protocol_name=protocol_name,
+        recording_reader=recording_reader,
+        efel_settings=efel_settings,
+        trace_cache_dir=trace_cache_dir,
+        lazy=lazy
+    )
+
+    return cell
+
+
+def _read_recordings_per_file(
+    files_metadata, recording_reader, map_function, efel_settings=None,
+    trace_cache_dir=None, lazy=False
+):
+    """Same as read_recordings, but each file is read by a different task of
+    the map_function. The tasks are submitted from the largest to the
+    smallest file and the recordings reassembled in the order of
+    files_metadata."""
+
+    tasks = []
+    for cell_name, cell_definition in files_metadata.items():
+        for protocol_name, protocol_data in cell_definition.items():
+            for config_data in protocol_data:
+                if "protocol_name" not in config_data:
+                    config_data["protocol_name"] = protocol_name
+                tasks.append((cell_name, protocol_name, config_data))
+
+    order = _longest_first([_file_size(task[2]) for task in tasks])
+
+    results = map_function(
+        functools.partial(
+            _read_file,
+            recording_reader=recording_reader,
+            efel_settings=efel_settings,
+            trace_cache_dir=trace_cache_dir,
+            lazy=lazy
+        ),
+        [tasks[i] for i in order],
+    )
+
+    file_cells = [None] * len(tasks)
+    for i, file_cell in zip(order, results):
+        file_cells[i] = file_cell
+
+    cells = {name: Cell(name=name) for name in files_metadata}
+    for (cell_name, _, _), file_cell in zip(tasks, file_cells):
+        cells[cell_name].recordings += file_cell.recordings
+
+    return list(cells.values())
+
+
+def _group_targets(targets):
+    """Group the targets per same protocol and same eFEL settings, such that
+    the efeatures of a group can be extracted together"""
 
-    # Group targets per same protocol and same eFEL settings for efficiency
     setting_groups = []
     for target in targets:
 
@@ -124,6 +231,7 @@ def _extract_efeatures_cell(cell, targets, efel_settings=None):
                     target["protocol"] == group['protocol']:
                 setting_groups[i]["efeatures"].append(target["efeature"])
                 setting_groups[i]['efeature_names'].append(efeature_name)
+                setting_groups[i]['targets'].append(target)
                 break
 
         else:
@@ -132,21 +240,251 @@ def _extract_efeatures_cell(cell, targets, efel_settings=None):
                 'efel_settings': target["efel_settings"],
                 'protocol': target["protocol"],
                 'efeatures': [target["efeature"]],
-                'efeature_names': [efeature_name]
+                'efeature_names': [efeature_name],
+                'targets': [target]
             }
             setting_groups.append(setting_group)
 
+    return setting_groups
+
+
+def _target_windows(targets):
+    """Tolerance of each (protocol, amplitude) of the targets. As in
+    _build_protocols, the tolerance is the one of the first target of the
+    protocol at this amplitude."""
+
+    windows = {}
+    for target in targets:
+        windows.setdefault(
+            (target["protocol"], target["amplitude"]), target["tolerance"]
+        )
+    return windows
+
+
+def _recordings_in_targets(cell, group, windows, absolute_amplitude=False):
+    """Recordings of a cell that group_efeatures will associate to at least
+    one of the targets of a group of targets"""
+
+    if cell.rheobase is None and not absolute_amplitude:
+        return []
+
+    amplitudes = set(target["amplitude"] for target in group["targets"])
+
+    return [
+        rec for rec in cell.get_recordings_by_protocol_name(group["protocol"])
+        if any(
+            rec.in_target(
+                amp, windows[(group["protocol"], amp)], absolute_amplitude
+            )
+            for amp in amplitudes
+        )
+    ]
+
+
+def _extract_efeatures_cell(
+    cell,
+    targets,
+    efel_settings=None,
+    cache_dir=None,
+    in_target_only=False,
+    absolute_amplitude=False
+):
+    """
+    Compute the efeatures on all the recordings of a Cell.
+
+    The present function exists to be use by the map_function.
+
+    Args:
+        cell (Cell): cell for which to extract the efeatures.
+        targets (list of Target): targets to extract from the recordings of
+            the present cell.
+        efel_settings (dict): eFEL settings in the form
+            {setting_name: setting_value}.
+        cache_dir (str): Optional. Path to a directory used to cache the
+            efeature values on disk.
+        in_target_only (bool): if True, the efeatures are only extracted
+            from the recordings whose amplitude matches one of the targets.
+            The relative amplitudes have to be computed beforehand.
+        absolute_amplitude (bool): if True, the absolute amplitude of the
+            recordings is compared to the targets instead of the relative
+            one. Only used if in_target_only is True.
+    """
+
+    if efel_settings is None:
+        efel_settings = {}
+
+    # Group targets per same protocol and same eFEL settings for efficiency
+    setting_groups = _group_targets(targets)
+    windows = _target_windows(targets)
+
     for group in setting_groups:
+
+        recordings = None
+        if in_target_only:
+            recordings = _recordings_in_targets(
+                cell, group, windows, absolute_amplitude
+            )
+            if not recordings:
+                continue
+
         cell.extract_efeatures(
             group['protocol'],
             group["efeatures"],
             group["efeature_names"],
-            efel_settings={**efel_settings, **group["efel_settings"]}
+            efel_settings={**efel_settings, **group["efel_settings"]},
+            cache_dir=cache_dir,
+            recordings=recordings
         )
 
     return cell
 
 
+def _extract_efeatures_chunk(task, cache_dir=None):
+    """Extract efeatures from a chunk of recordings of a cell. Returns, for
+    each recording, the efeatures of the task and the automatic threshold
+    (None if it was not computed).
+
+    The efeatures are computed on shallow copies of the recordings, such
+    that the tasks of a same recording (different groups of targets) never
+    write in the same efeatures, even when they run at the same time in
+    threads of the present process.
+
+    The present function exists to be use by the map_function."""
+
+    recordings = []
+    for rec in task["recordings"]:
+        rec = copy.copy(rec)
+        rec.efeatures = {}
+        recordings.append(rec)
+
+    Cell(name="").extract_efeatures(
+        task["protocol"],
+        list(task["efeatures"]),
+        list(task["efeature_names"]),
+        efel_settings=task["efel_settings"],
+        cache_dir=cache_dir,
+        recordings=recordings
+    )
+
+    return [
+        (rec.efeatures, None if rec._threshold_pending else rec._auto_threshold)
+        for rec in recordings
+    ]
+
+
+def _extract_efeatures_per_chunk(
+    cells, targets, map_function, efel_settings=None, cache_dir=None,
+    in_target_only=False, absolute_amplitude=False, chunk_size=8
+):
+    """Same as extract_efeatures_at_targets, but the tasks of the
+    map_function are chunks of at most chunk_size recordings of a same cell
+    and group of targets. The tasks are submitted from the longest to the
+    shortest (total number of samples of the recordings). Once all the
+    tasks are done, their efeatures are stored in the recordings in the
+    order of the tasks, which is the order in which they are stored when
+    extracting per cell: when groups of targets with different eFEL
+    settings use the same efeature name, the last group wins in both
+    cases."""
+
+    if efel_settings is None:
+        efel_settings = {}
+
+    setting_groups = _group_targets(targets)
+    windows = _target_windows(targets)
+
+    tasks = []
+    for cell in cells:
+        for group in setting_groups:
+
+            if in_target_only:
+                recordings = _recordings_in_targets(
+                    cell, group, windows, absolute_amplitude
+                )
+            else:
+                recordings = cell.get_recordings_by_protocol_name(
+                    group["protocol"]
+                )
+
+            for i in range(0, len(recordings), chunk_size):
+                tasks.append({
+                    "protocol": group["protocol"],
+                    "efeatures": group["efeatures"],
+                    "efeature_names": group["efeature_names"],
+                    "efel_settings": {**efel_settings, **group["efel_settings"]},
+                    "recordings": recordings[i:i + chunk_size]
+                })
+
+    order = _longest_first([
+        sum(len(rec.time_axis) for rec in task["recordings"])
+        for task in tasks
+    ])
+
+    results = map_function(
+        functools.partial(_extract_efeatures_chunk, cache_dir=cache_dir),
+        [tasks[i] for i in order],
+    )
+
+    task_results = [None] * len(tasks)
+    for i, result in zip(order, results):
+        task_results[i] = result
+
+    for task, result in zip(tasks, task_results):
+        for rec, (efeatures, auto_threshold) in zip(task["recordings"], result):
+            rec.efeatures.update(efeatures)
+            # Threshold computed by the worker while the voltage was loaded
+            if rec._threshold_pending and auto_threshold is not None:
+                rec.auto_threshold = auto_threshold
+
+    return cells
+
+
+def _log_skipped_recordings(cells, targets, absolute_amplitude=False):
+    """Count and log how many recordings of the protocols of the targets
+    were not sent to eFEL because they do not match any target. The counts
+    are kept for extraction_stats and returned."""
+
+    windows = _target_windows(targets)
+
+    in_protocols = set()
+    extracted = set()
+    for group in _group_targets(targets):
+        for cell in cells:
+            in_protocols.update(
+                id(rec)
+                for rec in cell.get_recordings_by_protocol_name(group["protocol"])
+            )
+            extracted.update(
+                id(rec) for rec in _recordings_in_targets(
+                    cell, group, windows, absolute_amplitude
+                )
+            )
+
+    stats = {
+        "recordings": len(in_protocols),
+        "extracted": len(extracted),
+        "skipped": len(in_protocols) - len(extracted),
+    }
+    _extraction_stats.clear()
+    _extraction_stats.update(stats)
+
+    logger.info(
+        f"The efeatures were extracted from {stats['extracted']} recordings, "
+        f"{stats['skipped']} recordings outside of the targets were not sent "
+        "to eFEL."
+    )
+
+    return stats
+
+
+def extraction_stats():
+    """Returns the counts of the recordings of the last extraction made with
+    in_target_only as a dictionary: "recordings" (recordings of the protocols
+    of the targets), "extracted" (recordings sent to eFEL) and "skipped"
+    (recordings that do not match any target and were not sent to eFEL)."""
+
+    return dict(_extraction_stats)
+
+
 def _saving_data(output_directory, feat, stim, currents):
     """
     Save the features, protocols and current to json files.
@@ -182,7 +520,14 @@ def read_recordings(
     files_metadata,
     recording_reader=None,
     map_function=map,
-    efel_settings=None
+    efel_settings=None,
+    trace_cache_dir=None,
+    lazy=False,
+    split_cells=False,
+    n_jobs=None,
+    executor=None,
+    chunksize=1,
+    backend="processes"
 ):
     """
     Read recordings from a group of files. The files are expected to be
@@ -214,31 +559,76 @@ def read_recordings(
         map_function (function): Function used to map (parallelize) the
             recording reading operations. Note: the parallelization is
             done across cells an not across files.
+            The map of a bluepyefe.parallel.SharedTracePool avoids pickling
+            the traces between the processes.
         efel_settings (dict): eFEL settings in the form
             {setting_name: setting_value}.
+        trace_cache_dir (str): Optional. Path to a directory used to cache
+            the data read from the files (see bluepyefe.cache.TraceCache).
+            On later calls, the files that were not modified since are not
+            parsed again.
+        lazy (bool): if True, "lazy" is set in the file metadata that do not
+            inform it: the voltage of the NWB and .abf recordings is not
+            read with their current but only when needed. The rheobase then
+            only reads the voltage of the protocols_rheobase and the
+            extraction the voltage of the recordings matching the targets.
+        split_cells (bool): if True, each file is read by a different task
+            of the map_function instead of each cell. The tasks are
+            submitted from the largest to the smallest file, which balances
+            the load when the cells have very different numbers of files.
+        n_jobs (int): Optional. Number of processes used to read the
+            recordings (-1 for the number of CPUs), see extract_efeatures.
+        executor (concurrent.futures.Executor): Optional. Executor used
+            instead of map_function.
+        chunksize (int): number of cells (or files) sent together to a
+            worker when using n_jobs or executor.
+        backend (str): "processes" or "threads", type of the workers created
+            for n_jobs.
 
     Return:
          cells (list): list of Cell objects containing the data of the
          recordings
     """
 
-    cells = map_function(
-        functools.partial(
-            _create_cell,
-            recording_reader=recording_reader,
-            efel_settings=efel_settings
-        ),
-        list(files_metadata.items()),
-    )
+    with executor_map_function(
+        map_function, n_jobs, executor, chunksize, backend
+    ) as map_function:
+
+        if split_cells:
+            return _read_recordings_per_file(
+                files_metadata,
+                recording_reader,
+                map_function,
+                efel_settings=efel_settings,
+                trace_cache_dir=trace_cache_dir,
+                lazy=lazy
+            )
+
+        cells = map_function(
+            functools.partial(
+                _create_cell,
+                recording_reader=recording_reader,
+                efel_settings=efel_settings,
+                trace_cache_dir=trace_cache_dir,
+                lazy=lazy
+            ),
+            list(files_metadata.items()),
+        )
 
-    return list(cells)
+        return list(cells)
 
 
 def extract_efeatures_at_targets(
     cells,
     targets,
     map_function=map,
-    efel_settings=None
+    efel_settings=None,
+    cache_dir=None,
+    in_target_only=False,
+    absolute_amplitude=False,
+    split_cells=False,
+    chunk_size=8,
+    cache_max_size=DEFAULT_CACHE_MAX_SIZE
 ):
     """
     Extract efeatures from recordings following the protocols, amplitudes and
@@ -268,9 +658,35 @@ def extract_efeatures_at_targets(
         map_function (function): Function used to map (parallelize) the
             feature extraction operations. Note: the parallelization is
             done across cells an not across efeatures.
+            The map of a bluepyefe.parallel.SharedTracePool avoids pickling
+            the traces between the processes.
         efel_settings (dict): eFEL settings in the form
             {setting_name: setting_value}. If settings are also informed
             in the targets per efeature, the latter will have priority.
+        cache_dir (str or FeatureCache): Optional. Path to a directory used
+            to cache the efeature values on disk. When extracting again from
+            the same recordings, only the efeatures missing from the cache
+            are computed. The directory can be shared by the workers of the
+            map_function.
+        in_target_only (bool): if True, the efeatures are only extracted
+            from the recordings that group_efeatures will associate to a
+            target, the other recordings are not sent to eFEL. Requires the
+            relative amplitudes of the recordings to be computed beforehand
+            (see compute_rheobase) unless absolute_amplitude is True.
+        absolute_amplitude (bool): if True, the absolute amplitude of the
+            recordings is compared to the targets instead of the relative
+            one. Only used if in_target_only is True.
+        split_cells (bool): if True, the tasks of the map_function are
+            chunks of recordings of a same cell and protocol instead of
+            whole cells. The tasks are submitted from the longest to the
+            shortest, which balances the load when the cells have very
+            different numbers of recordings. The tasks only return the
+            efeatures of the recordings.
+        chunk_size (int): maximum number of recordings per task if
+            split_cells is True.
+        cache_max_size (int): maximum size in bytes of the cache_dir. The
+            least recently used entries are deleted at the end of the
+            extraction when it is exceeded.
     """
 
     for target in targets:
@@ -281,23 +697,50 @@ def extract_efeatures_at_targets(
         if 'efel_settings' not in target:
             target['efel_settings'] = {}
 
-    cells = map_function(
-        functools.partial(
-            _extract_efeatures_cell,
-            targets=targets,
-            efel_settings=efel_settings
-        ),
-        cells,
-    )
+    if in_target_only:
+        _log_skipped_recordings(cells, targets, absolute_amplitude)
+
+    # A cache given as a FeatureCache is managed by the caller
+    owns_cache = not isinstance(cache_dir, FeatureCache)
+    cache_dir = get_feature_cache(cache_dir, cache_max_size)
 
-    return list(cells)
+    if split_cells:
+        cells = _extract_efeatures_per_chunk(
+            cells,
+            targets,
+            map_function,
+            efel_settings=efel_settings,
+            cache_dir=cache_dir,
+            in_target_only=in_target_only,
+            absolute_amplitude=absolute_amplitude,
+            chunk_size=chunk_size
+        )
+
+    else:
+        cells = list(map_function(
+            functools.partial(
+                _extract_efeatures_cell,
+                targets=targets,
+                efel_settings=efel_settings,
+                cache_dir=cache_dir,
+                in_target_only=in_target_only,
+                absolute_amplitude=absolute_amplitude
+            ),
+            cells,
+        ))
+
+    if owns_cache and cache_dir is not None:
+        cache_dir.evict()
+
+    return cells
 
 
 def compute_rheobase(
     cells,
     protocols_rheobase,
     rheobase_strategy="absolute",
-    rheobase_settings=None
+    rheobase_settings=None,
+    spikecount_method="efel"
 ):
     """
     For each cell, finds the smallest current inducing a spike (rheobase).
@@ -316,11 +759,19 @@ def compute_rheobase(
         rheobase_settings (dict): settings related to the rheobase computation.
             Keys have to match the arguments expected by the rheobase
             computation function.
+        spikecount_method (str): how the spikes of the recordings used for
+            the rheobase are counted. Can be 'efel', 'numpy' (threshold
+            crossings counted with numpy, see rheobase.count_spikes) or
+            'validate' (both, the recordings for which the counts differ are
+            reported and the counts of eFEL are used).
     """
 
     if rheobase_settings is None:
         rheobase_settings = {}
 
+    if spikecount_method not in SPIKECOUNT_METHODS:
+        raise Exception(f"Spikecount method {spikecount_method} unknown.")
+
     if rheobase_strategy == "absolute":
         rheobase_function = compute_rheobase_absolute
     elif rheobase_strategy == "flush":
@@ -333,10 +784,25 @@ def compute_rheobase(
         raise Exception(f"Rheobase strategy {rheobase_strategy} unknown.")
 
     for cell in cells:
+        if spikecount_method != "efel":
+            _count_rheobase_spikes(cell, protocols_rheobase, spikecount_method)
         rheobase_function(cell, protocols_rheobase, **rheobase_settings)
         cell.compute_relative_amp()
 
 
+def _count_rheobase_spikes(cell, protocols_rheobase, spikecount_method):
+    """Count the spikes of the recordings of protocols_rheobase with the
+    numpy spike counter"""
+
+    count_recordings_spikes(
+        [
+            rec for rec in cell.recordings
+            if rec.protocol_name in protocols_rheobase
+        ],
+        validate=spikecount_method == "validate"
+    )
+
+
 def _build_protocols(
     targets,
     global_rheobase,
@@ -606,58 +1072,165 @@ def create_feature_protocol_files(
     return out_features, out_stimuli, currents
 
 
-def _read_extract(
-    files_metadata,
-    recording_reader,
-    map_function,
-    targets,
-    efel_settings=None
+def _read_extract_cell_summary(
+    cell_definition, recording_reader, targets, efel_settings=None,
+    cache_dir=None, trace_cache_dir=None, protocols_rheobase=None,
+    spikecount_method="efel", absolute_amplitude=False,
+    rheobase_strategy="absolute", rheobase_settings=None,
+    in_target_only=False, lazy=False
 ):
-    """Read recordings and create the matching Cell objects based on a files_metadata."""
+    """Read the recordings of a cell, compute its rheobase (unless
+    absolute_amplitude is True) and extract its efeatures. The recordings of
+    the returned Cell are RecordingSummary, without time series.
 
-    cells = read_recordings(
-        files_metadata,
-        recording_reader=recording_reader,
-        map_function=map_function,
-        efel_settings=efel_settings
+    The present function exists to be use by the map_function."""
+
+    cell = _create_cell(
+        cell_definition,
+        recording_reader,
+        efel_settings=efel_settings,
+        trace_cache_dir=trace_cache_dir,
+        lazy=lazy
     )
 
-    cells = extract_efeatures_at_targets(
-        cells, targets, map_function=map_function, efel_settings=efel_settings
+    return _extract_cell_summary(
+        cell, targets, efel_settings, cache_dir, protocols_rheobase,
+        spikecount_method, absolute_amplitude, rheobase_strategy,
+        rheobase_settings, in_target_only
     )
 
-    return cells
+
+def _extract_cell_summary(
+    cell, targets, efel_settings=None, cache_dir=None,
+    protocols_rheobase=None, spikecount_method="efel",
+    absolute_amplitude=False, rheobase_strategy="absolute",
+    rheobase_settings=None, in_target_only=False
+):
+    """Same as _read_extract_cell_summary for a cell already read."""
+
+    if not absolute_amplitude:
+        compute_rheobase(
+            [cell],
+            protocols_rheobase=protocols_rheobase,
+            rheobase_strategy=rheobase_strategy,
+            rheobase_settings=rheobase_settings,
+            spikecount_method=spikecount_method
+        )
+
+    _extract_efeatures_cell(
+        cell,
+        targets,
+        efel_settings=efel_settings,
+        cache_dir=cache_dir,
+        in_target_only=in_target_only,
+        absolute_amplitude=absolute_amplitude
+    )
+
+    # The automatic thresholds and the spikes needed for the rheobase
+    # cannot be computed once the voltage is deleted
+    count_with_efel = spikecount_method == "efel" or protocols_rheobase is None
+    if not count_with_efel and absolute_amplitude:
+        _count_rheobase_spikes(cell, protocols_rheobase, spikecount_method)
+    for rec in cell.recordings:
+        # The threshold of the lazy recordings matching the targets was
+        # computed during the extraction, the voltage of the others is
+        # not needed
+        if in_target_only and rec.is_lazy:
+            continue
+        rec.detect_spikes(
+            threshold_only=not count_with_efel
+            or (
+                protocols_rheobase is not None
+                and rec.protocol_name not in protocols_rheobase
+            )
+        )
+
+    cell.recordings = [rec.summary() for rec in cell.recordings]
+    gc.collect()
+
+    return cell
 
 
 def _read_extract_low_memory(
-    files_metadata, recording_reader, targets, efel_settings=None
+    files_metadata, recording_reader, targets, efel_settings=None,
+    cache_dir=None, trace_cache_dir=None, protocols_rheobase=None,
+    spikecount_method="efel", absolute_amplitude=False,
+    rheobase_strategy="absolute", rheobase_settings=None,
+    in_target_only=False, lazy=False, map_function=map, pipeline=False,
+    memory_budget=DEFAULT_MEMORY_BUDGET
 ):
     """Read recordings and create the matching Cell objects based on a
-    files_metadata. Does not us a map function and delete the recording's
-    data on the go to avoid using too much memory."""
+    files_metadata. Each cell is read, its rheobase computed (unless
+    absolute_amplitude is True) and its efeatures extracted in a single task
+    of the map_function, after which the time series of its recordings are
+    deleted: the tasks only return RecordingSummary. The spikes of the
+    recordings of the protocols_rheobase (all the recordings if None) are
+    detected before their data are deleted.
+
+    If pipeline is True, the cells are instead read by threads of the
+    present process, ahead of their extraction, and extracted by the
+    executor of the map_function (in the present thread if there is none).
+    The reading of the next cells waits when the size of the files of the
+    cells read and not yet extracted would exceed memory_budget."""
 
-    cells = []
-    for cell_name in files_metadata:
+    for target in targets:
+        target.setdefault("location", "soma")
+        target.setdefault("efel_settings", {})
+
+    if map_function is None:
+        map_function = map
+
+    kwargs = {
+        "targets": targets,
+        "efel_settings": efel_settings,
+        "cache_dir": cache_dir,
+        "protocols_rheobase": protocols_rheobase,
+        "spikecount_method": spikecount_method,
+        "absolute_amplitude": absolute_amplitude,
+        "rheobase_strategy": rheobase_strategy,
+        "rheobase_settings": rheobase_settings,
+        "in_target_only": in_target_only,
+    }
 
-        cell = read_recordings(
-            {cell_name: files_metadata[cell_name]},
-            recording_reader=recording_reader,
-            efel_settings=efel_settings
-        )[0]
+    cell_definitions = list(files_metadata.items())
 
-        extract_efeatures_at_targets(
-            [cell], targets, map, efel_settings
-        )
+    if pipeline:
+        executor = getattr(map_function, "executor", None)
+        if executor is None and map_function is not map:
+            raise Exception(
+                "The pipeline needs n_jobs or an executor instead of a "
+                "map_function to extract the cells."
+            )
 
-        # clean traces voltage and time
-        for i in range(len(cell.recordings)):
-            cell.recordings[i].t = None
-            cell.recordings[i].voltage = None
-            cell.recordings[i].current = None
-            cell.recordings[i].reader_data = None
+        cells = pipeline_map(
+            functools.partial(
+                _create_cell,
+                recording_reader=recording_reader,
+                efel_settings=efel_settings,
+                trace_cache_dir=trace_cache_dir,
+                lazy=lazy
+            ),
+            functools.partial(_extract_cell_summary, **kwargs),
+            cell_definitions,
+            [_cell_files_size(c) for c in cell_definitions],
+            executor=executor,
+            memory_budget=memory_budget
+        )
 
-        cells.append(cell)
-        gc.collect()
+    else:
+        cells = list(map_function(
+            functools.partial(
+                _read_extract_cell_summary,
+                recording_reader=recording_reader,
+                trace_cache_dir=trace_cache_dir,
+                lazy=lazy,
+                **kwargs
+            ),
+            cell_definitions
+        ))
+
+    if in_target_only:
+        _log_skipped_recordings(cells, targets, absolute_amplitude)
 
     return cells
 
@@ -730,30 +1303,57 @@ def _extract_with_targets(
     protocol_mode="mean",
     efel_settings=None,
     rheobase_strategy="absolute",
-    rheobase_settings=None
+    rheobase_settings=None,
+    cache_dir=None,
+    trace_cache_dir=None,
+    spikecount_method="efel",
+    in_target_only=False,
+    lazy=False,
+    split_cells=False,
+    pipeline=False,
+    memory_budget=DEFAULT_MEMORY_BUDGET
 ):
-    """Read the recordings and extract the efeatures at the requested
-    targets"""
+    """Read the recordings, compute the rheobase of the cells and extract the
+    efeatures at the requested targets. If in_target_only is True, the
+    recordings that do not match any target are not sent to eFEL."""
 
-    if not low_memory_mode:
-        cells = _read_extract(
+    if not low_memory_mode and not pipeline:
+        cells = read_recordings(
             files_metadata,
-            recording_reader,
-            map_function,
+            recording_reader=recording_reader,
+            map_function=map_function,
+            efel_settings=efel_settings,
+            trace_cache_dir=trace_cache_dir,
+            lazy=lazy,
+            split_cells=split_cells
+        )
+
+        if not absolute_amplitude:
+            compute_rheobase(
+                cells,
+                protocols_rheobase=protocols_rheobase,
+                rheobase_strategy=rheobase_strategy,
+                rheobase_settings=rheobase_settings,
+                spikecount_method=spikecount_method
+            )
+
+        cells = extract_efeatures_at_targets(
+            cells,
             targets,
-            efel_settings
+            map_function=map_function,
+            efel_settings=efel_settings,
+            cache_dir=cache_dir,
+            in_target_only=in_target_only,
+            absolute_amplitude=absolute_amplitude,
+            split_cells=split_cells
         )
     else:
         cells = _read_extract_low_memory(
-            files_metadata, recording_reader, targets, efel_settings
-        )
-
-    if not absolute_amplitude:
-        compute_rheobase(
-            cells,
-            protocols_rheobase=protocols_rheobase,
-            rheobase_strategy=rheobase_strategy,
-            rheobase_settings=rheobase_settings
+            files_metadata, recording_reader, targets, efel_settings,
+            cache_dir, trace_cache_dir, protocols_rheobase,
+            spikecount_method, absolute_amplitude, rheobase_strategy,
+            rheobase_settings, in_target_only, lazy, map_function,
+            pipeline, memory_budget
         )
 
     protocols = group_efeatures(
@@ -777,7 +1377,13 @@ def _extract_auto_targets(
     efel_settings,
     auto_targets=None,
     rheobase_strategy="flush",
-    rheobase_settings=None
+    rheobase_settings=None,
+    cache_dir=None,
+    trace_cache_dir=None,
+    spikecount_method="efel",
+    in_target_only=False,
+    lazy=False,
+    split_cells=False
 ):
     """Read the recordings and extract the efeatures using AutoTargets"""
 
@@ -791,14 +1397,18 @@ def _extract_auto_targets(
         files_metadata,
         recording_reader=recording_reader,
         map_function=map_function,
-        efel_settings=efel_settings
+        efel_settings=efel_settings,
+        trace_cache_dir=trace_cache_dir,
+        lazy=lazy,
+        split_cells=split_cells
     )
 
     compute_rheobase(
         cells,
         protocols_rheobase=protocols_rheobase,
         rheobase_strategy=rheobase_strategy,
-        rheobase_settings=rheobase_settings
+        rheobase_settings=rheobase_settings,
+        spikecount_method=spikecount_method
     )
 
     if not sum(bool(c.rheobase) for c in cells):
@@ -818,7 +1428,13 @@ def _extract_auto_targets(
         targets += at.generate_targets()
 
     cells = extract_efeatures_at_targets(
-        cells, targets, map_function=map_function, efel_settings=efel_settings
+        cells,
+        targets,
+        map_function=map_function,
+        efel_settings=efel_settings,
+        cache_dir=cache_dir,
+        in_target_only=in_target_only,
+        split_cells=split_cells
     )
 
     protocols = group_efeatures(
@@ -888,7 +1504,19 @@ def extract_efeatures(
     rheobase_settings=None,
     auto_targets=None,
     pickle_cells=False,
-    default_std_value=1e-3
+    default_std_value=1e-3,
+    cache_dir=None,
+    trace_cache_dir=None,
+    spikecount_method="efel",
+    lazy=False,
+    split_cells=False,
+    n_jobs=None,
+    executor=None,
+    chunksize=1,
+    backend="processes",
+    pipeline=False,
+    memory_budget=DEFAULT_MEMORY_BUDGET,
+    cache_max_size=DEFAULT_CACHE_MAX_SIZE
 ):
     """
     Extract efeatures.
@@ -948,13 +1576,18 @@ def extract_efeatures(
             inner working has to match the metadata entered in files_metadata.
         map_function (function): Function used to map (parallelize) the
             recording reading and feature extraction operations.
+            The map of a bluepyefe.parallel.SharedTracePool avoids pickling
+            the traces between the processes.
         write_files (bool): if True, the efeatures, protocols and currents
             will be saved in .json files in addition of being returned.
         plot (bool): if True, the recordings and efeatures plots will be
             created.
         low_memory_mode (bool): if True, minimizes the amount of memory used
-            during the data reading and feature extraction steps by performing
-            additional clean up. Not compatible with map_function.
+            during the data reading and feature extraction steps: each cell
+            is read and its efeatures extracted in a single task of the
+            map_function, which only returns summaries of the recordings
+            (see RecordingSummary) without their time series. Not used with
+            auto_targets.
         protocol_mode (str): protocol_mode (mean): if a protocol matches
             several recordings, the mode set the logic of how the output
             will be generating. Must be 'mean', 'median' or 'lnmc'
@@ -982,8 +1615,61 @@ def extract_efeatures(
             computation function.
         auto_targets (list of AutoTarget): targets with more flexible goals.
         pickle_cells (bool): if True, the cells object will be saved as a pickle file.
+            Unless plot or pickle_cells is True, the efeatures are only
+            extracted from the recordings that match a target.
         default_std_value (float): default value used to replace the standard
             deviation if the standard deviation is 0.
+        cache_dir (str or FeatureCache): Optional. Path to a directory in
+            which the efeature values are cached. When re-running the extraction on the same
+            recordings (e.g: after changing the targets), only the efeatures
+            missing from the cache will be computed. The cache is keyed by
+            the content of the traces, the eFEL version and the eFEL settings.
+        trace_cache_dir (str): Optional. Path to a directory in which the data
+            read from the recording files are cached. On reruns, the files
+            that were not modified are not parsed again.
+        spikecount_method (str): how the spikes of the recordings of the
+            protocols_rheobase are counted to compute the rheobase. Can be
+            'efel' (default), 'numpy' (threshold crossings counted with
+            numpy, much faster than eFEL) or 'validate' (both, the
+            recordings for which the counts differ are reported). See
+            compute_rheobase.
+        lazy (bool): if True, the data are loaded in two phases: the voltage
+            of the NWB and .abf recordings is first only read for the
+            protocols_rheobase, then for the recordings matching the targets.
+            See read_recordings.
+        split_cells (bool): if True, the tasks of the map_function are the
+            files (reading) and chunks of recordings (extraction) of the
+            cells instead of whole cells, submitted from the longest to the
+            shortest. Balances the load when the cells have very different
+            numbers of recordings. Not used in low_memory_mode.
+        n_jobs (int): Optional. Number of processes used to read the
+            recordings, extract and plot the efeatures (-1 for the number of
+            CPUs). The processes import eFEL and the readers once when they
+            start. Cannot be used together with map_function.
+        executor (concurrent.futures.Executor): Optional. Executor used
+            instead of map_function. The results of the tasks are consumed
+            as they are completed and the progress is logged, the order of
+            the outputs does not depend on the order of completion.
+        chunksize (int): number of cells (or files and chunks of recordings
+            if split_cells is True) sent together to a worker when using
+            n_jobs or executor.
+        backend (str): "processes" or "threads", type of the workers created
+            for n_jobs. The eFEL calls of different threads cannot run
+            concurrently but give the same results as in serial.
+        pipeline (bool): if True, the files of the next cells are read by
+            threads of the present process while the current cells are
+            extracted by the workers of n_jobs or executor (or by the
+            present thread if there are none), such that the reading
+            overlaps with the extraction. As in low_memory_mode, the
+            recordings of the returned cells are summaries and the plots
+            cannot be made. Not used with auto_targets.
+        memory_budget (int): in pipeline mode, maximum size in bytes of the
+            files of the cells that are read and not yet extracted. The
+            reading of the next cells waits for the extraction to catch up
+            when it would be exceeded.
+        cache_max_size (int): maximum size in bytes of the cache_dir. The
+            least recently used entries are deleted at the end of the
+            extraction when it is exceeded.
     """
 
     if not files_metadata:
@@ -1002,13 +1688,12 @@ def extract_efeatures(
         )
         protocols_rheobase = PRESET_PROTOCOLS_RHEOBASE.copy()
 
-    if low_memory_mode and map_function not in [map, None]:
-        logger.warning(
-            "low_memory_mode is not compatible with the use of map_function"
-        )
     if low_memory_mode and plot:
         raise Exception('plot cannot be used in low_memory_mode mode.')
 
+    if pipeline and plot:
+        raise Exception('plot cannot be used in pipeline mode.')
+
     if targets is not None and isinstance(targets, dict):
         logger.warning(
             "targets seems to be in a legacy format. A conversion will"
@@ -1019,60 +1704,93 @@ def extract_efeatures(
     if targets is not None and auto_targets is not None:
         raise Exception("Cannot specify both targets and auto_targets.")
 
-    if (
-        not absolute_amplitude and
-        (targets is None or auto_targets is not None)
-    ):
-        cells, protocols, targets = _extract_auto_targets(
-            files_metadata,
-            protocols_rheobase,
-            recording_reader,
-            map_function,
-            protocol_mode,
-            efel_settings,
-            auto_targets,
-            rheobase_strategy,
-            rheobase_settings
-        )
-    else:
-        cells, protocols = _extract_with_targets(
-            files_metadata,
-            targets,
-            protocols_rheobase,
-            absolute_amplitude,
-            recording_reader,
-            map_function,
-            low_memory_mode,
-            protocol_mode,
-            efel_settings,
-            rheobase_strategy,
-            rheobase_settings
-        )
-
-    efeatures, protocol_definitions, current = create_feature_protocol_files(
-        cells,
-        protocols,
-        output_directory=output_directory,
-        threshold_nvalue_save=threshold_nvalue_save,
-        write_files=write_files,
-        default_std_value=default_std_value
-    )
-
-    if pickle_cells:
-        path_cells = pathlib.Path(output_directory)
-        path_cells.mkdir(parents=True, exist_ok=True)
-        pickle.dump(cells, open(cells_pickle_output_path(path_cells), 'wb'))
-        pickle.dump(protocols, open(protocols_pickle_output_path(path_cells), 'wb'))
+    # The efeatures of the recordings that do not match any target are only
+    # needed to plot or pickle the cells
+    in_target_only = not plot and not pickle_cells
+
+    # A single FeatureCache is used for the whole run such that its size is
+    # checked as the entries are written
+    cache_dir = get_feature_cache(cache_dir, cache_max_size)
+
+    # An executor created for n_jobs is shut down once the cells are plotted
+    with executor_map_function(
+        map_function, n_jobs, executor, chunksize, backend
+    ) as map_function:
+
+        if (
+            not absolute_amplitude and
+            (targets is None or auto_targets is not None)
+        ):
+            cells, protocols, targets = _extract_auto_targets(
+                files_metadata,
+                protocols_rheobase,
+                recording_reader,
+                map_function,
+                protocol_mode,
+                efel_settings,
+                auto_targets,
+                rheobase_strategy,
+                rheobase_settings,
+                cache_dir=cache_dir,
+                trace_cache_dir=trace_cache_dir,
+                spikecount_method=spikecount_method,
+                in_target_only=in_target_only,
+                lazy=lazy,
+                split_cells=split_cells
+            )
+        else:
+            cells, protocols = _extract_with_targets(
+                files_metadata,
+                targets,
+                protocols_rheobase,
+                absolute_amplitude,
+                recording_reader,
+                map_function,
+                low_memory_mode,
+                protocol_mode,
+                efel_settings,
+                rheobase_strategy,
+                rheobase_settings,
+                cache_dir=cache_dir,
+                trace_cache_dir=trace_cache_dir,
+                spikecount_method=spikecount_method,
+                in_target_only=in_target_only,
+                lazy=lazy,
+                split_cells=split_cells,
+                pipeline=pipeline,
+                memory_budget=memory_budget
+            )
 
-    if plot:
-        plot_all_recordings_efeatures(
+        efeatures, protocol_definitions, current = create_feature_protocol_files(
             cells,
             protocols,
-            output_dir=output_directory,
-            mapper=map_function,
-            efel_settings=efel_settings
+            output_directory=output_directory,
+            threshold_nvalue_save=threshold_nvalue_save,
+            write_files=write_files,
+            default_std_value=default_std_value
         )
 
+        if pickle_cells:
+            # The cells cannot reference the scratch directory of a pool
+            load_shared_series(cells)
+            path_cells = pathlib.Path(output_directory)
+            path_cells.mkdir(parents=True, exist_ok=True)
+            pickle.dump(cells, open(cells_pickle_output_path(path_cells), 'wb'))
+            pickle.dump(protocols, open(protocols_pickle_output_path(path_cells), 'wb'))
+
+        if plot:
+            plot_all_recordings_efeatures(
+                cells,
+                protocols,
+                output_dir=output_directory,
+                # pyplot cannot be used from several threads
+                mapper=map if runs_in_threads(map_function) else map_function,
+                efel_settings=efel_settings
+            )
+
+    if cache_dir is not None:
+        cache_dir.evict()
+
     if extract_per_cell and write_files:
         extract_efeatures_per_cell(
             files_metadata,
@@ -1090,6 +1808,9 @@ def extract_efeatures(
                        "and protocols_rheobase match the data you have "
                        "available.")
 
+    # Lazy recordings will reopen their files if needed
+    file_pool.clear()
+
     return efeatures, protocol_definitions, current
 
 
@@ -1098,6 +1819,11 @@ def plot_recordings(
     output_directory="./figures/",
     recording_reader=None,
     map_function=map,
+    trace_cache_dir=None,
+    n_jobs=None,
+    executor=None,
+    chunksize=1,
+    backend="processes"
 ):
     """
     Plots recordings.
@@ -1128,12 +1854,35 @@ def plot_recordings(
             inner working has to match the metadata entered in files_metadata
         map_function (function): Function used to map (parallelize) the
             recording reading and feature extraction operations.
+        trace_cache_dir (str): Optional. Path to a directory used to cache
+            the data read from the files.
+        n_jobs (int): Optional. Number of processes used to read and plot
+            the recordings (-1 for the number of CPUs), see
+            extract_efeatures.
+        executor (concurrent.futures.Executor): Optional. Executor used
+            instead of map_function.
+        chunksize (int): number of cells sent together to a worker when
+            using n_jobs or executor.
+        backend (str): "processes" or "threads", type of the workers created
+            for n_jobs. The plots are always made in the main thread.
     """
 
-    cells = read_recordings(
-        files_metadata,
-        recording_reader=recording_reader,
-        map_function=map_function,
-    )
+    with executor_map_function(
+        map_function, n_jobs, executor, chunksize, backend
+    ) as map_function:
+
+        cells = read_recordings(
+            files_metadata,
+            recording_reader=recording_reader,
+            map_function=map_function,
+            trace_cache_dir=trace_cache_dir
+        )
+
+        # pyplot cannot be used from several threads
+        plot_all_recordings(
+            cells,
+            output_dir=output_directory,
+            mapper=map if runs_in_threads(map_function) else map_function
+        )
 
-    plot_all_recordings(cells, output_dir=output_directory)
+    file_pool.clear()
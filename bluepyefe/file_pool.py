@@ -0,0 +1,292 @@
+"""Pool of open file handles shared by the recording readers"""
+
+"""
+Copyright (c) 2022, EPFL/Blue Brain Project
+
+ This file is part of BluePyEfe <https://github.com/BlueBrain/BluePyEfe>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import collections
+import contextlib
+import logging
+import os
+import threading
+
+import h5py
+from neo import rawio
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 16
+
+
+def _file_signature(filepath):
+    stat = os.stat(filepath)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _open_axon(path):
+    reader = rawio.AxonRawIO(filename=path)
+    reader.parse_header()
+    return reader
+
+
+class FilePool():
+
+    """Bounded pool of open file handles. When the pool is full, the least
+    recently used handle is closed.
+
+    The handles obtained with FilePool.open are pinned while they are used:
+    they are not closed, even if they are evicted or the pool is cleared,
+    before all the threads that opened them are done with them. The pool can
+    then temporarily hold more than max_size handles.
+
+    Next to the handles, the pool stores information derived from the content
+    of each file (e.g: the layout of an NWB file) such that it does not need
+    to be computed again when the same file is read for another protocol or
+    cell. Handles and information are dropped when the modification time or
+    size of the file changes.
+
+    Handles are not shared across processes: a pool used in a process forked
+    from the one that opened the files starts empty."""
+
+    def __init__(self, max_size=DEFAULT_POOL_SIZE):
+        """
+        Constructor
+
+        Args:
+            max_size (int): maximum number of files open at the same time.
+        """
+
+        self.max_size = max_size
+
+        self._handles = collections.OrderedDict()
+        self._file_info = {}
+        self._lock = threading.RLock()
+        # Number of users of the pinned handles, by id of the handle, and
+        # handles removed from the pool while pinned, closed once released
+        self._users = collections.Counter()
+        self._retired = {}
+        self._pid = os.getpid()
+
+        self.n_opened = 0
+        self.n_reused = 0
+
+    def _check_process(self):
+        # Handles inherited from a parent process must not be used nor closed
+        if os.getpid() != self._pid:
+            self._handles = collections.OrderedDict()
+            self._file_info = {}
+            self._users = collections.Counter()
+            self._retired = {}
+            self._pid = os.getpid()
+
+    def _remove_handle(self, handle):
+        """Close a handle removed from the pool, or retire it if it is still
+        used"""
+
+        if self._users[id(handle)]:
+            self._retired[id(handle)] = handle
+        else:
+            self._close_handle(handle)
+
+    @staticmethod
+    def _close_handle(handle):
+        close = getattr(handle, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception as e:
+            logger.debug(f"Could not close file handle {handle}: {e}")
+
+    def get(self, filepath, kind, opener, **kwargs):
+        """Returns an open handle for a file, opening it if needed. The
+        handle is not pinned, it can be closed when other files are opened
+        (e.g: by another thread). Use FilePool.open to keep it open while
+        using it.
+
+        Args:
+            filepath (str): path to the file.
+            kind (str): type of handle (e.g: "h5py", "axon"). A same file
+                can be open with handles of different kinds.
+            opener (callable): called as opener(filepath, **kwargs) to open
+                the file if no valid handle is in the pool.
+            kwargs: options used to open the file, part of the key of the
+                handle.
+        """
+
+        path = os.path.abspath(filepath)
+        key = (kind, path, tuple(sorted(kwargs.items())))
+
+        with self._lock:
+
+            self._check_process()
+            signature = _file_signature(path)
+
+            if key in self._handles:
+                handle, handle_signature = self._handles[key]
+                if handle_signature == signature and self._is_valid(handle):
+                    self._handles.move_to_end(key)
+                    self.n_reused += 1
+                    return handle
+                self._remove_handle(self._handles.pop(key)[0])
+
+            if self._file_info.get(path, (None, None))[0] != signature:
+                self._file_info[path] = (signature, {})
+
+            handle = opener(path, **kwargs)
+            self.n_opened += 1
+            self._handles[key] = (handle, signature)
+
+            self._evict()
+
+            return handle
+
+    def _evict(self):
+        """Close the least recently used handles that are not pinned until
+        the pool holds at most max_size handles. The most recently used
+        handle is kept, it is the one that is being returned."""
+
+        for key in list(self._handles)[:-1]:
+            if len(self._handles) <= self.max_size:
+                break
+            old_handle = self._handles[key][0]
+            if not self._users[id(old_handle)]:
+                del self._handles[key]
+                self._close_handle(old_handle)
+
+    @contextlib.contextmanager
+    def open(self, filepath, kind, opener, **kwargs):
+        """Same as FilePool.get, but the handle is pinned until the end of
+        the with block: it is not closed by the pool in the meantime.
+
+        Example:
+
+            .. code-block:: python
+
+                with file_pool.open_h5(filepath) as content:
+                    data = content["acquisition"]
+        """
+
+        with self._lock:
+            handle = self.get(filepath, kind, opener, **kwargs)
+            pid = self._pid
+            self._users[id(handle)] += 1
+
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                if pid == os.getpid():
+                    self._users[id(handle)] -= 1
+                    if not self._users[id(handle)]:
+                        del self._users[id(handle)]
+                        retired = self._retired.pop(id(handle), None)
+                        if retired is not None:
+                            self._close_handle(retired)
+                        self._evict()
+
+    @staticmethod
+    def _is_valid(handle):
+        if isinstance(handle, h5py.File):
+            return bool(handle.id.valid)
+        return True
+
+    def get_h5(self, filepath, **kwargs):
+        """Returns an h5py.File open in read mode.
+
+        Args:
+            filepath (str): path to the file.
+            kwargs: keyword arguments of h5py.File (e.g: rdcc_nbytes).
+        """
+
+        return self.get(
+            filepath,
+            "h5py",
+            lambda path, **kw: h5py.File(path, "r", **kw),
+            **kwargs
+        )
+
+    def open_h5(self, filepath, **kwargs):
+        """Same as FilePool.get_h5, to be used as a context manager during
+        which the handle is pinned (see FilePool.open)."""
+
+        return self.open(
+            filepath,
+            "h5py",
+            lambda path, **kw: h5py.File(path, "r", **kw),
+            **kwargs
+        )
+
+    def get_axon(self, filepath):
+        """Returns a neo.rawio.AxonRawIO, with its header parsed, for an .abf
+        file.
+
+        Args:
+            filepath (str): path to the file.
+        """
+
+        return self.get(filepath, "axon", _open_axon)
+
+    def open_axon(self, filepath):
+        """Same as FilePool.get_axon, to be used as a context manager during
+        which the handle is pinned (see FilePool.open)."""
+
+        return self.open(filepath, "axon", _open_axon)
+
+    def file_info(self, filepath):
+        """Dictionary in which information about the content of a file can
+        be stored. It is emptied when the file is modified.
+
+        Args:
+            filepath (str): path to the file.
+        """
+
+        path = os.path.abspath(filepath)
+
+        with self._lock:
+            self._check_process()
+            signature = _file_signature(path)
+            if self._file_info.get(path, (None, None))[0] != signature:
+                self._file_info[path] = (signature, {})
+            return self._file_info[path][1]
+
+    def clear(self):
+        """Close all the handles and forget the information about the
+        files. The pinned handles are closed when they are released."""
+
+        with self._lock:
+            if os.getpid() == self._pid:
+                for handle, _ in self._handles.values():
+                    self._remove_handle(handle)
+            else:
+                self._users = collections.Counter()
+                self._retired = {}
+            self._handles = collections.OrderedDict()
+            self._file_info = {}
+            self._pid = os.getpid()
+
+    def stats(self):
+        """Returns the counters of the pool as a dictionary"""
+
+        return {
+            "opened": self.n_opened,
+            "reused": self.n_reused,
+            "open": len(self._handles),
+        }
+
+
+file_pool = FilePool()
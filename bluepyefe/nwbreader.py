@@ -1,6 +1,9 @@
 import logging
 import numpy
 
+from .file_pool import file_pool
+from .tools import CompactSeries, LazySeries
+
 logger = logging.getLogger(__name__)
 
 PROTOCOL_VU_TO_BBP = {
@@ -11,8 +14,94 @@ PROTOCOL_VU_TO_BBP = {
 }
 
 
+def read_nwb_series(dataset, conversion):
+    """ Read a time series from an NWB dataset and apply its conversion factor.
+
+    The conversion is applied while writing into a preallocated float32
+    array, which avoids the temporary copies made by
+    numpy.array(dataset[()] * conversion, dtype="float32"). Float32 data are
+    read with read_direct into that array and converted in place. Data of
+    other types are read in their native type, as letting HDF5 convert them
+    while reading is slower. The product is computed in the same precision
+    as the expression above, the result is therefore identical.
+
+    Args:
+        dataset (Dataset): time series
+        conversion (float): conversion factor of the time series
+
+    Returns:
+        array: float32 time series
+    """
+
+    if not hasattr(dataset, "read_direct"):
+        return numpy.array(dataset[()] * conversion, dtype="float32")
+
+    series = numpy.empty(dataset.shape, dtype=numpy.float32)
+
+    if dataset.dtype == numpy.float32:
+        if series.size:
+            dataset.read_direct(series)
+        data = series
+    else:
+        data = dataset[()]
+
+    numpy.multiply(
+        data,
+        conversion,
+        out=series,
+        dtype=numpy.result_type(dataset.dtype, conversion),
+        casting="same_kind"
+    )
+
+    return series
+
+
+class LazyNWBSeries(LazySeries):
+
+    """Time series stored in a dataset of an NWB file, read only when needed.
+    The object only contains the path to the file and to the dataset, it can
+    therefore be pickled and sent to other processes."""
+
+    def __init__(
+        self, filepath, dataset_name, conversion, length, file_kwargs=None
+    ):
+        """ Init
+
+        Args:
+            filepath (str): path to the NWB file
+            dataset_name (str): path of the dataset in the NWB file
+            conversion (float): factor by which the data have to be multiplied
+            length (int): number of samples in the series
+            file_kwargs (dict): keyword arguments used to open the file with
+                h5py (e.g: chunk cache settings)
+        """
+
+        self.filepath = filepath
+        self.dataset_name = dataset_name
+        self.conversion = conversion
+        self.length = length
+        self.file_kwargs = file_kwargs or {}
+
+    def __len__(self):
+        return self.length
+
+    def load(self):
+        with file_pool.open_h5(self.filepath, **self.file_kwargs) as content:
+            return read_nwb_series(content[self.dataset_name], self.conversion)
+
+
 class NWBReader:
-    def __init__(self, content, target_protocols, repetition=None, v_file=None):
+    def __init__(
+        self,
+        content,
+        target_protocols,
+        repetition=None,
+        v_file=None,
+        lazy=False,
+        file_kwargs=None,
+        index=None,
+        compact=False
+    ):
         """ Init
 
         Args:
@@ -20,12 +109,24 @@ class NWBReader:
             target_protocols (list of str): list of the protocols to be read and returned
             repetition (list of int): id of the repetition(s) to be read and returned
             v_file (str): name of original file that can be retrieved in sweep's description
+            lazy (bool): if True, the voltage series are not read but returned
+                as LazyNWBSeries to be read only when needed
+            file_kwargs (dict): keyword arguments used by h5py to open the
+                file, passed to the lazy series
+            index (object): index of the sweeps of the file, as returned by
+                build_index. Can be shared by all the readers of a same file.
+            compact (bool): if True, the series stored as integers in the file
+                are returned as CompactSeries holding the raw samples
         """
 
         self.content = content
         self.target_protocols = target_protocols
         self.repetition = repetition
         self.v_file = v_file
+        self.lazy = lazy
+        self.file_kwargs = file_kwargs
+        self.index = index
+        self.compact = compact
 
     def read(self):
         """ Read the content of the NWB file
@@ -33,8 +134,75 @@ class NWBReader:
         Returns:
             data (list of dict): list of traces"""
 
+        return list(self.iter_read())
+
+    def iter_read(self):
+        """ Read the content of the NWB file, one trace at a time, such that
+        only the trace being used needs to be kept in memory
+
+        Yields:
+            trace (dict)"""
+
         raise NotImplementedError()
 
+    def build_index(self):
+        """ Go once through the structure of the file to list the sweeps it
+        contains. The index does not depend on the protocols requested and
+        can be reused to read other protocols from the same file.
+
+        Returns:
+            index (object): index of the sweeps, specific to each layout"""
+
+        raise NotImplementedError()
+
+    def get_index(self):
+        """ Returns the index of the sweeps of the file, building it if
+        needed"""
+
+        if self.index is None:
+            self.index = self.build_index()
+        return self.index
+
+    def _select_records(self, index):
+        """ Returns the records of an index of the form
+        {protocol name in lower case: [(position in file, ...)]} that match
+        the target protocols, in the order of the file"""
+
+        if self.target_protocols:
+            protocols = set(prot.lower() for prot in self.target_protocols)
+        else:
+            protocols = index.keys()
+
+        return sorted(
+            record for protocol in protocols for record in index.get(protocol, [])
+        )
+
+    def _read_series(self, dataset, conversion, lazy=False):
+        """ Read a time series and apply its conversion factor
+
+        Args:
+            dataset (Dataset): time series
+            conversion (float): conversion factor of the time series
+            lazy (bool): if True, returns a LazyNWBSeries instead of an array
+
+        If the reader is compact and the dataset contains integers, a
+        CompactSeries holding the raw samples is returned instead of an array.
+        """
+
+        if lazy:
+            return LazyNWBSeries(
+                dataset.file.filename,
+                dataset.name,
+                conversion,
+                len(dataset),
+                self.file_kwargs
+            )
+
+        if self.compact and dataset.dtype.kind in "iu":
+            return CompactSeries(dataset[()], conversion)
+
+        return read_nwb_series(dataset, conversion)
+
     def _format_nwb_trace(self, voltage, current, start_time, trace_name=None, repetition=None):
         """ Format the data from the NWB file to the format used by BluePyEfe
 
@@ -48,13 +216,11 @@ class NWBReader:
         Returns:
             dict: formatted trace
         """
-        v_array = numpy.array(
-            voltage[()] * voltage.attrs["conversion"], dtype="float32"
+        v_array = self._read_series(
+            voltage, voltage.attrs["conversion"], lazy=self.lazy
         )
 
-        i_array = numpy.array(
-            current[()] * current.attrs["conversion"], dtype="float32"
-        )
+        i_array = self._read_series(current, current.attrs["conversion"])
 
         dt = 1. / float(start_time.attrs["rate"])
 
@@ -79,52 +245,55 @@ class NWBReader:
 
 
 class AIBSNWBReader(NWBReader):
-    def read(self):
-        """ Read the content of the NWB file
+    def build_index(self):
+        """ List the sweeps of the file per protocol
 
         Returns:
-            data (list of dict): list of traces"""
+            index (dict): of the form {protocol name in lower case:
+                [(position in file, sweep name)]}"""
 
-        data = []
+        index = {}
 
-        for sweep in list(self.content["acquisition"]["timeseries"].keys()):
+        sweeps = list(self.content["acquisition"]["timeseries"].keys())
+        for position, sweep in enumerate(sweeps):
             protocol_name = self.content["acquisition"]["timeseries"][sweep]["aibs_stimulus_name"][()]
             if not isinstance(protocol_name, str):
                 protocol_name = protocol_name.decode('UTF-8')
 
-            if (
-                self.target_protocols and
-                protocol_name.lower() not in [prot.lower() for prot in self.target_protocols]
-            ):
-                continue
+            index.setdefault(protocol_name.lower(), []).append((position, sweep))
+
+        return index
+
+    def iter_read(self):
+        """ Read the content of the NWB file, one trace at a time
 
-            data.append(self._format_nwb_trace(
+        Yields:
+            trace (dict)"""
+
+        for _, sweep in self._select_records(self.get_index()):
+            yield self._format_nwb_trace(
                 voltage=self.content["acquisition"]["timeseries"][sweep]["data"],
                 current=self.content["stimulus"]["presentation"][sweep]["data"],
                 start_time=self.content["acquisition"]["timeseries"][sweep]["starting_time"],
                 trace_name=sweep
-            ))
-
-        return data
+            )
 
 
 class ScalaNWBReader(NWBReader):
 
-    def read(self):
-        """ Read and format the content of the NWB file
+    def build_index(self):
+        """ List the sweeps of the file that have a matching stimulus, per
+        protocol
 
         Returns:
-            data (list of dict): list of traces
-        """
+            index (dict): of the form {protocol name in lower case:
+                [(position in file, sweep name, stimulus name)]}"""
 
-        data = []
+        index = {}
 
-        if self.repetition:
-            repetitions_content = self.content['general']['intracellular_ephys']['intracellular_recordings']['repetition']
-            if isinstance(self.repetition, (int, str)):
-                self.repetition = [int(self.repetition)]
+        stimuli = self.content['stimulus']['presentation']
 
-        for sweep in list(self.content['acquisition'].keys()):
+        for position, sweep in enumerate(list(self.content['acquisition'].keys())):
             key_current = sweep.replace('Series', 'StimulusSeries')
             try:
                 protocol_name = self.content["acquisition"][sweep].attrs["stimulus_description"]
@@ -135,34 +304,46 @@ class ScalaNWBReader(NWBReader):
             if ("na" == protocol_name.lower()) or ("step" in protocol_name.lower() and "genericstep" != protocol_name.lower()):
                 protocol_name = "Step"
 
-            if (
-                self.target_protocols and
-                protocol_name.lower() not in [prot.lower() for prot in self.target_protocols]
-            ):
+            if key_current not in stimuli:
                 continue
 
-            if key_current not in self.content['stimulus']['presentation']:
-                continue
+            index.setdefault(protocol_name.lower(), []).append(
+                (position, sweep, key_current)
+            )
+
+        return index
+
+    def iter_read(self):
+        """ Read and format the content of the NWB file, one trace at a time
+
+        Yields:
+            trace (dict)
+        """
+
+        if self.repetition:
+            repetitions_content = self.content['general']['intracellular_ephys']['intracellular_recordings']['repetition']
+            if isinstance(self.repetition, (int, str)):
+                self.repetition = [int(self.repetition)]
+
+        for _, sweep, key_current in self._select_records(self.get_index()):
 
             if self.repetition:
                 sweep_id = int(sweep.split("_")[-1])
                 if (int(repetitions_content[sweep_id]) in self.repetition):
-                    data.append(self._format_nwb_trace(
+                    yield self._format_nwb_trace(
                         voltage=self.content['acquisition'][sweep]['data'],
                         current=self.content['stimulus']['presentation'][key_current]['data'],
                         start_time=self.content['acquisition'][sweep]["starting_time"],
                         trace_name=sweep,
                         repetition=int(repetitions_content[sweep_id])
-                    ))
+                    )
             else:
-                data.append(self._format_nwb_trace(
+                yield self._format_nwb_trace(
                     voltage=self.content['acquisition'][sweep]['data'],
                     current=self.content['stimulus']['presentation'][key_current]['data'],
                     start_time=self.content["acquisition"][sweep]["starting_time"],
                     trace_name=sweep,
-                ))
-
-        return data
+                )
 
 
 class BBPNWBReader(NWBReader):
@@ -188,22 +369,93 @@ class BBPNWBReader(NWBReader):
         else:
             return list(ecode_content.keys())
 
-    def read(self):
-        """ Read and format the content of the NWB file
+    def build_index(self):
+        """ List the eCodes of each cell and the names of the sweeps present in
+        the acquisition and stimulus groups. The traces of an eCode are only
+        listed when the eCode is requested for the first time (see
+        _get_ecode_traces).
 
         Returns:
-            data (list of dict): list of traces
+            index (dict): with keys "ecodes" ({cell_id: [eCode names]}),
+                "acquisition" and "presentation" (sets of sweep names),
+                "traces" ({(cell_id, eCode): {repetition: [(trace name,
+                stimulus name)]}}) and "descriptions" ({trace name:
+                description or None})"""
+
+        data_organization = self.content["data_organization"]
+
+        return {
+            "ecodes": {
+                cell_id: list(data_organization[cell_id].keys())
+                for cell_id in data_organization.keys()
+            },
+            "acquisition": set(self.content["acquisition"].keys()),
+            "presentation": set(self.content["stimulus"]["presentation"].keys()),
+            "traces": {},
+            "descriptions": {}
+        }
+
+    def _get_ecode_traces(self, index, cell_id, ecode):
+        """ Returns the traces of an eCode for a cell, grouped by repetition,
+        in the form {repetition: [(trace name, stimulus name)]}"""
+
+        if (cell_id, ecode) in index["traces"]:
+            return index["traces"][(cell_id, ecode)]
+
+        ecode_content = self.content["data_organization"][cell_id][ecode]
+
+        traces = {}
+        for rep in ecode_content.keys():
+            traces[rep] = []
+            for sweep in ecode_content[rep].keys():
+                for trace_name in list(ecode_content[rep][sweep].keys()):
+                    if "ccs_" in trace_name:
+                        key_current = trace_name.replace("ccs_", "ccss_")
+                    elif "ic_" in trace_name:
+                        key_current = trace_name.replace("ic_", "ics_")
+                    else:
+                        continue
+
+                    if key_current not in index["presentation"]:
+                        logger.debug(f"Ignoring {key_current} not"
+                                     " present in the stimulus presentation")
+                        continue
+
+                    if trace_name not in index["acquisition"]:
+                        logger.debug(f"Ignoring {trace_name} not"
+                                     " present in the acquisition")
+                        continue
+
+                    traces[rep].append((trace_name, key_current))
+
+        index["traces"][(cell_id, ecode)] = traces
+        return traces
+
+    def _get_description(self, index, trace_name):
+        """ Returns the description of a trace, None if it has none"""
+
+        if trace_name not in index["descriptions"]:
+            attrs = self.content["acquisition"][trace_name].attrs
+            index["descriptions"][trace_name] = attrs.get("description", None)
+
+        return index["descriptions"][trace_name]
+
+    def iter_read(self):
+        """ Read and format the content of the NWB file, one trace at a time
+
+        Yields:
+            trace (dict)
         """
 
-        data = []
+        index = self.get_index()
 
         for ecode in self.target_protocols:
-            for cell_id in self.content["data_organization"].keys():
-                if ecode not in self.content["data_organization"][cell_id]:
+            for cell_id, cell_ecodes in index["ecodes"].items():
+                if ecode not in cell_ecodes:
                     new_ecode = next(
                         iter(
                             ec
-                            for ec in self.content["data_organization"][cell_id]
+                            for ec in cell_ecodes
                             if ec.lower() == ecode.lower()
                         ),
                         None
@@ -217,57 +469,38 @@ class BBPNWBReader(NWBReader):
                         logger.debug(f"No eCode {ecode} in nwb.")
                         continue
 
-                ecode_content = self.content["data_organization"][cell_id][ecode]
+                ecode_traces = self._get_ecode_traces(index, cell_id, ecode)
 
                 rep_iter = self._get_repetition_keys_nwb(
-                    ecode_content, request_repetitions=self.repetition
+                    ecode_traces, request_repetitions=self.repetition
                 )
 
                 for rep in rep_iter:
-                    for sweep in ecode_content[rep].keys():
-                        for trace_name in list(ecode_content[rep][sweep].keys()):
-                            if "ccs_" in trace_name:
-                                key_current = trace_name.replace("ccs_", "ccss_")
-                            elif "ic_" in trace_name:
-                                key_current = trace_name.replace("ic_", "ics_")
-                            else:
+                    for trace_name, key_current in ecode_traces[rep]:
+
+                        # if we have v_file, check that trace comes from this original file
+                        if self.v_file is not None:
+                            description = self._get_description(index, trace_name)
+                            if description is None:
+                                logger.warning(
+                                    "Ignoring %s because no description could be found.",
+                                    trace_name
+                                )
                                 continue
-
-                            if key_current not in self.content["stimulus"]["presentation"]:
-                                logger.debug(f"Ignoring {key_current} not"
-                                             " present in the stimulus presentation")
-                                continue
-
-                            if trace_name not in self.content["acquisition"]:
-                                logger.debug(f"Ignoring {trace_name} not"
-                                             " present in the acquisition")
+                            v_file_end = self.v_file.split("/")[-1]
+                            if v_file_end != description.split("/")[-1]:
+                                logger.debug(f"Ignoring {trace_name} not matching v_file")
                                 continue
 
-                            # if we have v_file, check that trace comes from this original file
-                            if self.v_file is not None:
-                                attrs = self.content["acquisition"][trace_name].attrs
-                                if "description" not in attrs:
-                                    logger.warning(
-                                        "Ignoring %s because no description could be found.",
-                                        trace_name
-                                    )
-                                    continue
-                                v_file_end = self.v_file.split("/")[-1]
-                                if v_file_end != attrs.get("description", "").split("/")[-1]:
-                                    logger.debug(f"Ignoring {trace_name} not matching v_file")
-                                    continue
-
-                            data.append(self._format_nwb_trace(
-                                voltage=self.content["acquisition"][trace_name]["data"],
-                                current=self.content["stimulus"]["presentation"][key_current][
-                                    "data"],
-                                start_time=self.content["stimulus"]["presentation"][key_current][
-                                    "starting_time"],
-                                trace_name=trace_name,
-                                repetition=int(rep.replace("repetition ", ""))
-                            ))
-
-        return data
+                        yield self._format_nwb_trace(
+                            voltage=self.content["acquisition"][trace_name]["data"],
+                            current=self.content["stimulus"]["presentation"][key_current][
+                                "data"],
+                            start_time=self.content["stimulus"]["presentation"][key_current][
+                                "starting_time"],
+                            trace_name=trace_name,
+                            repetition=int(rep.replace("repetition ", ""))
+                        )
 
 
 class TRTNWBReader(NWBReader):
@@ -278,12 +511,11 @@ class TRTNWBReader(NWBReader):
     10.48324/dandi.000292/0.220708.1652 (mouse).
     """
 
-    def read(self):
-        """ Read and format the content of the NWB file
-        Returns:
-            data (list of dict): list of traces
+    def iter_read(self):
+        """ Read and format the content of the NWB file, one trace at a time
+        Yields:
+            trace (dict)
         """
-        data = []
 
         # Only return data if target_protocols is None or includes "step" or "genericstep"
         if self.target_protocols:
@@ -293,13 +525,32 @@ class TRTNWBReader(NWBReader):
                     "TRTNWBReader only supports 'step' and 'genericstep' protocols, "
                     f"but requested: {self.target_protocols}. Skipping."
                 )
-                return []
+                return
+
+        for voltage_sweep_name, current_sweep_name in self.get_index():
+            voltage_sweep = self.content["acquisition"][voltage_sweep_name]
+            current_sweep = self.content["stimulus"]["presentation"][current_sweep_name]
+
+            yield self._format_nwb_trace(
+                voltage=voltage_sweep["data"],
+                current=current_sweep["data"],
+                start_time=voltage_sweep["starting_time"],
+                trace_name=voltage_sweep_name
+            )
+
+    def build_index(self):
+        """ Pair the voltage sweeps with their stimulus
+
+        Returns:
+            index (list): list of (voltage sweep name, stimulus name)"""
+
+        index = []
 
         # possible paths in content:
         # /acquisition/index_00
         # or /acquisition/index_000
         # or /acquisition/Index_0_0_0
-        for voltage_sweep_name, voltage_sweep in list(self.content["acquisition"].items()):
+        for voltage_sweep_name in list(self.content["acquisition"].keys()):
             parts = voltage_sweep_name.split("_")
             if len(parts) == 2:
                 # maps 00 -> 01, 01 -> 03, ... or 000 -> 001, etc.
@@ -316,21 +567,13 @@ class TRTNWBReader(NWBReader):
                 elif parts[-1] == "3":
                     parts[-1] = "2"
 
-            current_sweep_name = "_".join(parts)
             # possible paths in content:
             # /stimulus/presentation/index_01
             # or /stimulus/presentation/index_001
             # or /stimulus/presentation/Index_0_0_1
-            current_sweep = self.content["stimulus"]["presentation"][current_sweep_name]
+            index.append((voltage_sweep_name, "_".join(parts)))
 
-            data.append(self._format_nwb_trace(
-                voltage=voltage_sweep["data"],
-                current=current_sweep["data"],
-                start_time=voltage_sweep["starting_time"],
-                trace_name=voltage_sweep_name
-            ))
-
-        return data
+        return index
 
     def _format_nwb_trace(self, voltage, current, start_time, trace_name=None, repetition=None):
         """ Format the data from the NWB file to the format used by BluePyEfe
@@ -366,13 +609,9 @@ class TRTNWBReader(NWBReader):
             i_conversion = 1e-12
             i_unit = "amperes"
 
-        v_array = numpy.array(
-            voltage[()] * v_conversion, dtype="float32"
-        )
+        v_array = self._read_series(voltage, v_conversion, lazy=self.lazy)
 
-        i_array = numpy.array(
-            current[()] * i_conversion, dtype="float32"
-        )
+        i_array = self._read_series(current, i_conversion)
 
         dt = 1. / float(start_time.attrs["rate"])
 
@@ -390,78 +629,103 @@ class TRTNWBReader(NWBReader):
 
 class VUNWBReader(NWBReader):
 
-    def __init__(self, content, target_protocols, in_data, repetition=None):
+    def __init__(self, content, target_protocols, in_data, repetition=None, index=None):
         """ Init
         Args:
             content (h5.File): NWB file
             target_protocols (list of str): list of the protocols to be read and returned
             repetition (list of int): id of the repetition(s) to be read and returned
+            index (dict): index of the sweeps of the file, see build_index
         """
 
         self.content = content
         self.target_protocols = target_protocols
         self.repetition = repetition
         self.in_data = in_data
-
-    def read(self):
-        """ Read and format the content of the NWB file
-        Returns:
-            data (list of dict): list of traces
+        # The sweeps are post-processed after reading, they cannot be lazy
+        # or compact
+        self.lazy = False
+        self.compact = False
+        self.file_kwargs = None
+        self.index = index
+
+    def iter_read(self):
+        """ Read and format the content of the NWB file, one trace at a time
+        Yields:
+            trace (dict)
         """
 
-        data = []
-        for sweep_name, current_sweep in list(self.content["stimulus"]["presentation"].items()):
-
-            stimulus_description = None
-            try:
-                stimulus_description = current_sweep.attrs["stimulus_description"]
-            except KeyError:
-                stimulus_description = current_sweep["stimulus_description"][()][0].decode('UTF-8')
+        voltage_sweeps = self.content["acquisition"]["timeseries"] if "timeseries" in self.content["acquisition"] else self.content["acquisition"]
 
-            if stimulus_description not in PROTOCOL_VU_TO_BBP:
-                continue
-            translated_name = PROTOCOL_VU_TO_BBP[stimulus_description]
+        records = self.get_index().get(self.in_data["protocol_name"], [])
+        for sweep_name, voltage_sweep_name, stimulus_description in records:
 
-            if translated_name != self.in_data["protocol_name"]:
-                continue
+            current_sweep = self.content["stimulus"]["presentation"][sweep_name]
 
-            voltage_sweep_name = sweep_name.replace("DA", "AD")
-
-            voltage_sweeps = self.content["acquisition"]["timeseries"] if "timeseries" in self.content["acquisition"] else self.content["acquisition"]
-
-            if voltage_sweep_name not in voltage_sweeps:
-                continue
-            data.append(self._format_nwb_trace(
+            trace = self._format_nwb_trace(
                 voltage=voltage_sweeps[voltage_sweep_name]["data"],
                 current=current_sweep["data"],
                 start_time=voltage_sweeps[voltage_sweep_name]["starting_time"],
                 trace_name=sweep_name
-            ))
+            )
 
             # Shorten protocols that finish with NaNs
-            first_nan = numpy.argmax(numpy.isnan(data[-1]["current"]))
+            first_nan = numpy.argmax(numpy.isnan(trace["current"]))
             if first_nan:
-                data[-1]["voltage"] = data[-1]["voltage"][:first_nan]
-                data[-1]["current"] = data[-1]["current"][:first_nan]
+                trace["voltage"] = trace["voltage"][:first_nan]
+                trace["current"] = trace["current"][:first_nan]
 
             # Remove the protocols that finish too early
-            if "toff" in self.in_data and self.in_data["toff"] > len(data[-1]["current"]) * data[-1]["dt"] * 1000:
-                data.pop(-1)
-            else:
-                # Offset the current with the holding current
-                holding_current = float(voltage_sweeps[voltage_sweep_name]["bias_current"][()]) * 1e-12  # in pA
-                data[-1]["current"] = numpy.asarray(data[-1]["current"]) + holding_current
+            if "toff" in self.in_data and self.in_data["toff"] > len(trace["current"]) * trace["dt"] * 1000:
+                continue
+
+            # Offset the current with the holding current
+            holding_current = float(voltage_sweeps[voltage_sweep_name]["bias_current"][()]) * 1e-12  # in pA
+            trace["current"] = numpy.asarray(trace["current"]) + holding_current
 
             # For Step, IV and IDRest protocols, replace the first 90 ms with the value at 90 ms
             # if stimulus_description == "CCSteps_DA_0":
             if any(stimulus_description in s for s in ["CCSteps_DA_0", "X1PS_SubThresh_DA_0", "X4PS_SupraThresh_DA_0"]):
-                if int(0.090 / data[-1]["dt"]) < len(data[-1]["current"]):
-                    data[-1]["current"][0:int(0.090 / data[-1]["dt"])] = data[-1]["current"][int(0.090 / data[-1]["dt"])]
-                    data[-1]["voltage"][0:int(0.090 / data[-1]["dt"])] = data[-1]["voltage"][int(0.090 / data[-1]["dt"])]
+                if int(0.090 / trace["dt"]) < len(trace["current"]):
+                    trace["current"][0:int(0.090 / trace["dt"])] = trace["current"][int(0.090 / trace["dt"])]
+                    trace["voltage"][0:int(0.090 / trace["dt"])] = trace["voltage"][int(0.090 / trace["dt"])]
                 else:
                     # Handle the case when the index is out of bounds
-                    # You can choose to raise an exception, set a default value, or handle it in a different way
                     logger.info(f"For {stimulus_description}, unable to replace 0-40 ms value with the one at 40th ms as current/voltage array is too short")
-                    continue
 
-        return data
+            yield trace
+
+    def build_index(self):
+        """ List the sweeps of the file that have a matching voltage sweep,
+        per protocol name (translated to the BBP protocol names)
+
+        Returns:
+            index (dict): of the form {protocol name: [(stimulus name,
+                voltage sweep name, stimulus description)]}"""
+
+        index = {}
+
+        voltage_sweeps = self.content["acquisition"]["timeseries"] if "timeseries" in self.content["acquisition"] else self.content["acquisition"]
+
+        for sweep_name, current_sweep in list(self.content["stimulus"]["presentation"].items()):
+
+            stimulus_description = None
+            try:
+                stimulus_description = current_sweep.attrs["stimulus_description"]
+            except KeyError:
+                stimulus_description = current_sweep["stimulus_description"][()][0].decode('UTF-8')
+
+            if stimulus_description not in PROTOCOL_VU_TO_BBP:
+                continue
+            translated_name = PROTOCOL_VU_TO_BBP[stimulus_description]
+
+            voltage_sweep_name = sweep_name.replace("DA", "AD")
+
+            if voltage_sweep_name not in voltage_sweeps:
+                continue
+
+            index.setdefault(translated_name, []).append(
+                (sweep_name, voltage_sweep_name, stimulus_description)
+            )
+
+        return index
@@ -0,0 +1,507 @@
+"""Process pool exchanging the traces of the recordings through shared
+memory"""
+
+"""
+Copyright (c) 2022, EPFL/Blue Brain Project
+
+ This file is part of BluePyEfe <https://github.com/BlueBrain/BluePyEfe>
+
+ This library is free software; you can redistribute it and/or modify it under
+ the terms of the GNU Lesser General Public License version 3.0 as published
+ by the Free Software Foundation.
+
+ This library is distributed in the hope that it will be useful, but WITHOUT
+ ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+ FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+ details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this library; if not, write to the Free Software Foundation, Inc.,
+ 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+
+import numpy
+
+from .recording import RecordingSummary
+from .tools import LazySeries
+
+logger = logging.getLogger(__name__)
+
+SHARED_MEMORY_DIR = "/dev/shm"
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3
+
+
+class SharedSeries(LazySeries):
+
+    """Standardized time series stored in a .npy file of a scratch directory
+    and memory-mapped when needed. When the scratch directory is in
+    /dev/shm, the file lives in shared memory: all the processes mapping it
+    read the same pages and only the path of the file is pickled."""
+
+    keep_loaded = False
+    standardized = True
+
+    def __init__(self, path, length):
+        """ Init
+
+        Args:
+            path (str): path to the .npy file.
+            length (int): number of samples in the series.
+        """
+
+        self.path = path
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def load(self):
+        return numpy.load(self.path, mmap_mode="r")
+
+
+def _default_scratch_parent():
+    if os.path.isdir(SHARED_MEMORY_DIR) and os.access(SHARED_MEMORY_DIR, os.W_OK):
+        return SHARED_MEMORY_DIR
+    return None
+
+
+def _share_array(array, scratch_dir):
+    path = os.path.join(scratch_dir, f"{uuid.uuid4().hex}.npy")
+    numpy.save(path, numpy.ascontiguousarray(array))
+    return SharedSeries(path, len(array))
+
+
+def share_series(cells, scratch_dir):
+    """Move the voltage and current series held in memory by the recordings
+    of cells to the scratch directory. The recordings then only reference
+    the files, such that the cells are cheap to pickle. The series that can
+    be read again from their original files (lazy series) are released
+    instead.
+
+    Args:
+        cells (list of Cell): cells whose series have to be moved.
+        scratch_dir (str): path to the scratch directory.
+    """
+
+    for cell in cells:
+        for rec in cell.recordings:
+
+            if isinstance(rec, RecordingSummary):
+                continue
+
+            if rec._lazy_voltage is not None:
+                rec.release_voltage()
+            elif rec._voltage is not None:
+                rec.voltage = _share_array(rec._voltage, scratch_dir)
+
+            if rec._lazy_current is None and rec._current is not None:
+                rec.current = _share_array(rec._current, scratch_dir)
+
+    return cells
+
+
+def load_shared_series(cells):
+    """Read back in memory the series of the recordings of cells that are
+    stored in a scratch directory, such that the cells remain usable once
+    the SharedTracePool that created them is closed.
+
+    Args:
+        cells (list of Cell): cells whose series have to be read.
+    """
+
+    for cell in cells:
+        for rec in cell.recordings:
+            if isinstance(rec, RecordingSummary):
+                continue
+            if isinstance(rec._lazy_voltage, SharedSeries):
+                rec.voltage = numpy.array(rec._lazy_voltage.load())
+            if isinstance(rec._lazy_current, SharedSeries):
+                rec.current = numpy.array(rec._lazy_current.load())
+
+    return cells
+
+
+def _call_and_share(item, function, scratch_dir):
+    """Run a task of a SharedTracePool in a worker"""
+
+    result = function(item)
+
+    if hasattr(result, "recordings"):
+        share_series([result], scratch_dir)
+
+    return result
+
+
+class SharedTracePool():
+
+    """Pool of processes whose map can be used as the map_function of
+    read_recordings, extract_efeatures_at_targets or extract_efeatures.
+
+    When a task returns a Cell, the series of its recordings are written by
+    the worker to a scratch directory (in /dev/shm when available) instead
+    of being pickled with the Cell. The Cells sent back to the workers for
+    the extraction of the efeatures therefore only carry the paths to these
+    files. The scratch directory is deleted when the pool is closed, the
+    series still needed after that have to be read back in memory with
+    load_shared_series before.
+
+    Example:
+
+        .. code-block:: python
+
+            with SharedTracePool(n_processes=8) as pool:
+                cells = read_recordings(files_metadata, map_function=pool.map)
+                compute_rheobase(cells, protocols_rheobase=["IDthresh"])
+                cells = extract_efeatures_at_targets(
+                    cells, targets, map_function=pool.map
+                )
+    """
+
+    def __init__(self, n_processes=None, scratch_dir=None):
+        """
+        Constructor
+
+        Args:
+            n_processes (int): number of worker processes. If None, the
+                number of CPUs is used.
+            scratch_dir (str): directory in which the scratch directory of
+                the pool is created. If None, /dev/shm is used when it exists,
+                the default temporary directory otherwise.
+        """
+
+        if scratch_dir is None:
+            scratch_dir = _default_scratch_parent()
+
+        self.scratch_dir = tempfile.mkdtemp(prefix="bluepyefe-", dir=scratch_dir)
+        self._pool = multiprocessing.Pool(processes=n_processes)
+
+        # The scratch directory is also removed if the pool is never closed
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, self.scratch_dir, ignore_errors=True
+        )
+
+    def map(self, function, iterable):
+        """Same as the built-in map, the calls are run in the worker
+        processes. Returns a list.
+
+        Args:
+            function (callable): function to apply, must be picklable.
+            iterable (iterable): arguments of the calls.
+        """
+
+        return self._pool.map(
+            functools.partial(
+                _call_and_share, function=function, scratch_dir=self.scratch_dir
+            ),
+            iterable,
+            chunksize=1
+        )
+
+    def close(self):
+        """Stop the worker processes and delete the scratch directory"""
+
+        self._pool.close()
+        self._pool.join()
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def init_worker():
+    """Initializer of the worker processes of the executors created by
+    BluePyEfe. Imports eFEL and the libraries of the readers once per process
+    instead of in the first task."""
+
+    import efel  # noqa: F401
+    import h5py  # noqa: F401
+    import neo  # noqa: F401
+
+
+def _run_chunk(function, chunk):
+    return [function(item) for item in chunk]
+
+
+class ExecutorMap():
+
+    """Map function running the calls in a concurrent.futures.Executor. The
+    calls are submitted in chunks and their results consumed as they are
+    completed, but returned in the order of the inputs."""
+
+    def __init__(self, executor, chunksize=1, callback=None):
+        """
+        Constructor
+
+        Args:
+            executor (concurrent.futures.Executor): executor running the
+                calls.
+            chunksize (int): number of calls per task submitted to the
+                executor.
+            callback (callable): Optional. Called as callback(n_done, n_tasks)
+                each time a task is completed, e.g. to report the progress.
+        """
+
+        self.executor = executor
+        self.chunksize = max(1, int(chunksize))
+        self.callback = callback
+
+    def iter_completed(self, function, iterable):
+        """Yields the results of the calls as (index of the input, result),
+        in the order in which the tasks are completed.
+
+        Args:
+            function (callable): function to apply.
+            iterable (iterable): arguments of the calls.
+        """
+
+        items = list(iterable)
+        futures = {
+            self.executor.submit(
+                _run_chunk, function, items[start:start + self.chunksize]
+            ): start
+            for start in range(0, len(items), self.chunksize)
+        }
+
+        n_tasks = len(futures)
+        last_reported = 0
+        try:
+            for n_done, future in enumerate(
+                concurrent.futures.as_completed(futures), 1
+            ):
+                start = futures[future]
+                for i, result in enumerate(future.result()):
+                    yield start + i, result
+
+                if self.callback is not None:
+                    self.callback(n_done, n_tasks)
+                if 10 * n_done // n_tasks > last_reported:
+                    last_reported = 10 * n_done // n_tasks
+                    logger.info(f"{n_done}/{n_tasks} tasks completed")
+
+        finally:
+            # If a task failed, the tasks that did not start are not run
+            for future in futures:
+                future.cancel()
+
+    def __call__(self, function, iterable):
+        """Same as the built-in map, returns a list."""
+
+        items = list(iterable)
+        results = [None] * len(items)
+        for i, result in self.iter_completed(function, items):
+            results[i] = result
+        return results
+
+
+def runs_in_threads(map_function):
+    """True if map_function runs the calls in threads of the present
+    process, in which case the functions that are not thread-safe (e.g:
+    matplotlib's pyplot) have to be run with the built-in map"""
+
+    return isinstance(map_function, ExecutorMap) and isinstance(
+        map_function.executor, concurrent.futures.ThreadPoolExecutor
+    )
+
+
+@contextlib.contextmanager
+def executor_map_function(
+    map_function=map, n_jobs=None, executor=None, chunksize=1,
+    backend="processes"
+):
+    """Context manager providing the map function to use given the
+    parallelization arguments of extract_efeatures, read_recordings or
+    plot_recordings. An executor created for n_jobs is shut down on exit.
+
+    Args:
+        map_function (callable): map function given by the user.
+        n_jobs (int): number of workers. If -1, the number of CPUs. If None
+            or 1, map_function is used.
+        executor (concurrent.futures.Executor): executor to use instead of
+            map_function. It is not shut down on exit.
+        chunksize (int): number of calls per task submitted to the executor.
+        backend (str): type of executor created for n_jobs, "processes" or
+            "threads". The eFEL calls of threads are serialized (see
+            tools.efel_lock), the threads only run the reading of the files
+            and the rest of the extraction concurrently.
+    """
+
+    if backend not in ["processes", "threads"]:
+        raise Exception(f"Unknown parallel backend {backend}.")
+
+    parallel = executor is not None or n_jobs not in [None, 1]
+    if parallel and map_function not in [map, None]:
+        raise Exception(
+            "map_function cannot be used together with n_jobs or executor."
+        )
+
+    owned = None
+    if executor is None and parallel:
+        max_workers = None if n_jobs == -1 else n_jobs
+        if backend == "threads":
+            owned = concurrent.futures.ThreadPoolExecutor(max_workers)
+        else:
+            owned = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers, initializer=init_worker
+            )
+        executor = owned
+
+    if executor is None:
+        yield map_function
+        return
+
+    try:
+        yield ExecutorMap(executor, chunksize=chunksize)
+    finally:
+        if owned is not None:
+            owned.shutdown()
+
+
+class MemoryBudget():
+
+    """Number of bytes that the items in flight in a pipeline can hold at the
+    same time"""
+
+    def __init__(self, budget):
+        """
+        Constructor
+
+        Args:
+            budget (int): number of bytes available.
+        """
+
+        self.budget = budget
+        self.used = 0
+        self.cancelled = False
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes):
+        """Wait until nbytes can be used without exceeding the budget. An
+        item larger than the whole budget is admitted when no other item is
+        in flight, such that it cannot block the pipeline. Returns False if
+        the budget was cancelled while waiting."""
+
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.cancelled
+                or self.used == 0
+                or self.used + nbytes <= self.budget
+            )
+            if self.cancelled:
+                return False
+            self.used += nbytes
+            return True
+
+    def release(self, nbytes):
+        with self._condition:
+            self.used -= nbytes
+            self._condition.notify_all()
+
+    def cancel(self):
+        """Unblock the calls waiting for the budget, they return False"""
+
+        with self._condition:
+            self.cancelled = True
+            self._condition.notify_all()
+
+
+def pipeline_map(
+    read_function, process_function, items, costs, executor=None,
+    memory_budget=DEFAULT_MEMORY_BUDGET, n_readers=2
+):
+    """Same as map(lambda x: process_function(read_function(x)), items), but
+    the items are read by reader threads ahead of their processing such that
+    the reading (I/O-bound) of the next items overlaps with the processing
+    (CPU-bound) of the current ones.
+
+    The items are read in order. The reading of an item only starts once its
+    cost fits in the memory budget next to the costs of the items read and
+    not yet processed, the readers wait for the processing to catch up
+    otherwise. Returns a list.
+
+    Args:
+        read_function (callable): called on the items by the reader threads.
+        process_function (callable): called on the outputs of read_function.
+            Must be picklable if executor is a process pool.
+        items (list): arguments of read_function.
+        costs (list of int): estimates of the memory, in bytes, held by the
+            outputs of read_function for each item.
+        executor (concurrent.futures.Executor): Optional. Executor running
+            process_function. If None, it is run in the calling thread.
+        memory_budget (int): maximum sum of the costs of the items in flight.
+        n_readers (int): number of reader threads.
+    """
+
+    items = list(items)
+    budget = MemoryBudget(memory_budget)
+    ready = queue.Queue()
+    indexes = iter(range(len(items)))
+    lock = threading.Lock()
+
+    def read():
+        while True:
+            # Holding the lock while waiting for the budget keeps the items
+            # admitted in order
+            with lock:
+                i = next(indexes, None)
+                if i is None or not budget.acquire(costs[i]):
+                    return
+            try:
+                ready.put((i, read_function(items[i]), None))
+            except Exception as e:
+                ready.put((i, None, e))
+
+    if executor is not None:
+        # The workers of a process pool are forked before the reader threads
+        # start, a process forked while a thread holds a lock can deadlock
+        executor.submit(int).result()
+
+    results = [None] * len(items)
+    futures = {}
+    readers = concurrent.futures.ThreadPoolExecutor(
+        n_readers, thread_name_prefix="bluepyefe-reader"
+    )
+    try:
+        for _ in range(n_readers):
+            readers.submit(read)
+
+        for _ in range(len(items)):
+            i, data, error = ready.get()
+            if error is not None:
+                raise error
+
+            if executor is None:
+                results[i] = process_function(data)
+                budget.release(costs[i])
+            else:
+                future = executor.submit(process_function, data)
+                future.add_done_callback(
+                    lambda _, nbytes=costs[i]: budget.release(nbytes)
+                )
+                futures[future] = i
+            del data
+
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.result()
+
+    finally:
+        budget.cancel()
+        for future in futures:
+            future.cancel()
+        readers.shutdown()
+
+    return results
@@ -18,15 +18,16 @@ Copyright (c) 2022, EPFL/Blue Brain Project
  along with this library; if not, write to the Free Software Foundation, Inc.,
  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
+import io
 import logging
-import h5py
 import numpy
 import scipy.io
-from neo import io
 import os
 
 from . import igorpy
+from .file_pool import file_pool
 from .nwbreader import BBPNWBReader, ScalaNWBReader, AIBSNWBReader, TRTNWBReader, VUNWBReader
+from .tools import CompactSeries, LazySeries
 
 logger = logging.getLogger(__name__)
 
@@ -45,9 +46,84 @@ def _check_metadata(metadata, reader_name, required_entries=[]):
             )
 
 
+def _read_axon_channel(reader, seg_index, channel_index, compact=False):
+    """Returns a channel of a segment of an .abf file as a float32 array.
+
+    The raw samples are read from neo's memmap of the file and scaled by the
+    gain and offset of the channel directly in the output array.
+
+    Args:
+        reader (neo.rawio.AxonRawIO): reader of the file, header parsed.
+        seg_index (int): index of the segment (sweep).
+        channel_index (int): index of the channel.
+        compact (bool): if True, returns a CompactSeries holding a copy of
+            the raw samples instead of the float32 array.
+    """
+
+    raw = reader.get_analogsignal_chunk(
+        block_index=0,
+        seg_index=seg_index,
+        stream_index=0,
+        channel_indexes=[channel_index],
+        prefer_slice=True
+    )[:, 0]
+
+    channel = reader.header["signal_channels"][channel_index]
+
+    if compact:
+        return CompactSeries(
+            numpy.array(raw), channel["gain"], channel["offset"]
+        )
+
+    series = numpy.empty(raw.shape[0], dtype=numpy.float32)
+    series[:] = raw
+
+    # Same operations, in the same order, as neo's rescaling
+    if channel["gain"] != 1.0:
+        series *= channel["gain"]
+    if channel["offset"] != 0.0:
+        series += channel["offset"]
+
+    return series
+
+
+class LazyAxonSeries(LazySeries):
+
+    """Channel of a segment of an .abf file, read only when needed. The
+    object only contains the path to the file and the indexes of the segment
+    and channel, it can therefore be pickled and sent to other processes."""
+
+    def __init__(self, filepath, seg_index, channel_index, length):
+        """ Init
+
+        Args:
+            filepath (str): path to the .abf file
+            seg_index (int): index of the segment (sweep).
+            channel_index (int): index of the channel.
+            length (int): number of samples in the series
+        """
+
+        self.filepath = filepath
+        self.seg_index = seg_index
+        self.channel_index = channel_index
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def load(self):
+        with file_pool.open_axon(self.filepath) as reader:
+            return _read_axon_channel(
+                reader, self.seg_index, self.channel_index
+            )
+
+
 def axon_reader(in_data):
     """Reader to read .abf
 
+    The first channel of the file is expected to be the voltage and the second
+    one the current. Only these two channels are read, one segment at a time.
+
     Args:
         in_data (dict): of the format
 
@@ -57,37 +133,53 @@ def axon_reader(in_data):
                     "filepath": "./XXX.abf",
                     "i_unit": "pA",
                     "t_unit": "s",
-                    "v_unit": "mV"
+                    "v_unit": "mV",
+                    "lazy": False, # Optional
+                    "compact": False # Optional
                 }
+
+            If lazy is True, the voltage series are returned as
+            LazyAxonSeries and only read when needed. If compact is True, the
+            current series, and the voltage series if they are not lazy, are
+            returned as CompactSeries holding the int16 samples of the file.
     """
 
-    fp = in_data["filepath"]
-    r = io.AxonIO(filename=fp)
-    bl = r.read_block(lazy=False)
+    return list(iter_axon_reader(in_data))
 
-    data = []
-    for trace in bl.segments:
 
-        dt = 1.0 / int(trace.analogsignals[0].sampling_rate)
-        np_trace = numpy.asarray(trace.analogsignals)
+def iter_axon_reader(in_data):
+    """Same as axon_reader, but yields the traces one at a time"""
 
-        if np_trace.shape[0] == 2:
-            v = np_trace[0, :]
-            c = np_trace[1, :]
-        elif np_trace.shape[-1] == 2:
-            v = np_trace[:, :, 0]
-            c = np_trace[:, :, 1]
-        else:
+    fp = in_data["filepath"]
+    # The file is kept open while the traces are read
+    with file_pool.open_axon(fp) as r:
+
+        if r.signal_channels_count(stream_index=0) != 2:
             raise Exception(f"Unknown .abf format for file {fp}. Maybe "
                             "it does not have current data?")
 
-        data.append({
-            "voltage": numpy.asarray(v).flatten(),
-            "current": numpy.asarray(c).flatten(),
-            "dt": dt
-        })
+        dt = 1.0 / int(r.get_signal_sampling_rate(stream_index=0))
+        lazy = in_data.get("lazy", False)
+        compact = in_data.get("compact", False)
+
+        for seg_index in range(r.segment_count(block_index=0)):
+            if lazy:
+                voltage = LazyAxonSeries(
+                    fp,
+                    seg_index,
+                    0,
+                    r.get_signal_size(
+                        block_index=0, seg_index=seg_index, stream_index=0
+                    )
+                )
+            else:
+                voltage = _read_axon_channel(r, seg_index, 0, compact)
 
-    return data
+            yield {
+                "voltage": voltage,
+                "current": _read_axon_channel(r, seg_index, 1, compact),
+                "dt": dt
+            }
 
 
 def igor_reader(in_data):
@@ -107,6 +199,12 @@ def igor_reader(in_data):
                 }
     """
 
+    return list(iter_igor_reader(in_data))
+
+
+def iter_igor_reader(in_data):
+    """Same as igor_reader, but yields the traces one at a time"""
+
     _check_metadata(
         in_data, igor_reader.__name__, ["v_file", "i_file", "t_unit"]
     )
@@ -133,7 +231,7 @@ def igor_reader(in_data):
     trace_data["current"] = numpy.asarray(current)
     trace_data["i_unit"] = str(notes_i.dUnits).replace(" ", "")
 
-    return [trace_data]
+    yield trace_data
 
 
 def read_matlab(in_data):
@@ -154,6 +252,12 @@ def read_matlab(in_data):
                 }
     """
 
+    return list(iter_read_matlab(in_data))
+
+
+def iter_read_matlab(in_data):
+    """Same as read_matlab, but yields the traces one at a time"""
+
     _check_metadata(
         in_data,
         read_matlab.__name__,
@@ -162,21 +266,16 @@ def read_matlab(in_data):
 
     r = scipy.io.loadmat(in_data["filepath"])
 
-    data = []
     for k, v in r.items():
 
         if "Trace" in k and k[-1] == "1":
 
-            trace_data = {
+            yield {
                 "current": v[:, 1],
                 "voltage": r[k[:-1] + "2"][:, 1],
                 "dt": v[1, 0],
             }
 
-            data.append(trace_data)
-
-    return data
-
 
 def nwb_reader(in_data):
     """Reader for .nwb
@@ -189,10 +288,29 @@ def nwb_reader(in_data):
                 {
                     'filepath': './XXX.nwb',
                     "protocol_name": "IV",
-                    "repetition": 1 (or [1, 3, ...]) # Optional
+                    "repetition": 1 (or [1, 3, ...]), # Optional
+                    "lazy": False, # Optional
+                    "compact": False, # Optional
+                    "rdcc_nbytes": 1024**2, # Optional
+                    "rdcc_nslots": 521 # Optional
                 }
+
+            If lazy is True, the voltage series are returned as
+            LazyNWBSeries and only read when needed (not available for the
+            VU data format). If compact is True, the series stored as integers
+            in the file are returned as CompactSeries holding the raw samples
+            (not available for the VU data format). rdcc_nbytes and rdcc_nslots are the size in
+            bytes and the number of slots of the HDF5 chunk cache (see
+            h5py.File), larger values can speed up the reading of chunked
+            and compressed files.
     """
 
+    return list(iter_nwb_reader(in_data))
+
+
+def iter_nwb_reader(in_data):
+    """Same as nwb_reader, but yields the traces one at a time"""
+
     _check_metadata(
         in_data,
         nwb_reader.__name__,
@@ -203,52 +321,218 @@ def nwb_reader(in_data):
     if isinstance(target_protocols, str):
         target_protocols = [target_protocols]
 
-    with h5py.File(in_data["filepath"], "r") as content:
-        if "data_organization" in content:
-            # For data from BBP / LNMC lab from EPFL
+    lazy = in_data.get("lazy", False)
+    compact = in_data.get("compact", False)
+    file_kwargs = {
+        k: in_data[k] for k in ["rdcc_nbytes", "rdcc_nslots"] if k in in_data
+    }
+
+    # The file is kept open while the traces are read
+    with file_pool.open_h5(in_data["filepath"], **file_kwargs) as content:
+
+        file_info = file_pool.file_info(in_data["filepath"])
+        if "nwb_layout" not in file_info:
+            file_info["nwb_layout"] = _detect_nwb_layout(content)
+        layout = file_info["nwb_layout"]
+
+        # The VU reader requires a protocol name
+        if layout == "VU" and not in_data.get("protocol_name"):
+            layout = _detect_nwb_layout(content, allow_vu=False)
+
+        # The index of the sweeps is built by the first reader and then shared by
+        # all the readers of the file
+        indexes = file_info.setdefault("nwb_index", {})
+        index = indexes.get(layout, None)
+
+        if layout == "BBP":
             reader = BBPNWBReader(
                 content=content,
                 target_protocols=target_protocols,
                 v_file=in_data.get("v_file", None),
                 repetition=in_data.get("repetition", None),
+                lazy=lazy,
+                file_kwargs=file_kwargs,
+                index=index,
+                compact=compact
             )
 
-        elif in_data.get("protocol_name") and any(
-            (name.endswith("DA") or "DA" in name) and
-            (
-                name.replace("DA", "AD")
-                in (content["acquisition"].get("timeseries", content["acquisition"]))
-            )
-            for name in content.get("stimulus", {}).get("presentation", {}).keys()
-        ):
-            # For VU data (DA/AD paired sweeps); requires protocol_name
+        elif layout == "VU":
             reader = VUNWBReader(
                 content=content,
                 target_protocols=target_protocols,
                 in_data=in_data,
                 repetition=in_data.get("repetition", None),
+                index=index
             )
 
-        elif "timeseries" in content["acquisition"].keys():
-            # For data from the Allen Institute
-            reader = AIBSNWBReader(content, target_protocols)
+        elif layout == "AIBS":
+            reader = AIBSNWBReader(
+                content,
+                target_protocols,
+                lazy=lazy,
+                file_kwargs=file_kwargs,
+                index=index,
+                compact=compact
+            )
 
-        elif next(iter(content["acquisition"]))[:6].lower() == "index_":
-            # For data from Derek Howard
-            # (An in vitro whole-cell electrophysiology dataset of human cortical neurons)
-            reader = TRTNWBReader(content, target_protocols, repetition=None)
+        elif layout == "TRT":
+            reader = TRTNWBReader(
+                content,
+                target_protocols,
+                repetition=None,
+                lazy=lazy,
+                file_kwargs=file_kwargs,
+                index=index,
+                compact=compact
+            )
 
         else:
-            # For other data, such as data used in
-            # 'Phenotypic variation of transcriptomic cell types in mouse motor cortex'
-            # by Frederico Scala et al.
             reader = ScalaNWBReader(
-                content, target_protocols, repetition=in_data.get("repetition", None)
+                content,
+                target_protocols,
+                repetition=in_data.get("repetition", None),
+                lazy=lazy,
+                file_kwargs=file_kwargs,
+                index=index,
+                compact=compact
             )
 
-        data = reader.read()
+        indexes[layout] = reader.get_index()
 
-    return data
+        yield from reader.iter_read()
+
+
+def _detect_nwb_layout(content, allow_vu=True):
+    """Returns the name of the layout of an NWB file, which defines the
+    reader to use.
+
+    Args:
+        content (h5py.File): NWB file
+        allow_vu (bool): if False, the VU layout is not considered
+    """
+
+    if "data_organization" in content:
+        # For data from BBP / LNMC lab from EPFL
+        return "BBP"
+
+    acquisition = content["acquisition"]
+    voltage_sweeps = acquisition.get("timeseries", acquisition)
+    if allow_vu and any(
+        (name.endswith("DA") or "DA" in name) and
+        (name.replace("DA", "AD") in voltage_sweeps)
+        for name in content.get("stimulus", {}).get("presentation", {}).keys()
+    ):
+        # For VU data (DA/AD paired sweeps)
+        return "VU"
+
+    if "timeseries" in acquisition.keys():
+        # For data from the Allen Institute
+        return "AIBS"
+
+    if next(iter(acquisition))[:6].lower() == "index_":
+        # For data from Derek Howard
+        # (An in vitro whole-cell electrophysiology dataset of human cortical neurons)
+        return "TRT"
+
+    # For other data, such as data used in
+    # 'Phenotypic variation of transcriptomic cell types in mouse motor cortex'
+    # by Frederico Scala et al.
+    return "Scala"
+
+
+def _fill_lccr_placeholders(content):
+    """Replaces the fields of the content of a LCCR file containing "-" or
+    nothing by 0. The "-" fields are replaced in place, using numpy, as they
+    are the most common placeholder.
+
+    Args:
+        content (bytes): content of the file.
+    """
+
+    if b"\r" in content:
+        content = content.replace(b"\r\n", b"\n")
+    content = bytearray(b"\n" + content.rstrip(b"\n") + b"\n")
+
+    chars = numpy.frombuffer(content, dtype=numpy.uint8)
+    is_delimiter = (chars == ord("\t")) | (chars == ord("\n"))
+    dashes = numpy.flatnonzero(chars[1:-1] == ord("-")) + 1
+    dashes = dashes[is_delimiter[dashes - 1] & is_delimiter[dashes + 1]]
+    chars[dashes] = ord("0")
+
+    for empty, filled in [
+        (b"\t\t", b"\t0\t"),
+        (b"\t\t", b"\t0\t"),
+        (b"\n\t", b"\n0\t"),
+        (b"\t\n", b"\t0\n"),
+    ]:
+        if empty in content:
+            content = content.replace(empty, filled)
+
+    return content[1:].decode()
+
+
+def _read_lccr_columns_csv(filepath, n_columns):
+    """Reads the columns of a LCCR file cell by cell. Used when the file
+    cannot be parsed by numpy (e.g: rows of different lengths)."""
+
+    import csv
+    with open(filepath, 'rt') as f:
+        reader = csv.reader(f, delimiter='\t')
+        columns = list(zip(*reader))
+
+    if not columns:
+        return numpy.empty((0, 0), dtype=numpy.float64)
+
+    return numpy.array([
+        [
+            float(string) if string not in ["-", ""] else 0
+            for string in column
+        ]
+        for column in columns[:n_columns]
+    ], dtype=numpy.float64)
+
+
+def _read_lccr_columns(filepath, n_columns):
+    """Reads the first n_columns columns of a tab-separated LCCR file.
+
+    The file is parsed by numpy's C text parser. Fields containing "-" or
+    nothing are read as 0, as in the original format.
+
+    Args:
+        filepath (str): path to the file.
+        n_columns (int): number of columns to read.
+
+    Returns:
+        voltages (numpy.ndarray): C-contiguous float64 array of shape
+            (number of columns, number of rows).
+    """
+
+    with open(filepath, 'rt') as f:
+        first_line = f.readline()
+    n_columns = min(n_columns, len(first_line.rstrip("\r\n").split("\t")))
+
+    if not first_line or not n_columns:
+        return numpy.empty((0, 0), dtype=numpy.float64)
+
+    loadtxt_kwargs = dict(
+        delimiter="\t",
+        usecols=range(n_columns),
+        comments=None,
+        dtype=numpy.float64,
+        ndmin=2
+    )
+
+    try:
+        values = numpy.loadtxt(filepath, **loadtxt_kwargs)
+    except ValueError:
+        with open(filepath, 'rb') as f:
+            content = _fill_lccr_placeholders(f.read())
+        try:
+            values = numpy.loadtxt(io.StringIO(content), **loadtxt_kwargs)
+        except ValueError:
+            return _read_lccr_columns_csv(filepath, n_columns)
+
+    return numpy.ascontiguousarray(values.T)
 
 
 def csv_lccr_reader(in_data):
@@ -273,14 +557,18 @@ def csv_lccr_reader(in_data):
                     'i_unit': 'pA' # current unit for 'amplitudes' and 'hypamp'
                 }
     """
+    return list(iter_csv_lccr_reader(in_data))
+
+
+def iter_csv_lccr_reader(in_data):
+    """Same as csv_lccr_reader, but yields the traces one at a time"""
+
     _check_metadata(
         in_data,
         csv_lccr_reader.__name__,
         ["filepath", "dt", "amplitudes", "v_unit", "t_unit", "i_unit", "ton", "toff", "hypamp"],
     )
 
-    data = []
-
     fln = os.path.join(in_data['filepath'])
     if not os.path.isfile(fln):
         raise FileNotFoundError(
@@ -294,20 +582,8 @@ def csv_lccr_reader(in_data):
     amplitudes = in_data['amplitudes']
     hypamp = in_data['hypamp']
 
-    import csv
-    with open(fln, 'rt') as f:
-        reader = csv.reader(f, delimiter='\t')
-        columns = list(zip(*reader))
-        length = numpy.shape(columns)[1]
-
-        voltages = numpy.array([
-            [
-                float(string) if string not in ["-", ""] else 0
-                for string in column
-            ]
-            for column in columns
-        ])
-        t = numpy.arange(length) * dt
+    voltages = _read_lccr_columns(fln, len(amplitudes))
+    t = numpy.arange(voltages.shape[1]) * dt
 
     # Remove last 100 ms if needed
     if in_data.get('remove_last_100ms', False):
@@ -320,7 +596,7 @@ def csv_lccr_reader(in_data):
         ion, ioff = int(ton / dt), int(toff / dt)
         current[:] = hypamp
         current[ion:ioff] = amplitude + hypamp
-        trace_data = {
+        yield {
             "filename": os.path.basename(in_data['filepath']),
             "current": current,
             "voltage": voltage,
@@ -335,7 +611,3 @@ def csv_lccr_reader(in_data):
             "v_unit": in_data['v_unit'],
             "t_unit": in_data['t_unit'],
         }
-
-        data.append(trace_data)
-
-    return data
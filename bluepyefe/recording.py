@@ -27,10 +27,33 @@ import efel
 import matplotlib.pyplot as plt
 from pathlib import Path
 
-from .tools import to_ms, to_mV, to_nA, set_efel_settings
+from .cache import get_feature_cache, hash_arrays
+from .tools import to_mV, to_nA, set_efel_settings, efel_settings_key
+from .tools import efel_lock
+from .tools import LazySeries, TimeAxis, _is_writeable_float
 
 logger = logging.getLogger(__name__)
 
+# Entries of the reader data holding time series. They are not kept in
+# Recording.reader_data once the recording is standardized.
+READER_SERIES = ("t", "voltage", "current")
+
+
+def reader_metadata(reader_data):
+    """Returns a copy of the data returned by a reader without its time
+    series, such that only the metadata (units, dt, id, repetition, timings
+    and amplitudes) are kept.
+
+    Args:
+        reader_data (dict): data returned by the recording reader.
+    """
+
+    return {
+        k: v for k, v in reader_data.items()
+        if k not in READER_SERIES and k != "owns_buffers"
+        and not (isinstance(v, numpy.ndarray) and v.ndim)
+    }
+
 
 class Recording(ABC):
 
@@ -44,13 +67,15 @@ class Recording(ABC):
             config_data (dict): metadata for the recording considered informed
                 by the user.
             reader_data (dict): metadata for the recording considered returned
-                by the recording reader.
+                by the recording reader. If it contains "owns_buffers": True,
+                its time series are not used elsewhere and their units are
+                converted in place.
             protocol_name (str): name of the protocol of the present
                 recording.
         """
 
         self.config_data = config_data
-        self.reader_data = reader_data
+        self.reader_data = reader_metadata(reader_data)
         self.protocol_name = protocol_name
 
         if "filepath" in config_data:
@@ -65,12 +90,24 @@ class Recording(ABC):
         self.location = None
         self.efeatures = {}
 
-        self.t = None
-        self.current = None
-        self.voltage = None
+        self._t = None
+        self._time_axis = None
+        self._current = None
+        self._lazy_current = None
+        self._voltage = None
+        self._lazy_voltage = None
         self.amp = None
         self.hypamp = None
 
+        # Spike detection deferred until its results are needed, see
+        # defer_spike_detection
+        self._threshold_pending = False
+        self._spikes_pending = False
+        self._detection_settings = None
+        # Number of spikes counted without the spike times, see
+        # rheobase.count_recordings_spikes
+        self._spikecount = None
+
         self.repetition = None
 
         if len(reader_data):
@@ -82,6 +119,33 @@ class Recording(ABC):
         self.auto_threshold = None
         self.peak_time = None
 
+        # Values already returned by eFEL for this recording, in the form
+        # {(efeature, context): values}, see efel_memo_context
+        self.efel_memo = {}
+        self._trace_hash = None
+
+    def __setstate__(self, state):
+        # Recordings pickled before voltage became a property
+        if "voltage" in state:
+            state["_voltage"] = state.pop("voltage")
+        if "t" in state:
+            state["_t"] = state.pop("t")
+        if "current" in state:
+            state["_current"] = state.pop("current")
+        state.setdefault("_time_axis", None)
+        state.setdefault("_lazy_current", None)
+        for name in ["auto_threshold", "peak_time"]:
+            if name in state:
+                state["_" + name] = state.pop(name)
+        state.setdefault("_threshold_pending", False)
+        state.setdefault("_spikes_pending", False)
+        state.setdefault("_detection_settings", None)
+        state.setdefault("_spikecount", None)
+        state.setdefault("_lazy_voltage", None)
+        state.setdefault("efel_memo", {})
+        state.setdefault("_trace_hash", None)
+        self.__dict__.update(state)
+
     @property
     def name(self):
         """Proxy that can be used to name the recording."""
@@ -93,6 +157,34 @@ class Recording(ABC):
             return str(Path(self.config_data["v_file"]).stem)
         return ""
 
+    @property
+    def t(self):
+        """Time series in ms. Unless it was set explicitly, it is computed
+        from the sampling rate each time it is accessed."""
+
+        if self._t is None and self._time_axis is not None:
+            return self._time_axis.array()
+        return self._t
+
+    @t.setter
+    def t(self, value):
+        if isinstance(value, TimeAxis):
+            self._t = None
+            self._time_axis = value
+        else:
+            self._t = value
+            self._time_axis = None
+
+    @property
+    def time_axis(self):
+        """Time axis in ms that can be indexed by sample without creating the
+        full time series (a TimeAxis, or the time series if it was set
+        explicitly)."""
+
+        if self._time_axis is not None:
+            return self._time_axis
+        return self._t
+
     @property
     def time(self):
         """Alias of the time attribute"""
@@ -103,8 +195,172 @@ class Recording(ABC):
         """Setter for an alias of the time attribute"""
         self.t = value
 
+    @property
+    def current(self):
+        """Current series in nA. If the reader returned a lazy series (e.g: a
+        CompactSeries), it is standardized each time it is accessed."""
+
+        if self._current is None and self._lazy_current is not None:
+            current = self._lazy_current.load()
+            if not self._lazy_current.standardized:
+                current = self.standardize_current(
+                    current, self.config_data, self.reader_data, in_place=True
+                )
+            if not self._lazy_current.keep_loaded:
+                return current
+            self._current = current
+        return self._current
+
+    @current.setter
+    def current(self, value):
+        if isinstance(value, LazySeries):
+            self._current = None
+            self._lazy_current = value
+        else:
+            self._current = value
+            self._lazy_current = None
+
+    @property
+    def voltage(self):
+        """Voltage series in mV. If the reader returned a lazy series, it is
+        read and standardized on first access. The series of type
+        CompactSeries are standardized again at each access instead."""
+
+        if self._voltage is None and self._lazy_voltage is not None:
+            voltage = self._lazy_voltage.load()
+            if not self._lazy_voltage.standardized:
+                voltage = self.standardize_voltage(
+                    voltage, self.config_data, self.reader_data, in_place=True
+                )
+            if not self._lazy_voltage.keep_loaded:
+                return voltage
+            self._voltage = voltage
+        return self._voltage
+
+    @voltage.setter
+    def voltage(self, value):
+        if isinstance(value, LazySeries):
+            self._voltage = None
+            self._lazy_voltage = value
+        else:
+            self._voltage = value
+            self._lazy_voltage = None
+
+    @property
+    def is_lazy(self):
+        """True if the voltage series can be read again from its file or
+        from its raw samples"""
+        return self._lazy_voltage is not None
+
+    def release_voltage(self):
+        """Free the memory used by the voltage series if it can be read
+        again from its file when needed."""
+
+        if self._lazy_voltage is not None:
+            self._voltage = None
+
+    def summary(self):
+        """Returns a RecordingSummary of the recording, without its time
+        series"""
+        return RecordingSummary(self)
+
+    @property
+    def auto_threshold(self):
+        """Spike detection threshold computed from the voltage, see
+        set_autothreshold. Computed on first access if it was deferred."""
+
+        self.detect_spikes(threshold_only=True)
+        return self._auto_threshold
+
+    @auto_threshold.setter
+    def auto_threshold(self, value):
+        self._auto_threshold = value
+        self._threshold_pending = False
+
+    @property
+    def peak_time(self):
+        """Times of the spikes, see compute_spikecount. Computed on first
+        access if the spike detection was deferred."""
+
+        if self._spikes_pending:
+            self.detect_spikes()
+        return self._peak_time
+
+    @peak_time.setter
+    def peak_time(self, value):
+        self._peak_time = value
+        self._spikes_pending = False
+
+    def defer_spike_detection(self, efel_settings=None):
+        """Schedule the computation of the automatic threshold and of the
+        spikes of the recording. They are computed the first time
+        auto_threshold, peak_time or spikecount is accessed, such that the
+        recordings that are not used for the rheobase, targeted or plotted
+        are never sent to eFEL.
+
+        Args:
+            efel_settings (dict): eFEL settings used for the spike detection,
+                see compute_spikecount.
+        """
+
+        if self._voltage is None and self._lazy_voltage is None:
+            return
+
+        self._detection_settings = dict(efel_settings) if efel_settings else None
+        self._threshold_pending = True
+        self._spikes_pending = True
+
+    def detect_spikes(self, threshold_only=False):
+        """Run the spike detection deferred by defer_spike_detection, if it
+        did not run yet. Has to be called before the voltage of the recording
+        is deleted.
+
+        Args:
+            threshold_only (bool): if True, only the automatic threshold is
+                computed.
+        """
+
+        run_threshold = self._threshold_pending
+        run_spikes = self._spikes_pending and not threshold_only
+        if not run_threshold and not run_spikes:
+            return
+
+        if self._voltage is None and self._lazy_voltage is None:
+            self._threshold_pending = False
+            self._spikes_pending = False
+            return
+
+        # A lazy voltage loaded only for the detection is released after
+        loaded = self._voltage is not None
+        if run_threshold:
+            self.set_autothreshold()
+        if run_spikes:
+            self.compute_spikecount(self._detection_settings)
+        if not loaded:
+            self.release_voltage()
+
+    @property
+    def spikecount_pending(self):
+        """True if the spike detection was deferred, did not run yet and no
+        spike count was set with set_spikecount"""
+        return self._spikes_pending and self._spikecount is None
+
+    def set_spikecount(self, spikecount):
+        """Set the number of spikes of a recording whose spike detection is
+        deferred, such that spikecount can be known without eFEL. The spike
+        times are still computed by eFEL if peak_time is accessed.
+
+        Args:
+            spikecount (int): number of spikes.
+        """
+
+        self._spikecount = spikecount
+
     @property
     def spikecount(self) -> int | None:
+        if self._spikes_pending and self._spikecount is not None:
+            # As eFEL returns no peak_time for a trace without spikes
+            return self._spikecount if self._spikecount else None
         if self.peak_time is None:
             return None
         else:
@@ -183,25 +439,24 @@ class Recording(ABC):
         some metadata are present both in the file itself and the file_metadata
         dictionary, the latter is used."""
 
-        # Create the time series
-        t = numpy.arange(len(reader_data["voltage"]))
+        in_place = reader_data.get("owns_buffers", False)
 
-        # Give it the correct sampling rate
+        # The time axis is defined by the sampling rate and only created as
+        # an array when needed
         if "dt" in config_data and config_data["dt"] is not None:
-            t = t * config_data["dt"]
+            dt = config_data["dt"]
         elif "dt" in reader_data and reader_data["dt"] is not None:
-            t = t * reader_data["dt"]
+            dt = reader_data["dt"]
         else:
             raise Exception(
                 "Sampling rate not configured for "
                 "file {}".format(self.files)
             )
 
-        # Convert it to ms
         if "t_unit" in config_data and config_data["t_unit"] is not None:
-            t = to_ms(t, config_data["t_unit"])
+            t = TimeAxis(len(reader_data["voltage"]), dt, config_data["t_unit"])
         elif "t_unit" in reader_data and reader_data["t_unit"] is not None:
-            t = to_ms(t, reader_data["t_unit"])
+            t = TimeAxis(len(reader_data["voltage"]), dt, reader_data["t_unit"])
         else:
             raise Exception(
                 "Time unit not configured for " "file {}".format(self.files)
@@ -211,7 +466,11 @@ class Recording(ABC):
         # Determine the unit to use
         unit = config_data.get("i_unit") or reader_data.get("i_unit")
         if unit:
-            current = to_nA(reader_data.get("current", 0), unit)
+            current = reader_data.get("current", 0)
+            if not isinstance(current, LazySeries):
+                current = self.standardize_current(
+                    current, config_data, reader_data, in_place
+                )
 
             # Set amp - prioritize amp in config_data
             amp_source = config_data if "amp" in config_data else reader_data
@@ -225,44 +484,109 @@ class Recording(ABC):
                 "Current unit not configured for " "file {}".format(self.files)
             )
 
+        voltage = reader_data["voltage"]
+        if not isinstance(voltage, LazySeries):
+            voltage = self.standardize_voltage(
+                voltage, config_data, reader_data, in_place
+            )
+        elif not (config_data.get("v_unit") or reader_data.get("v_unit")):
+            raise Exception(
+                "Voltage unit not configured for " "file {}".format(self.files)
+            )
+
+        if "repetition" in reader_data:
+            self.repetition = reader_data["repetition"]
+
+        return t, current, voltage, amp, hypamp
+
+    def standardize_current(self, current, config_data, reader_data, in_place=False):
+        """Convert a current series to nA. If in_place is True, the series is
+        modified in place when possible."""
+
+        unit = config_data.get("i_unit") or reader_data.get("i_unit")
+        if not unit:
+            raise Exception(
+                "Current unit not configured for " "file {}".format(self.files)
+            )
+
+        return to_nA(current, unit, in_place)
+
+    def standardize_voltage(self, voltage, config_data, reader_data, in_place=False):
+        """Convert a voltage series to mV and apply the corrections informed
+        in config_data. If in_place is True, the series is modified in place
+        when possible."""
+
+        original = voltage
+
         # Convert voltage to mV
         if "v_unit" in config_data and config_data["v_unit"] is not None:
-            voltage = to_mV(reader_data["voltage"], config_data["v_unit"])
+            voltage = to_mV(voltage, config_data["v_unit"], in_place)
         elif "v_unit" in reader_data and reader_data["v_unit"] is not None:
-            voltage = to_mV(reader_data["voltage"], reader_data["v_unit"])
+            voltage = to_mV(voltage, reader_data["v_unit"], in_place)
         else:
             raise Exception(
                 "Voltage unit not configured for " "file {}".format(self.files)
             )
 
+        # The corrections can be applied in place on a copy of the series
+        in_place = _is_writeable_float(voltage) and (
+            in_place or voltage is not original
+        )
+
         # Offset membrane potential to known value
         if "v_corr" in config_data and config_data["v_corr"] is not None:
-            voltage = (
-                voltage - numpy.median(voltage[:100]) + config_data["v_corr"]
-            )
+            median = numpy.median(voltage[:100])
+            if in_place:
+                voltage -= median
+                voltage += config_data["v_corr"]
+            else:
+                voltage = voltage - median + config_data["v_corr"]
+                in_place = _is_writeable_float(voltage)
 
         # Correct for the liquid junction potential
         # WARNING: the ljp is informed as a positive float but we substract it
         # from the voltage
         if "ljp" in config_data and config_data["ljp"] is not None:
-            voltage = numpy.array(voltage) - config_data["ljp"]
-        if "repetition" in reader_data:
-            self.repetition = reader_data["repetition"]
+            if in_place:
+                voltage -= config_data["ljp"]
+            else:
+                voltage = numpy.array(voltage) - config_data["ljp"]
 
-        return t, current, voltage, amp, hypamp
+        return voltage
 
-    def call_efel(self, efeatures, efel_settings=None):
-        """ Calls efel to compute the wanted efeatures """
+    def efel_trace_and_settings(self, efeatures, efel_settings=None):
+        """Prepare the eFEL trace and the eFEL settings needed to compute a
+        set of efeatures on the present recording.
+
+        The settings that are specific to the sweep (stimulus current and
+        automatic threshold) are passed in the trace, as eFEL applies them on
+        top of its global settings. The settings returned can therefore be
+        shared by all the recordings of a protocol.
+
+        Args:
+            efeatures (list of str): name of the efeatures to extract from
+                the recording.
+            efel_settings (dict): eFEL settings in the form
+                {setting_name: setting_value}.
+
+        Returns:
+            efel_trace (dict): trace in the format expected by eFEL.
+            settings (dict): global eFEL settings to use for this trace.
+        """
 
         if efel_settings is None:
             efel_settings = {}
 
-        settings = {"stimulus_current": self.amp}
+        settings = {}
+        trace_settings = {}
+
+        if self.amp is not None:
+            trace_settings["stimulus_current"] = [float(self.amp)]
 
         if "Threshold" not in efel_settings and self.auto_threshold is not None:
             logger.warning(f"Threshold was not provided and was automatically"
                            f" set to {self.auto_threshold}")
-            settings["Threshold"] = self.auto_threshold
+            trace_settings["Threshold"] = [float(self.auto_threshold)]
 
         for setting in efel_settings:
             if setting not in ['stim_start', 'stim_end']:
@@ -280,29 +604,178 @@ class Recording(ABC):
                 settings["multi_stim_start"] = [stim_start]
                 settings["multi_stim_end"] = [stim_end]
 
-        set_efel_settings(settings)
-
         efel_trace = {
             "T": self.t,
             "V": self.voltage,
             'stim_start': [stim_start],
-            'stim_end': [stim_end]
+            'stim_end': [stim_end],
+            **trace_settings
         }
         if self.current is not None:
             efel_trace["I"] = self.current
 
-        try:
-            return efel.getFeatureValues(
-                [efel_trace], efeatures, raise_warnings=False
-            )
-        except TypeError as e:
-            if "Unknown feature name" in str(e):
-                str_f = " ".join(efeatures)
-                raise Exception("One of the following feature name does not "
-                                f"exist in eFEL: {str_f}")
+        return efel_trace, settings
+
+    @staticmethod
+    def efel_memo_context(efel_trace, settings):
+        """Hashable description of everything, apart from the voltage and
+        current arrays, that can influence the values returned by eFEL: the
+        global settings and the scalar settings passed through the trace
+        (stimulus window, stimulus current, threshold).
+
+        Args:
+            efel_trace (dict): trace in the format expected by eFEL.
+            settings (dict): global eFEL settings used for this trace.
+        """
+
+        effective_settings = dict(settings)
+        for key, value in efel_trace.items():
+            if key not in ["T", "V", "I"]:
+                effective_settings[key] = value
+
+        return efel_settings_key(effective_settings)
+
+    def get_memoized_efeatures(self, efeatures, context):
+        """Returns the values of the efeatures already computed by eFEL for
+        the present recording under the same context. Spikecount is derived
+        from peak_time when the latter is known, as both come from the same
+        peak detection.
+
+        Args:
+            efeatures (list of str): name of the efeatures in eFEL.
+            context (tuple): output of efel_memo_context.
+        """
+
+        known = {}
+        for efeature in efeatures:
+            if (efeature, context) in self.efel_memo:
+                known[efeature] = self.efel_memo[(efeature, context)]
+            elif efeature in _DERIVED_EFEATURES:
+                source, derive = _DERIVED_EFEATURES[efeature]
+                if (source, context) in self.efel_memo:
+                    known[efeature] = derive(self.efel_memo[(source, context)])
+
+        return known
+
+    def memoize_efeatures(self, efel_values, context):
+        """Store the values returned by eFEL for the present recording.
+
+        Args:
+            efel_values (dict): values returned by eFEL, in the form
+                {efeature: values}.
+            context (tuple): output of efel_memo_context.
+        """
+
+        for efeature, values in efel_values.items():
+            self.efel_memo[(efeature, context)] = values
+
+    def clear_efel_memo(self):
+        """Forget the values computed by eFEL for the present recording. Has
+        to be called if the voltage or current of the recording is modified
+        after features were computed."""
+
+        self.efel_memo = {}
+        self._trace_hash = None
+
+    def trace_hash(self):
+        """Hash of the content of the standardized time, voltage and current
+        series of the recording."""
+
+        if self._trace_hash is None:
+            self._trace_hash = hash_arrays([self.t, self.voltage, self.current])
+
+        return self._trace_hash
+
+    def get_known_efeatures(self, efeatures, context, cache=None):
+        """Returns the values of the efeatures that are either memoized or
+        present in the on-disk cache. The values found in the cache are
+        memoized.
+
+        Args:
+            efeatures (list of str): name of the efeatures in eFEL.
+            context (tuple): output of efel_memo_context.
+            cache (FeatureCache): on-disk cache of efeature values.
+        """
+
+        known = self.get_memoized_efeatures(efeatures, context)
+
+        if cache is not None:
+            for efeature in efeatures:
+                if efeature in known:
+                    continue
+                key = cache.key(self.trace_hash(), efeature, context)
+                try:
+                    known[efeature] = cache.load(key)
+                except KeyError:
+                    continue
+                self.efel_memo[(efeature, context)] = known[efeature]
+
+        return known
+
+    def store_efeatures(self, efel_values, context, cache=None):
+        """Memoize the values returned by eFEL and write them in the on-disk
+        cache if one is used.
+
+        Args:
+            efel_values (dict): values returned by eFEL, in the form
+                {efeature: values}.
+            context (tuple): output of efel_memo_context.
+            cache (FeatureCache): on-disk cache of efeature values.
+        """
+
+        self.memoize_efeatures(efel_values, context)
+
+        if cache is not None:
+            for efeature, values in efel_values.items():
+                cache.save(
+                    cache.key(self.trace_hash(), efeature, context), values
+                )
+
+    def call_efel(self, efeatures, efel_settings=None, cache_dir=None):
+        """ Calls efel to compute the wanted efeatures """
+
+        cache = get_feature_cache(cache_dir)
+
+        efel_trace, settings = self.efel_trace_and_settings(
+            efeatures, efel_settings
+        )
+        context = self.efel_memo_context(efel_trace, settings)
+
+        efel_values = self.get_known_efeatures(efeatures, context, cache)
+        missing = [f for f in efeatures if f not in efel_values]
+
+        if missing:
+            new_values = get_efel_values([efel_trace], missing, settings)[0]
+            self.store_efeatures(new_values, context, cache)
+            efel_values.update(new_values)
+
+        return [{f: efel_values[f] for f in efeatures}]
+
+    def set_efeatures(self, efel_values, efeatures, efeature_names):
+        """Store the mean of the values returned by eFEL for each efeature.
+
+        Args:
+            efel_values (dict): values returned by eFEL for the present
+                recording, in the form {efeature: values}.
+            efeatures (list of str): name of the efeatures in eFEL.
+            efeature_names (list of str): names under which the efeatures
+                are stored.
+        """
+
+        for efeature_name, efeature in zip(efeature_names, efeatures):
+
+            if efel_values[efeature] is not None:
+                value = [v for v in efel_values[efeature] if v is not None]
+            else:
+                value = []
+            if len(value) == 0 or numpy.isinf(numpy.nanmean(value)):
+                self.efeatures[efeature_name] = numpy.nan
+            else:
+                self.efeatures[efeature_name] = numpy.nanmean(value)
 
     def compute_efeatures(
-        self, efeatures, efeature_names=None, efel_settings=None
+        self, efeatures, efeature_names=None, efel_settings=None,
+        cache_dir=None
     ):
         """Compute a set of efeatures for the present recording.
 
@@ -315,6 +788,9 @@ class Recording(ABC):
                 of the same recording.
             efel_settings (dict): eFEL settings in the form
                 {setting_name: setting_value}.
+            cache_dir (str): Optional. Path to a directory used to cache the
+                efeature values on disk. Only the efeatures missing from the
+                cache are computed by eFEL.
         """
         if efeature_names is None:
             efeature_names = efeatures
@@ -323,35 +799,38 @@ class Recording(ABC):
             if efeature_names[i] is None:
                 efeature_names[i] = f
 
-        efel_vals = self.call_efel(efeatures, efel_settings)
-        for efeature_name, efeature in zip(efeature_names, efeatures):
+        efel_vals = self.call_efel(efeatures, efel_settings, cache_dir)
+        self.set_efeatures(efel_vals[0], efeatures, efeature_names)
 
-            if efel_vals[0][efeature] is not None:
-                value = [v for v in efel_vals[0][efeature] if v is not None]
-            else:
-                value = []
-            if len(value) == 0 or numpy.isinf(numpy.nanmean(value)):
-                self.efeatures[efeature_name] = numpy.nan
-            else:
-                self.efeatures[efeature_name] = numpy.nanmean(value)
+    def spike_detection_settings(self, efel_settings=None):
+        """eFEL settings used by compute_spikecount to detect the spikes, in
+        which the Threshold is always set (to the automatic threshold if
+        it is not provided).
 
-    def compute_spikecount(self, efel_settings=None):
-        """Compute the number of spikes in the trace"""
-        if not efel_settings:
-            efel_settings = {}
+        Args:
+            efel_settings (dict): eFEL settings in the form
+                {setting_name: setting_value}. If None, the settings of the
+                deferred spike detection are used.
+        """
+
+        if efel_settings is None:
+            efel_settings = self._detection_settings
 
         tmp_settings = {'strict_stiminterval': True}
-        if efel_settings is not None:
+        if efel_settings:
             tmp_settings.update(efel_settings)
 
         # If the setting Threshold is not provided, tries to find it
         if tmp_settings.get("Threshold", None) is None:
             tmp_settings["Threshold"] = self.auto_threshold
-            efel_vals = self.call_efel(['peak_time'], tmp_settings)
-            self.peak_time = efel_vals[0]['peak_time']
 
-        else:
-            self.peak_time = self.call_efel(['peak_time'], tmp_settings)[0]['peak_time']
+        return tmp_settings
+
+    def compute_spikecount(self, efel_settings=None):
+        """Compute the number of spikes in the trace"""
+
+        tmp_settings = self.spike_detection_settings(efel_settings or {})
+        self.peak_time = self.call_efel(['peak_time'], tmp_settings)[0]['peak_time']
 
         if self.spikecount == 0 and numpy.max(self.voltage) > tmp_settings["Threshold"]:
             logger.warning(
@@ -416,10 +895,11 @@ class Recording(ABC):
             title += "\nRepetition: {}".format(self.repetition)
         axis_current.set_title(title, size="x-small")
 
+        t = self.t
         gen_t, gen_i = self.generate()
-        axis_current.plot(self.t, self.current, c="C0", lw=0.8)
+        axis_current.plot(t, self.current, c="C0", lw=0.8)
         axis_current.plot(gen_t, gen_i, c="C1", ls="--", lw=0.8)
-        axis_voltage.plot(self.t, self.voltage, c="C0", lw=0.8)
+        axis_voltage.plot(t, self.voltage, c="C0", lw=0.8)
 
         if self.peak_time is not None:
             max_v = numpy.max(self.voltage)
@@ -430,7 +910,7 @@ class Recording(ABC):
 
         if self.auto_threshold is not None:
             axis_voltage.plot(
-                [self.t[0], self.t[-1]], [self.auto_threshold, self.auto_threshold],
+                [t[0], t[-1]], [self.auto_threshold, self.auto_threshold],
                 c="black", ls="--", lw=0.5, alpha=0.8
             )
 
@@ -446,3 +926,190 @@ class Recording(ABC):
         axis_voltage.tick_params(axis="both", which="minor", labelsize=6)
 
         return axis_current, axis_voltage
+
+
+# Attributes of a Recording that hold time series or values derived from them
+_SERIES_ATTRIBUTES = [
+    "_t", "_time_axis", "_current", "_lazy_current", "_voltage",
+    "_lazy_voltage", "_auto_threshold", "_peak_time", "_spikecount",
+    "_threshold_pending", "_spikes_pending", "_detection_settings",
+    "efel_memo", "_trace_hash"
+]
+
+
+class RecordingSummary():
+
+    """Recording without its time series. It contains the eCode parameters,
+    amplitudes, spike detection results and efeatures of a Recording, which
+    is all that compute_rheobase, group_efeatures and
+    create_feature_protocol_files need, and is cheap to send between
+    processes.
+
+    The methods of the eCode of the recording that do not need the time
+    series (e.g: in_target, compute_relative_amp, get_params) can be called
+    on the summary."""
+
+    def __init__(self, recording):
+        """
+        Constructor
+
+        Args:
+            recording (Recording): recording to summarize. The spike
+                detection deferred and not run yet is not run.
+        """
+
+        self.ecode = type(recording)
+        self.__dict__.update({
+            k: v for k, v in vars(recording).items()
+            if k not in _SERIES_ATTRIBUTES
+        })
+
+        self.t = None
+        self.voltage = None
+        self.current = None
+
+        self.auto_threshold = None
+        if not recording._threshold_pending:
+            self.auto_threshold = recording._auto_threshold
+
+        if recording._spikes_pending:
+            self.peak_time = None
+            # As eFEL returns no peak_time for a trace without spikes
+            self.spikecount = recording._spikecount or None
+        else:
+            self.peak_time = recording._peak_time
+            self.spikecount = None
+            if recording._peak_time is not None:
+                self.spikecount = len(recording._peak_time)
+
+    def __getattr__(self, name):
+        # Methods, properties and class attributes of the eCode
+        if name.startswith("__") or name == "ecode":
+            raise AttributeError(name)
+        for klass in self.ecode.__mro__:
+            if name in vars(klass):
+                attr = vars(klass)[name]
+                if hasattr(attr, "__get__"):
+                    return attr.__get__(self, type(self))
+                return attr
+        raise AttributeError(
+            f"'{type(self).__name__}' object has no attribute '{name}'"
+        )
+
+
+# eFEL features that can be obtained from another feature computed with the
+# same settings, in the form {efeature: (source efeature, function)}
+_DERIVED_EFEATURES = {
+    "Spikecount": (
+        "peak_time",
+        lambda peak_time: numpy.array(
+            [0 if peak_time is None else len(peak_time)]
+        )
+    ),
+}
+
+
+def get_efel_values(efel_traces, efeatures, efel_settings):
+    """Calls efel to compute the wanted efeatures on a list of traces sharing
+    the same eFEL settings. The settings are only applied to the global state
+    of eFEL for the duration of the call, under tools.efel_lock, such that
+    the function can be called from several threads.
+
+    Args:
+        efel_traces (list of dict): traces in the format expected by eFEL.
+        efeatures (list of str): name of the efeatures to extract.
+        efel_settings (dict): eFEL settings in the form
+            {setting_name: setting_value}.
+    """
+
+    try:
+        with efel_lock:
+            set_efel_settings(efel_settings)
+            return efel.getFeatureValues(
+                efel_traces, efeatures, raise_warnings=False
+            )
+    except TypeError as e:
+        if "Unknown feature name" in str(e):
+            str_f = " ".join(efeatures)
+            raise Exception("One of the following feature name does not "
+                            f"exist in eFEL: {str_f}")
+
+
+def compute_efeatures_batch(
+    recordings, efeatures, efeature_names=None, efel_settings=None,
+    cache_dir=None
+):
+    """Compute a set of efeatures for a group of recordings. Instead of calling
+    eFEL once per recording, the recordings sharing the same eFEL settings are
+    sent to eFEL as a single list of traces and the settings are only applied
+    once per group. The efeatures already known for a recording (see
+    Recording.get_known_efeatures) are not recomputed.
+
+    Args:
+        recordings (list of Recording): recordings for which to compute the
+            efeatures.
+        efeatures (list of str): name of the efeatures to extract from
+            the recordings.
+        efeature_names (list of str): Optional. Given name for the
+            features. Can and should be used if the same feature
+            is to be extracted several time on different sections
+            of the same recording.
+        efel_settings (dict): eFEL settings in the form
+            {setting_name: setting_value}.
+        cache_dir (str): Optional. Path to a directory used to cache the
+            efeature values on disk.
+    """
+
+    if efeature_names is None:
+        efeature_names = efeatures
+
+    for i, f in enumerate(efeatures):
+        if efeature_names[i] is None:
+            efeature_names[i] = f
+
+    cache = get_feature_cache(cache_dir)
+
+    groups = {}
+    contexts = []
+    for rec in recordings:
+        efel_trace, settings = rec.efel_trace_and_settings(
+            efeatures, efel_settings
+        )
+        context = rec.efel_memo_context(efel_trace, settings)
+        contexts.append(context)
+
+        known = rec.get_known_efeatures(efeatures, context, cache)
+
+        missing = tuple(f for f in efeatures if f not in known)
+        if not missing:
+            continue
+
+        group = groups.setdefault(
+            (efel_settings_key(settings), missing),
+            {
+                "settings": settings,
+                "efeatures": list(missing),
+                "recordings": [],
+                "traces": [],
+                "contexts": []
+            }
+        )
+        group["recordings"].append(rec)
+        group["traces"].append(efel_trace)
+        group["contexts"].append(context)
+
+    for group in groups.values():
+        efel_vals = get_efel_values(
+            group["traces"], group["efeatures"], group["settings"]
+        )
+        for rec, values, context in zip(
+            group["recordings"], efel_vals, group["contexts"]
+        ):
+            rec.store_efeatures(values, context, cache)
+
+    for rec, context in zip(recordings, contexts):
+        rec.set_efeatures(
+            rec.get_memoized_efeatures(efeatures, context),
+            efeatures,
+            efeature_names
+        )
@@ -23,6 +23,172 @@ import numpy
 
 logger = logging.getLogger(__name__)
 
+SPIKECOUNT_METHODS = ["efel", "numpy", "validate"]
+
+
+def count_spikes(
+    voltages,
+    dt,
+    thresholds,
+    stim_starts=None,
+    stim_ends=None,
+    strict_stiminterval=True
+):
+    """Count the spikes of a stack of sweeps of same length, following the
+    rules of the peak detection of eFEL: a spike starts when the voltage
+    goes above the threshold and ends when it goes back below it, its peak
+    is the maximum of the voltage in between. If strict_stiminterval is
+    True, only the peaks inside the stimulus window are counted.
+
+    Contrary to eFEL, the voltage is not interpolated. As in the
+    interpolated trace, a sample exactly at the threshold is considered to
+    be on the same side of the threshold as the sample before it. The count
+    can differ from the one of eFEL when a peak is at the edge of the
+    stimulus window.
+
+    Args:
+        voltages (array): voltages in mV, of shape (n_sweeps, n_samples).
+        dt (float): sampling period in ms.
+        thresholds (array): spike detection threshold of each sweep, in mV.
+        stim_starts (array): start of the stimulus of each sweep, in ms.
+        stim_ends (array): end of the stimulus of each sweep, in ms.
+        strict_stiminterval (bool or array): if True, only the peaks between
+            stim_starts and stim_ends are counted. Can be given per sweep.
+
+    Returns:
+        array: number of spikes of each sweep
+    """
+
+    voltages = numpy.atleast_2d(voltages)
+    n_sweeps, n_samples = voltages.shape
+    thresholds = numpy.broadcast_to(
+        numpy.asarray(thresholds, dtype=float), (n_sweeps,)
+    )[:, None]
+
+    above = voltages > thresholds
+    below = voltages < thresholds
+
+    for row in numpy.nonzero(~(above | below).all(axis=1))[0]:
+        side = above[row].astype(numpy.int8) - below[row]
+        previous = numpy.where(side != 0, numpy.arange(n_samples), 0)
+        side = side[numpy.maximum.accumulate(previous)]
+        above[row] = side > 0
+        below[row] = side < 0
+
+    up_rows, up_idx = numpy.nonzero(below[:, :-1] & above[:, 1:])
+    dn_rows, dn_idx = numpy.nonzero(above[:, :-1] & below[:, 1:])
+    up_idx += 1
+    dn_idx += 1
+
+    # Ignore the downward crossings before the first upward crossing
+    first_up = numpy.full(n_sweeps, n_samples)
+    numpy.minimum.at(first_up, up_rows, up_idx)
+    keep = dn_idx > first_up[dn_rows]
+    dn_rows, dn_idx = dn_rows[keep], dn_idx[keep]
+
+    # Pair the i-th upward and downward crossings of each sweep, ignoring
+    # the last upward crossing if it is not followed by a downward crossing
+    n_up = numpy.bincount(up_rows, minlength=n_sweeps)
+    n_dn = numpy.bincount(dn_rows, minlength=n_sweeps)
+    n_pairs = numpy.minimum(n_up, n_dn)
+
+    def _first_pairs(rows, counts):
+        rank = numpy.arange(len(rows)) - numpy.repeat(
+            numpy.cumsum(counts) - counts, counts
+        )
+        return rank < n_pairs[rows]
+
+    keep_up = _first_pairs(up_rows, n_up)
+    keep_dn = _first_pairs(dn_rows, n_dn)
+    rows = up_rows[keep_up]
+    starts = rows * n_samples + up_idx[keep_up]
+    ends = rows * n_samples + dn_idx[keep_dn]
+
+    if not len(rows):
+        return numpy.zeros(n_sweeps, dtype=int)
+
+    # Index of the first maximum of the voltage in each spike
+    lengths = ends - starts + 1
+    segment = numpy.repeat(numpy.arange(len(starts)), lengths)
+    flat_idx = numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths)
+    flat_idx += numpy.arange(len(segment))
+    values = voltages.reshape(-1)[flat_idx]
+    order = numpy.lexsort((flat_idx, -values, segment))
+    first = numpy.ones(len(order), dtype=bool)
+    first[1:] = segment[order][1:] != segment[order][:-1]
+    peaks = flat_idx[order][first] - rows * n_samples
+
+    strict = numpy.broadcast_to(strict_stiminterval, (n_sweeps,))[rows]
+    if strict.any():
+        peak_times = peaks * dt
+        stim_starts = numpy.broadcast_to(stim_starts, (n_sweeps,))[rows]
+        stim_ends = numpy.broadcast_to(stim_ends, (n_sweeps,))[rows]
+        inside = (peak_times >= stim_starts) & (peak_times <= stim_ends)
+        rows = rows[~strict | inside]
+
+    return numpy.bincount(rows, minlength=n_sweeps)
+
+
+def count_recordings_spikes(recordings, validate=False, max_sweeps=64):
+    """Count with count_spikes the spikes of the recordings whose spike
+    detection was deferred and whose spikes were not counted yet, using the
+    settings their spike detection would use in eFEL. The sweeps of same
+    length and sampling period are counted together, by stacks of at most
+    max_sweeps.
+
+    Args:
+        recordings (list of Recording): recordings to consider.
+        validate (bool): if True, the spikes are also detected by eFEL and
+            the recordings for which the counts differ are reported. The
+            spike counts of eFEL are then used.
+        max_sweeps (int): maximum number of sweeps counted together.
+
+    Returns:
+        list: (recording, count, eFEL count) for the recordings for which
+        the counts differ. Only filled if validate is True.
+    """
+
+    groups = {}
+    for rec in recordings:
+        if rec.spikecount_pending:
+            groups.setdefault((len(rec.time_axis), rec.dt), []).append(rec)
+
+    mismatches = []
+    for (_, dt), group in groups.items():
+        for i in range(0, len(group), max_sweeps):
+            stack = group[i:i + max_sweeps]
+            settings = [rec.spike_detection_settings() for rec in stack]
+
+            counts = count_spikes(
+                numpy.stack([rec.voltage for rec in stack]),
+                dt,
+                [s["Threshold"] for s in settings],
+                [s.get("stim_start", r.ton) for s, r in zip(settings, stack)],
+                [s.get("stim_end", r.toff) for s, r in zip(settings, stack)],
+                [bool(s["strict_stiminterval"]) for s in settings]
+            )
+
+            for rec, count in zip(stack, counts):
+                rec.set_spikecount(int(count))
+
+                if validate:
+                    rec.detect_spikes()
+                    efel_count = rec.spikecount or 0
+                    if efel_count != count:
+                        mismatches.append((rec, int(count), efel_count))
+
+                # Lazy voltages are read again from their file if needed
+                rec.release_voltage()
+
+    for rec, count, efel_count in mismatches:
+        logger.warning(
+            f"The spike count of recording {rec.name} of protocol "
+            f"{rec.protocol_name} ({rec.files}) is {count} with the numpy "
+            f"spike counter but {efel_count} with eFEL."
+        )
+
+    return mismatches
+
 
 def _get_list_spiking_amplitude(cell, protocols_rheobase):
     """Return the list of sorted list of amplitude that triggered at least
@@ -19,6 +19,7 @@ Copyright (c) 2022, EPFL/Blue Brain Project
  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 import json
+import threading
 import numpy
 import efel
 
@@ -35,84 +36,347 @@ PRESET_PROTOCOLS_RHEOBASE = [
 ]
 
 
-def to_ms(t, t_unit):
+def _is_writeable_float(series):
+    """True if series is an array whose values can be replaced in place by
+    the result of float operations, without changing its dtype compared to
+    an out-of-place operation"""
+
+    return (
+        isinstance(series, numpy.ndarray)
+        and series.dtype.kind == "f"
+        and series.dtype.isnative
+        and series.flags.writeable
+    )
+
+
+def _scale(series, factor, in_place=False):
+    """Returns series * factor. If in_place is True and series is a writeable
+    float array, it is multiplied in place instead of being copied."""
+
+    if in_place and _is_writeable_float(series):
+        series *= factor
+        return series
+
+    return series * factor
+
+
+def to_ms(t, t_unit, in_place=False):
     """Converts a time series to ms.
 
     Args:
         t (array): time series.
         t_unit (str): unit of the time series. Has to be "s", "sec",
             "seconds", "ms" or "10th_ms".
+        in_place (bool): if True, float arrays are converted in place.
     """
 
     if t_unit.lower() in ["s", "sec", "seconds"]:
-        return t * 1e3
+        return _scale(t, 1e3, in_place)
     elif t_unit == "ms":
         return t
     elif t_unit == "10th_ms":
-        return t * 0.1
+        return _scale(t, 0.1, in_place)
     else:
         raise Exception("Time unit '{}' is unknown.".format(t_unit))
 
 
-def to_nA(current, i_unit):
+def to_nA(current, i_unit, in_place=False):
     """Converts a current series to nA.
 
     Args:
         current (array): current series.
         i_unit (str): unit of the current series. Has to be "a", "amperes",
             "amps", "mA", "uA", "pA" or "nA".
+        in_place (bool): if True, float arrays are converted in place.
     """
 
     if i_unit.lower() in ["a", "amperes", "amps"]:
-        return current * 1e9
+        return _scale(current, 1e9, in_place)
     elif i_unit == "mA":
-        return current * 1e6
+        return _scale(current, 1e6, in_place)
     elif i_unit == "uA":
-        return current * 1e3
+        return _scale(current, 1e3, in_place)
     elif i_unit == "pA":
-        return current * 1e-3
+        return _scale(current, 1e-3, in_place)
     elif i_unit == "nA":
         return current
     else:
         raise Exception("Current unit '{}' is unknown.".format(i_unit))
 
 
-def to_mV(voltage, v_unit):
+def to_mV(voltage, v_unit, in_place=False):
     """Converts a voltage series to mV.
 
     Args:
         voltage (array): voltage series.
         v_unit (str): unit of the voltage series. Has to be "v", "volts",
             "uV" or "mV".
+        in_place (bool): if True, float arrays are converted in place.
     """
 
     if v_unit.lower() in ["v", "volts"]:
-        return voltage * 1e3
+        return _scale(voltage, 1e3, in_place)
     elif v_unit == "uV":
-        return voltage * 1e-3
+        return _scale(voltage, 1e-3, in_place)
     elif v_unit == "mV":
         return voltage
     else:
         raise Exception("Voltage unit '{}' is unknown.".format(v_unit))
 
 
+class LazySeries():
+
+    """Time series returned by a reader in place of an array when the data
+    should only be read from the file when needed. Subclasses must know the
+    length of the series without reading it.
+
+    If keep_loaded is True, a Recording keeps the series once loaded until
+    Recording.release_voltage is called. Otherwise, it is loaded again each
+    time it is accessed.
+
+    If standardized is True, the series is already in the units of the
+    Recording (mV, nA) and is not standardized again once loaded."""
+
+    keep_loaded = True
+    standardized = False
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def load(self):
+        """Read the time series and return it as an array"""
+        raise NotImplementedError()
+
+
+class CompactSeries(LazySeries):
+
+    """Time series kept in memory as the raw integer samples of the file
+    (e.g: int16 ADC counts) together with the factors converting them to
+    the unit of the file. The float32 series is only created when needed,
+    the values are identical to the ones of numpy.float32(raw * scale) +
+    offset computed in the precision of the scale and offset.
+
+    The series occupies 2 to 4 times less memory than its float32 version
+    and is converted again each time it is accessed from a Recording."""
+
+    keep_loaded = False
+
+    def __init__(self, raw, scale=1., offset=0.):
+        """
+        Constructor
+
+        Args:
+            raw (array): integer samples.
+            scale (float): factor by which the samples have to be multiplied.
+            offset (float): value added to the samples once multiplied.
+        """
+
+        self.raw = raw
+        self.scale = scale
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def nbytes(self):
+        return self.raw.nbytes
+
+    def load(self):
+        series = numpy.empty(self.raw.shape, dtype=numpy.float32)
+        numpy.multiply(
+            self.raw,
+            self.scale,
+            out=series,
+            dtype=numpy.result_type(self.raw.dtype, self.scale),
+            casting="same_kind"
+        )
+        if self.offset != 0:
+            numpy.add(series, self.offset, out=series, casting="same_kind")
+        return series
+
+
+class TimeAxis():
+
+    """Time axis in ms of a uniformly sampled series, defined by its number
+    of samples and its sampling period. The times of single samples are
+    computed on demand and the full array is only created by array(). The
+    values are identical to the ones of to_ms(numpy.arange(n) * dt, t_unit).
+    """
+
+    def __init__(self, n_samples, dt, t_unit):
+        """
+        Constructor
+
+        Args:
+            n_samples (int): number of samples.
+            dt (float): sampling period, in t_unit.
+            t_unit (str): unit of dt, see to_ms.
+        """
+
+        # Raises an Exception if the unit is unknown
+        to_ms(dt, t_unit)
+
+        self.n_samples = int(n_samples)
+        self.dt = dt
+        self.t_unit = t_unit
+
+    def __len__(self):
+        return self.n_samples
+
+    def __getitem__(self, index):
+        if not isinstance(index, (int, numpy.integer)):
+            return self.array()[index]
+
+        if index < 0:
+            index += self.n_samples
+        if not 0 <= index < self.n_samples:
+            raise IndexError(
+                f"index {index} is out of bounds for a time axis of "
+                f"{self.n_samples} samples"
+            )
+
+        return to_ms(numpy.int64(index) * self.dt, self.t_unit)
+
+    def __array__(self, dtype=None, copy=None):
+        t = self.array()
+        return t if dtype is None else t.astype(dtype)
+
+    def array(self):
+        """Returns the time axis as an array"""
+
+        t = numpy.arange(self.n_samples) * self.dt
+        return to_ms(t, self.t_unit, in_place=True)
+
+
+def _same_setting_value(value_a, value_b):
+    """Compare two eFEL setting values, which can be scalars or lists"""
+
+    if isinstance(value_a, (list, tuple, numpy.ndarray)) or \
+            isinstance(value_b, (list, tuple, numpy.ndarray)):
+        return numpy.array_equal(value_a, value_b)
+
+    return type(value_a) is type(value_b) and value_a == value_b
+
+
+class EFELSettingsManager():
+
+    """Applies eFEL settings to the global state of eFEL by only setting the
+    keys whose value changed since the last call. eFEL is only reset when a
+    setting has to go back to its default value.
+
+    The manager reads the current state from eFEL itself, so settings modified
+    outside of the manager are taken into account."""
+
+    def __init__(self):
+        """Constructor"""
+
+        self.default_settings = vars(efel.Settings())
+
+        self.n_resets = 0
+        self.n_resets_avoided = 0
+        self.n_settings_applied = 0
+        self.n_settings_skipped = 0
+
+    def _non_default_settings(self):
+        """Names of the settings of eFEL that are not at their default value"""
+
+        return [
+            setting for setting, value in vars(efel.get_settings()).items()
+            if setting not in self.default_settings or
+            not _same_setting_value(value, self.default_settings[setting])
+        ]
+
+    def apply(self, efeature_settings):
+        """Set the eFEL settings as requested (uses default value otherwise).
+
+        Args:
+             efeature_settings (dict): eFEL settings in the form
+                {setting_name: setting_value}.
+        """
+
+        if any(
+            s not in efeature_settings for s in self._non_default_settings()
+        ):
+            efel.reset()
+            self.n_resets += 1
+        else:
+            self.n_resets_avoided += 1
+
+        current_settings = vars(efel.get_settings())
+
+        for setting, value in efeature_settings.items():
+
+            if setting in ['stim_start', 'stim_end']:
+                value = float(value)
+
+            if setting in current_settings and _same_setting_value(
+                current_settings[setting], value
+            ):
+                self.n_settings_skipped += 1
+                continue
+
+            efel.set_setting(setting, value)
+            self.n_settings_applied += 1
+
+    def stats(self):
+        """Returns the counters of the manager as a dictionary"""
+
+        return {
+            "resets": self.n_resets,
+            "resets_avoided": self.n_resets_avoided,
+            "settings_applied": self.n_settings_applied,
+            "settings_skipped": self.n_settings_skipped,
+        }
+
+    def reset_counters(self):
+        """Set all the counters back to 0"""
+
+        self.n_resets = 0
+        self.n_resets_avoided = 0
+        self.n_settings_applied = 0
+        self.n_settings_skipped = 0
+
+
+efel_settings_manager = EFELSettingsManager()
+
+# eFEL keeps its settings in a global state that is read while computing the
+# features. Setting them and computing the features with them has to be done
+# while holding this lock when eFEL can be called from several threads.
+efel_lock = threading.RLock()
+
+
 def set_efel_settings(efeature_settings):
-    """Reset the eFEl settings and set them as requested by the user (uses
-        default value otherwise).
+    """Set the eFEl settings as requested by the user (uses default value
+        otherwise). Only the settings that differ from the current state of
+        eFEL are applied (see EFELSettingsManager).
 
     Args:
          efeature_settings (dict): eFEL settings in the form
             {setting_name: setting_value}.
     """
 
-    efel.reset()
+    with efel_lock:
+        efel_settings_manager.apply(efeature_settings)
+
 
-    for setting, value in efeature_settings.items():
+def efel_settings_key(efeature_settings):
+    """Returns a hashable representation of a dictionary of eFEL settings that
+    does not depend on the order of its keys.
 
-        if setting in ['stim_start', 'stim_end']:
-            value = float(value)
+    Args:
+         efeature_settings (dict): eFEL settings in the form
+            {setting_name: setting_value}.
+    """
 
-        efel.set_setting(setting, value)
+    return tuple(
+        (
+            setting,
+            tuple(value) if isinstance(value, (list, tuple, numpy.ndarray))
+            else value
+        )
+        for setting, value in sorted(efeature_settings.items())
+    )
 
 
 def dict_to_json(data, path):
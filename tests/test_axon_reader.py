@@ -0,0 +1,148 @@
+"""bluepyefe.reader.axon_reader tests"""
+
+import os
+import struct
+import tempfile
+import unittest
+
+import numpy
+from neo import io
+
+from bluepyefe.cell import Cell
+from bluepyefe.file_pool import file_pool
+from bluepyefe.reader import LazyAxonSeries, axon_reader
+from bluepyefe.tools import CompactSeries
+
+BLOCKSIZE = 512
+
+
+def write_abf1(path, voltage, current, sample_interval=100.):
+    """Write a minimal episodic ABF 1.x file containing int16 voltage and
+    current channels of shape (n_episodes, n_samples)."""
+
+    n_episodes, n_samples = voltage.shape
+    header = bytearray(6144)
+
+    def put(fmt, offset, *values):
+        struct.pack_into("<" + fmt, header, offset, *values)
+
+    put("4s", 0, b"ABF ")
+    put("f", 4, 1.83)
+    put("h", 8, 5)
+    put("i", 10, 2 * n_samples * n_episodes)
+    put("i", 16, n_episodes)
+    put("i", 40, len(header) // BLOCKSIZE)
+    put("h", 120, 2)
+    put("f", 122, sample_interval / 2)
+    put("i", 138, 2 * n_samples)
+    put("f", 244, 10.)
+    put("i", 252, 32768)
+    put("16h", 378, *range(16))
+    put("16h", 410, 0, 1, *[-1] * 14)
+    put("10s" * 16, 442, b"Vm", b"Im", *[b""] * 14)
+    put("8s" * 16, 602, b"mV", b"pA", *[b""] * 14)
+    put("16f", 730, *[1.] * 16)
+    put("16f", 922, 0.001, 0.0005, *[1.] * 14)
+    put("16f", 986, 0.5, 0., *[0.] * 14)
+    put("16f", 1050, 1., 2., *[1.] * 14)
+
+    data = numpy.stack([voltage, current], axis=-1).astype("<i2").tobytes()
+    data += b"\0" * (-len(data) % BLOCKSIZE)
+
+    put("i", 92, (len(header) + len(data)) // BLOCKSIZE)
+    put("i", 96, n_episodes)
+    synch = numpy.array(
+        [(i * 2 * n_samples, 2 * n_samples) for i in range(n_episodes)],
+        dtype="<i4"
+    )
+
+    with open(path, "wb") as f:
+        f.write(bytes(header))
+        f.write(data)
+        f.write(synch.tobytes())
+
+
+class AxonReaderTest(unittest.TestCase):
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, "test.abf")
+
+        rng = numpy.random.default_rng(0)
+        self.raw = rng.integers(
+            -32768, 32767, size=(2, 3, 1000), dtype=numpy.int16
+        )
+        write_abf1(self.filepath, self.raw[0], self.raw[1])
+
+    def tearDown(self):
+
+        file_pool.clear()
+        self.tmp_dir.cleanup()
+
+    def test_axon_reader(self):
+
+        data = axon_reader({"filepath": self.filepath})
+
+        block = io.AxonIO(filename=self.filepath).read_block(lazy=False)
+        self.assertEqual(len(data), len(block.segments))
+
+        for trace, segment in zip(data, block.segments):
+            signals = numpy.asarray(segment.analogsignals)
+
+            self.assertEqual(trace["voltage"].dtype, numpy.float32)
+            self.assertEqual(trace["current"].dtype, numpy.float32)
+            numpy.testing.assert_array_equal(
+                trace["voltage"], signals[0].flatten()
+            )
+            numpy.testing.assert_array_equal(
+                trace["current"], signals[1].flatten()
+            )
+            self.assertEqual(trace["dt"], 1e-4)
+
+    def test_compact(self):
+
+        data = axon_reader({"filepath": self.filepath})
+        compact_data = axon_reader({"filepath": self.filepath, "compact": True})
+
+        for trace, compact_trace in zip(data, compact_data):
+            for series in ["voltage", "current"]:
+                self.assertIsInstance(compact_trace[series], CompactSeries)
+                self.assertEqual(compact_trace[series].raw.dtype, numpy.int16)
+                numpy.testing.assert_array_equal(
+                    compact_trace[series].load(), trace[series]
+                )
+
+        config_data = {
+            "filepath": self.filepath,
+            "i_unit": "pA",
+            "v_unit": "mV",
+            "t_unit": "s",
+            "ljp": 14.0,
+        }
+        recordings = []
+        for compact in [False, True]:
+            cell = Cell(name="test")
+            cell.read_recordings([{**config_data, "compact": compact}], "Step")
+            recordings.append(cell.recordings)
+
+        for rec, compact_rec in zip(*recordings):
+            self.assertIsNone(compact_rec._voltage)
+            self.assertIsNone(compact_rec._current)
+            numpy.testing.assert_array_equal(compact_rec.voltage, rec.voltage)
+            numpy.testing.assert_array_equal(compact_rec.current, rec.current)
+            self.assertEqual(compact_rec.get_params(), rec.get_params())
+
+    def test_lazy(self):
+
+        data = axon_reader({"filepath": self.filepath})
+        lazy_data = axon_reader({"filepath": self.filepath, "lazy": True})
+
+        for trace, lazy_trace in zip(data, lazy_data):
+            self.assertIsInstance(lazy_trace["voltage"], LazyAxonSeries)
+            self.assertEqual(len(lazy_trace["voltage"]), len(trace["voltage"]))
+            numpy.testing.assert_array_equal(
+                lazy_trace["voltage"].load(), trace["voltage"]
+            )
+            numpy.testing.assert_array_equal(
+                lazy_trace["current"], trace["current"]
+            )
@@ -0,0 +1,221 @@
+"""bluepyefe.cache tests"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy
+
+import bluepyefe.cache
+import bluepyefe.cell
+import bluepyefe.extract
+import bluepyefe.recording
+from bluepyefe.cache import FeatureCache
+from tests.test_extractor import get_config
+
+
+class FeatureCacheTest(unittest.TestCase):
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmp_dir.name
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+    def test_key_is_canonical(self):
+
+        cache = FeatureCache(self.cache_dir)
+
+        self.assertEqual(
+            cache.key("abc", "AP1_amp", (("Threshold", -20.),)),
+            cache.key("abc", "AP1_amp", (("Threshold", numpy.float64(-20.)),))
+        )
+        self.assertNotEqual(
+            cache.key("abc", "AP1_amp", (("Threshold", -20.),)),
+            cache.key("abc", "AP1_amp", (("Threshold", -10.),))
+        )
+
+    def test_save_load(self):
+
+        cache = FeatureCache(self.cache_dir)
+
+        cache.save("a1", numpy.array([1., 2.]))
+        cache.save("a2", None)
+
+        numpy.testing.assert_array_equal(cache.load("a1"), [1., 2.])
+        self.assertIsNone(cache.load("a2"))
+        with self.assertRaises(KeyError):
+            cache.load("a3")
+
+    def test_lru_eviction(self):
+
+        cache = FeatureCache(self.cache_dir)
+        for key in ["a1", "a2", "a3"]:
+            cache.save(key, numpy.zeros(1000))
+        entry_size = cache.size() / 3
+
+        # Make a1 the most recently used entry
+        for i, key in enumerate(["a2", "a3", "a1"]):
+            os.utime(cache._path(key), (time.time() + i, time.time() + i))
+
+        cache.max_size = 2 * entry_size
+        cache.evict()
+
+        cache.load("a1")
+        cache.load("a3")
+        with self.assertRaises(KeyError):
+            cache.load("a2")
+
+
+class CachedExtractionTest(unittest.TestCase):
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmp_dir.name
+
+        self.cell = bluepyefe.cell.Cell(name="MouseNeuron")
+
+        file_metadata = {
+            "i_file": "./tests/exp_data/B95_Ch0_IDRest_107.ibw",
+            "v_file": "./tests/exp_data/B95_Ch3_IDRest_107.ibw",
+            "i_unit": "pA",
+            "v_unit": "mV",
+            "t_unit": "s",
+            "dt": 0.00025,
+            "ljp": 14.0,
+        }
+
+        self.cell.read_recordings(
+            protocol_data=[file_metadata],
+            protocol_name="IDRest"
+        )
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+    def test_extraction_uses_cache(self):
+
+        efeatures = ["mean_frequency", "AP1_amp"]
+        settings = {"Threshold": -20.}
+
+        self.cell.extract_efeatures(
+            "IDRest", efeatures, None, settings, self.cache_dir
+        )
+        reference = dict(self.cell.recordings[0].efeatures)
+
+        # Forget the in-memory values, they have to come from the disk
+        self.cell.recordings[0].clear_efel_memo()
+        self.cell.recordings[0].efeatures = {}
+
+        with mock.patch.object(
+            bluepyefe.recording,
+            "get_efel_values",
+            wraps=bluepyefe.recording.get_efel_values
+        ) as get_efel_values:
+            self.cell.extract_efeatures(
+                "IDRest", efeatures + ["ISI_CV"], None, settings,
+                self.cache_dir
+            )
+            self.assertEqual(get_efel_values.call_count, 1)
+            self.assertEqual(get_efel_values.call_args[0][1], ["ISI_CV"])
+
+        for efeature in efeatures:
+            self.assertEqual(
+                self.cell.recordings[0].efeatures[efeature],
+                reference[efeature]
+            )
+
+    def test_extraction_max_size(self):
+
+        files_metadata, targets = get_config()
+        kwargs = {
+            "output_directory": "MouseCells",
+            "files_metadata": files_metadata,
+            "targets": targets,
+            "protocols_rheobase": ["IDRest"],
+        }
+
+        full_dir = os.path.join(self.cache_dir, "full")
+        bluepyefe.extract.extract_efeatures(cache_dir=full_dir, **kwargs)
+        full_size = FeatureCache(full_dir).size()
+
+        capped_dir = os.path.join(self.cache_dir, "capped")
+        for _ in range(3):
+            bluepyefe.extract.extract_efeatures(
+                cache_dir=capped_dir, cache_max_size=full_size // 2, **kwargs
+            )
+            size = FeatureCache(capped_dir).size()
+            self.assertGreater(size, 0)
+            self.assertLessEqual(size, full_size // 2)
+
+
+class TraceCacheTest(unittest.TestCase):
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmp_dir.name
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+    def read_cell(self):
+
+        cell = bluepyefe.cell.Cell(name="MouseNeuron")
+        file_metadata = {
+            "filepath": "./tests/exp_data/hippocampus-portal/99111002.nwb",
+            "i_unit": "A",
+            "v_unit": "V",
+            "t_unit": "s",
+            "ljp": 0.0,
+            "protocol_name": "Step",
+        }
+        cell.read_recordings(
+            protocol_data=[file_metadata],
+            protocol_name="Step",
+            trace_cache_dir=self.cache_dir
+        )
+
+        return cell
+
+    def test_read_from_cache(self):
+
+        reference = self.read_cell()
+
+        with mock.patch.object(
+            bluepyefe.cell.Cell, "iter_reader", side_effect=AssertionError
+        ):
+            cell = self.read_cell()
+
+        self.assertEqual(len(cell.recordings), len(reference.recordings))
+        for rec, ref in zip(cell.recordings, reference.recordings):
+            numpy.testing.assert_array_equal(rec.voltage, ref.voltage)
+            numpy.testing.assert_array_equal(rec.current, ref.current)
+            numpy.testing.assert_array_equal(rec.t, ref.t)
+            self.assertEqual(rec.voltage.dtype, ref.voltage.dtype)
+            self.assertEqual(rec.id, ref.id)
+            self.assertEqual(rec.repetition, ref.repetition)
+            self.assertEqual(rec.get_params(), ref.get_params())
+            self.assertEqual(rec.spikecount, ref.spikecount)
+
+    def test_modified_file_invalidates_entry(self):
+
+        cache = bluepyefe.cache.TraceCache(self.cache_dir)
+        config_data = {"filepath": "./tests/exp_data/B95_Ch0_IDRest_107.ibw"}
+
+        key = cache.key(config_data, "auto")
+        self.assertEqual(key, cache.key(config_data, "auto"))
+        self.assertNotEqual(key, cache.key({**config_data, "ljp": 1.}, "auto"))
+
+        path = os.path.join(self.cache_dir, "B95_Ch0_IDRest_107.ibw")
+        shutil.copy(config_data["filepath"], path)
+        key = cache.key({"filepath": path}, "auto")
+
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        self.assertNotEqual(key, cache.key({"filepath": path}, "auto"))
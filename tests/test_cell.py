@@ -4,6 +4,7 @@ import unittest
 
 import bluepyefe.cell
 import bluepyefe.recording
+from bluepyefe.reader import igor_reader
 from bluepyefe.rheobase import compute_rheobase_absolute
 
 
@@ -34,6 +35,17 @@ class CellTest(unittest.TestCase):
         self.assertEqual(recording.efeatures["Spikecount"], 9.0)
         self.assertLess(abs(recording.efeatures["AP1_amp"] - 66.4), 2.0)
 
+    def test_batched_extraction(self):
+        """The batched extraction gives the same values as the per-sweep one"""
+        recording = self.cell.recordings[0]
+        efeatures = ["Spikecount", "AP1_amp", "mean_frequency"]
+        recording.compute_efeatures(efeatures)
+        per_sweep = dict(recording.efeatures)
+
+        recording.efeatures = {}
+        self.cell.extract_efeatures(protocol_name="IDRest", efeatures=efeatures)
+        self.assertEqual(per_sweep, recording.efeatures)
+
     def test_amp_threshold(self):
         recording = self.cell.recordings[0]
         compute_rheobase_absolute(self.cell, ["IDRest"])
@@ -41,6 +53,46 @@ class CellTest(unittest.TestCase):
         self.assertEqual(recording.amp, self.cell.rheobase)
         self.assertEqual(recording.amp_rel, 100.0)
 
+    def test_streaming_reader(self):
+        """Custom readers can return a list or yield the traces, which are
+        turned into recordings one at a time"""
+        file_metadata = {
+            "i_file": "./tests/exp_data/B95_Ch0_IDRest_107.ibw",
+            "v_file": "./tests/exp_data/B95_Ch3_IDRest_107.ibw",
+            "i_unit": "pA",
+            "v_unit": "mV",
+            "t_unit": "s",
+            "dt": 0.00025,
+            "ljp": 14.0,
+        }
+
+        cell = bluepyefe.cell.Cell(name="MouseNeuron")
+        n_recordings = []
+
+        def generator_reader(config_data):
+            for trace in igor_reader(config_data) * 2:
+                n_recordings.append(len(cell.recordings))
+                yield trace
+
+        cell.read_recordings(
+            protocol_data=[file_metadata],
+            protocol_name="IDRest",
+            recording_reader=generator_reader
+        )
+        self.assertEqual(n_recordings, [0, 1])
+        self.assertEqual(len(cell.recordings), 2)
+
+        cell_list = bluepyefe.cell.Cell(name="MouseNeuron")
+        cell_list.read_recordings(
+            protocol_data=[file_metadata],
+            protocol_name="IDRest",
+            recording_reader=igor_reader
+        )
+        self.assertEqual(len(cell_list.recordings), 1)
+        self.assertEqual(
+            cell_list.recordings[0].get_params(), cell.recordings[0].get_params()
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -5,6 +5,8 @@ import pytest
 
 import bluepyefe.cell
 import bluepyefe.recording
+import bluepyefe.tools
+import efel
 
 
 class EfelSettingTest(unittest.TestCase):
@@ -81,5 +83,38 @@ class EfelSettingTest(unittest.TestCase):
                 efel_settings={'Threshold': ["40."]}
             )
 
+
+class EfelSettingsManagerTest(unittest.TestCase):
+
+    def test_only_changed_settings_are_applied(self):
+
+        manager = bluepyefe.tools.EFELSettingsManager()
+
+        manager.apply({"Threshold": -10., "interp_step": 0.025})
+        manager.apply({"Threshold": -10., "interp_step": 0.025})
+        self.assertEqual(manager.n_settings_applied, 2)
+        self.assertEqual(manager.n_settings_skipped, 2)
+
+        manager.apply({"Threshold": 0., "interp_step": 0.025})
+        self.assertEqual(manager.n_settings_applied, 3)
+        self.assertEqual(efel.get_settings().Threshold, 0.)
+
+    def test_reset_when_back_to_default(self):
+
+        manager = bluepyefe.tools.EFELSettingsManager()
+
+        manager.apply({"Threshold": -10., "interp_step": 0.025})
+        resets = manager.n_resets
+        manager.apply({"Threshold": -10.})
+        self.assertEqual(manager.n_resets, resets + 1)
+        self.assertEqual(
+            efel.get_settings().interp_step,
+            manager.default_settings["interp_step"]
+        )
+        manager.apply({"Threshold": -10., "strict_stiminterval": True})
+        self.assertEqual(manager.n_resets, resets + 1)
+        self.assertGreater(manager.stats()["resets_avoided"], 0)
+
+
 if __name__ == "__main__":
     unittest.main()
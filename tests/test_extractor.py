@@ -3,9 +3,12 @@
 import unittest
 import glob
 import json
+import multiprocessing
+from unittest import mock
 
 import bluepyefe.extract
 import bluepyefe.tools
+from bluepyefe.nwbreader import LazyNWBSeries
 from tests.utils import download_sahp_datafiles
 
 
@@ -76,6 +79,24 @@ def get_config(absolute_amplitude=False):
     return files_metadata, bluepyefe.extract.convert_legacy_targets(targets)
 
 
+def get_overlapping_targets():
+    """Targets of different eFEL settings storing their values under the
+    same efeature names, extracted from the same recordings"""
+
+    targets = []
+    for amplitude, threshold in [(150, 40.), (150, -30.), (250, -30.)]:
+        for efeature in ["Spikecount", "mean_frequency"]:
+            targets.append({
+                "efeature": efeature,
+                "protocol": "IDRest",
+                "amplitude": amplitude,
+                "tolerance": 10,
+                "efel_settings": {"Threshold": threshold},
+            })
+
+    return targets
+
+
 class ExtractorTest(unittest.TestCase):
     def test_extract(self):
 
@@ -221,7 +242,185 @@ class ExtractorTest(unittest.TestCase):
 
         self.assertEqual(len(features), len(protocols))
 
+    def test_extract_in_target_only(self):
 
+        files_metadata, targets = get_config()
+
+        outputs = []
+        for in_target_only in [False, True]:
+            cells = bluepyefe.extract.read_recordings(files_metadata)
+            bluepyefe.extract.compute_rheobase(cells, protocols_rheobase=["IDRest"])
+            cells = bluepyefe.extract.extract_efeatures_at_targets(
+                cells, targets, in_target_only=in_target_only
+            )
+            protocols = bluepyefe.extract.group_efeatures(cells, targets)
+            outputs.append((
+                [c.recordings for c in cells],
+                bluepyefe.extract.create_feature_protocol_files(
+                    cells, protocols, output_directory="MouseCells"
+                )
+            ))
+
+        (all_recordings, output), (target_recordings, target_output) = outputs
+        self.assertEqual(output, target_output)
+
+        n_extracted = sum(
+            bool(r.efeatures) for recs in target_recordings for r in recs
+        )
+        self.assertEqual(
+            sum(bool(r.efeatures) for recs in all_recordings for r in recs), 10
+        )
+        self.assertGreater(n_extracted, 0)
+        self.assertLess(n_extracted, 10)
+
+        stats = bluepyefe.extract.extraction_stats()
+        self.assertEqual(stats["recordings"], 10)
+        self.assertEqual(stats["extracted"], n_extracted)
+        self.assertEqual(stats["skipped"], 10 - n_extracted)
+
+    def test_split_cells(self):
+
+        files_metadata, targets = get_config()
+
+        results = []
+        for split_cells in [False, True]:
+            cells = bluepyefe.extract.read_recordings(
+                files_metadata, split_cells=split_cells
+            )
+            bluepyefe.extract.compute_rheobase(cells, protocols_rheobase=["IDRest"])
+            with mock.patch.object(
+                bluepyefe.extract,
+                "_extract_efeatures_chunk",
+                wraps=bluepyefe.extract._extract_efeatures_chunk
+            ) as extract_chunk:
+                cells = bluepyefe.extract.extract_efeatures_at_targets(
+                    cells, targets, split_cells=split_cells, chunk_size=2
+                )
+            results.append(cells)
+
+        # 2 cells of 5 recordings in chunks of 2, longest chunks first
+        tasks = [c.args[0] for c in extract_chunk.call_args_list]
+        self.assertEqual(len(tasks), 6)
+        sizes = [len(t["recordings"]) for t in tasks]
+        self.assertEqual(sizes[:4], [2, 2, 2, 2])
+
+        for cell, split_cell in zip(*results):
+            self.assertEqual(cell.name, split_cell.name)
+            for rec, split_rec in zip(cell.recordings, split_cell.recordings):
+                self.assertEqual(rec.files, split_rec.files)
+                self.assertEqual(
+                    json.dumps(rec.efeatures, default=float),
+                    json.dumps(split_rec.efeatures, default=float)
+                )
+
+    def test_split_cells_overlapping_targets(self):
+
+        files_metadata, _ = get_config()
+
+        outputs = []
+        for split_cells in [False, True]:
+            outputs.append(bluepyefe.extract.extract_efeatures(
+                output_directory="MouseCells",
+                files_metadata=files_metadata,
+                targets=get_overlapping_targets(),
+                protocols_rheobase=["IDRest"],
+                split_cells=split_cells
+            ))
+
+        efeatures = outputs[0][0]
+        self.assertEqual(
+            efeatures["IDRest_150"]["soma"][0]["val"],
+            efeatures["IDRest_150"]["soma"][2]["val"]
+        )
+        self.assertEqual(
+            json.dumps(outputs[0], default=float),
+            json.dumps(outputs[1], default=float)
+        )
+
+    def test_split_cells_process_pool(self):
+        """The efeatures and thresholds computed by the workers are merged
+        into the recordings of the parent process"""
+
+        files_metadata, targets = get_config(absolute_amplitude=True)
+
+        cells = bluepyefe.extract.read_recordings(files_metadata)
+        cells = bluepyefe.extract.extract_efeatures_at_targets(
+            cells, targets, absolute_amplitude=True
+        )
+
+        split_cells = bluepyefe.extract.read_recordings(files_metadata)
+        # The spike detection is deferred, the thresholds are computed by
+        # the workers
+        for cell in split_cells:
+            for rec in cell.recordings:
+                self.assertTrue(rec._threshold_pending)
+
+        with multiprocessing.Pool(2) as pool:
+            split_cells = bluepyefe.extract.extract_efeatures_at_targets(
+                split_cells,
+                targets,
+                map_function=pool.map,
+                absolute_amplitude=True,
+                split_cells=True,
+                chunk_size=2
+            )
+
+        for cell, split_cell in zip(cells, split_cells):
+            for rec, split_rec in zip(cell.recordings, split_cell.recordings):
+                self.assertEqual(rec.files, split_rec.files)
+                self.assertTrue(split_rec.efeatures)
+                self.assertEqual(
+                    json.dumps(rec.efeatures, default=float),
+                    json.dumps(split_rec.efeatures, default=float)
+                )
+                self.assertFalse(split_rec._threshold_pending)
+                self.assertEqual(split_rec.auto_threshold, rec.auto_threshold)
+
+    def test_extract_lazy(self):
+
+        files_metadata = {
+            "MouseNeuron": {
+                "Step": [{
+                    "filepath": "./tests/exp_data/hippocampus-portal/99111002.nwb",
+                    "i_unit": "A",
+                    "v_unit": "V",
+                    "t_unit": "s",
+                    "ljp": 0.0,
+                }]
+            }
+        }
+        targets = [
+            {
+                "efeature": efeature,
+                "protocol": "Step",
+                "amplitude": amplitude,
+                "tolerance": 0.02,
+            }
+            for efeature in ["Spikecount", "AP_amplitude"]
+            for amplitude in [0.2, 0.6]
+        ]
+
+        outputs = []
+        for lazy in [False, True]:
+            with mock.patch.object(
+                LazyNWBSeries, "load", autospec=True, side_effect=LazyNWBSeries.load
+            ) as load:
+                outputs.append(bluepyefe.extract.extract_efeatures(
+                    output_directory="MouseCells",
+                    files_metadata=files_metadata,
+                    targets=[dict(t) for t in targets],
+                    absolute_amplitude=True,
+                    efel_settings=bluepyefe.tools.DEFAULT_EFEL_SETTINGS,
+                    lazy=lazy
+                ))
+
+        # Only the voltage of the 2 recordings matching the targets is read
+        self.assertEqual(load.call_count, 2)
+        # The currents contain NaN
+        self.assertEqual(
+            json.dumps(outputs[0], default=float),
+            json.dumps(outputs[1], default=float)
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+"""bluepyefe.file_pool tests"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from bluepyefe.file_pool import FilePool, file_pool
+from bluepyefe.nwbreader import BBPNWBReader
+from bluepyefe.reader import nwb_reader
+
+NWB_FILE = "./tests/exp_data/hippocampus-portal/99111002.nwb"
+
+
+class FilePoolTest(unittest.TestCase):
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.tmp_dir.name, f"file_{i}.nwb")
+            shutil.copy(NWB_FILE, path)
+            self.files.append(path)
+
+        self.pool = FilePool(max_size=2)
+
+    def tearDown(self):
+
+        self.pool.clear()
+        self.tmp_dir.cleanup()
+
+    def test_handle_reused(self):
+
+        handle = self.pool.get_h5(self.files[0])
+        self.assertIs(self.pool.get_h5(self.files[0]), handle)
+        self.assertEqual(self.pool.stats()["opened"], 1)
+        self.assertEqual(self.pool.stats()["reused"], 1)
+
+    def test_lru_bound(self):
+
+        first = self.pool.get_h5(self.files[0])
+        second = self.pool.get_h5(self.files[1])
+        self.pool.get_h5(self.files[0])
+        self.pool.get_h5(self.files[2])
+
+        # file_0 was used more recently than file_1
+        self.assertEqual(self.pool.stats()["open"], 2)
+        self.assertTrue(first.id.valid)
+        self.assertFalse(second.id.valid)
+
+    def test_pinned_handles(self):
+
+        with self.pool.open_h5(self.files[0]) as first:
+            self.pool.get_h5(self.files[1])
+            self.pool.get_h5(self.files[2])
+            self.pool.clear()
+            # A handle in use is neither evicted nor closed by clear
+            self.assertTrue(first.id.valid)
+            self.assertEqual(first["acquisition"].name, "/acquisition")
+
+        self.assertFalse(first.id.valid)
+
+        with self.pool.open_h5(self.files[0]) as first:
+            with self.pool.open_h5(self.files[1]) as second:
+                third = self.pool.get_h5(self.files[2])
+                self.assertEqual(self.pool.stats()["open"], 3)
+            self.assertTrue(first.id.valid)
+            self.assertTrue(third.id.valid)
+            self.assertFalse(second.id.valid)
+            self.assertEqual(self.pool.stats()["open"], 2)
+
+    def test_modified_file(self):
+
+        handle = self.pool.get_h5(self.files[0])
+        self.pool.file_info(self.files[0])["layout"] = "Scala"
+
+        os.utime(self.files[0], (time.time() + 10, time.time() + 10))
+
+        self.assertNotIn("layout", self.pool.file_info(self.files[0]))
+        self.assertIsNot(self.pool.get_h5(self.files[0]), handle)
+        self.assertFalse(handle.id.valid)
+
+
+def test_nwb_reader_uses_pool():
+    file_pool.clear()
+
+    in_data = {"filepath": NWB_FILE, "protocol_name": "Step"}
+    data = nwb_reader(in_data)
+    layout = file_pool.file_info(NWB_FILE)["nwb_layout"]
+    data_second = nwb_reader(in_data)
+
+    assert layout == "BBP"
+    assert len(data) == len(data_second)
+    assert file_pool.stats()["open"] == 1
+    assert file_pool.stats()["reused"] >= 1
+
+    file_pool.clear()
+    assert file_pool.stats()["open"] == 0
+
+
+def test_nwb_index_shared_across_protocols():
+    file_pool.clear()
+
+    with mock.patch.object(
+        BBPNWBReader, "build_index", autospec=True,
+        side_effect=BBPNWBReader.build_index
+    ) as build_index:
+        data = nwb_reader({"filepath": NWB_FILE, "protocol_name": "Step"})
+        data_second = nwb_reader(
+            {"filepath": NWB_FILE, "protocol_name": "Step", "repetition": 1}
+        )
+
+    assert build_index.call_count == 1
+    assert "BBP" in file_pool.file_info(NWB_FILE)["nwb_index"]
+    assert len(data_second) <= len(data)
+
+    file_pool.clear()
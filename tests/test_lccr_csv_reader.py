@@ -1,6 +1,8 @@
 """bluepyefe.nwbreader tests"""
+import tempfile
 import unittest
 import h5py
+import numpy
 from pathlib import Path
 from bluepyefe.reader import csv_lccr_reader
 
@@ -72,6 +74,23 @@ class TestCSVLCCRReaders(unittest.TestCase):
             self.assertEqual(len(entry['voltage']), expected_length, "Voltage array length should be reduced by 100 ms")
             self.assertEqual(len(entry['current']), expected_length, "Current array length should be reduced by 100 ms")
 
+    def test_csv_lccr_reader_placeholders(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = Path(tmp_dir) / "placeholders.txt"
+            filepath.write_text("-65.1\t-\t-64.0\n\t-65.3\t-\n-65.5\t-65.6\t\n")
+
+            test_data = self.test_data.copy()
+            test_data['filepath'] = str(filepath)
+            test_data['amplitudes'] = [10, -10]
+            test_data['remove_last_100ms'] = False
+
+            result = csv_lccr_reader(test_data)
+
+        self.assertEqual(len(result), 2)
+        numpy.testing.assert_array_equal(result[0]['voltage'], [-65.1, 0., -65.5])
+        numpy.testing.assert_array_equal(result[1]['voltage'], [0., -65.3, -65.6])
+        numpy.testing.assert_array_equal(result[0]['t'], [0., 0.1, 0.2])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -3,10 +3,12 @@ import unittest
 from pathlib import Path
 import numpy as np
 import pytest
+import h5py
 
 from bluepyefe.reader import nwb_reader
 from bluepyefe.nwbreader import (
-    NWBReader, AIBSNWBReader, ScalaNWBReader, BBPNWBReader, TRTNWBReader, VUNWBReader
+    NWBReader, AIBSNWBReader, ScalaNWBReader, BBPNWBReader, TRTNWBReader, VUNWBReader,
+    read_nwb_series
 )
 
 
@@ -290,3 +292,15 @@ def test_trt_reader_corrects_units():
     assert tr["dt"] == 0.0001
     assert len(tr["voltage"]) == 4
     assert len(tr["current"]) == 4
+
+
+@pytest.mark.parametrize("dtype", ["int16", "float32", "float64", "int32"])
+@pytest.mark.parametrize("conversion", [np.float64(3.0517578125e-05), np.float32(1e-3), 1e-12])
+def test_read_nwb_series_matches_full_read(tmp_path, dtype, conversion):
+    data = (np.random.default_rng(0).normal(size=1000) * 3000).astype(dtype)
+    with h5py.File(tmp_path / "test.h5", "w") as content:
+        dataset = content.create_dataset("data", data=data, chunks=(100,), compression="gzip")
+        out = read_nwb_series(dataset, conversion)
+        expected = np.array(dataset[()] * conversion, dtype="float32")
+    assert out.dtype == np.float32
+    np.testing.assert_array_equal(out, expected)
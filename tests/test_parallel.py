@@ -0,0 +1,339 @@
+"""bluepyefe.parallel tests"""
+
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import pathlib
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy
+
+import bluepyefe.extract
+from bluepyefe.parallel import ExecutorMap, SharedSeries, SharedTracePool
+from bluepyefe.parallel import load_shared_series, pipeline_map
+from bluepyefe.file_pool import file_pool
+from bluepyefe.recording import RecordingSummary
+from tests.test_extractor import get_config, get_overlapping_targets
+
+NWB_FILE = "./tests/exp_data/hippocampus-portal/99111002.nwb"
+
+
+def get_nwb_config(tmp_dir, n_cells):
+    """One copy of the same NWB file per cell, such that the cells open
+    different files"""
+
+    files_metadata = {}
+    for i in range(n_cells):
+        path = os.path.join(tmp_dir, f"cell_{i}.nwb")
+        shutil.copy(NWB_FILE, path)
+        files_metadata[f"cell_{i}"] = {
+            "Step": [{
+                "filepath": path,
+                "i_unit": "A",
+                "v_unit": "V",
+                "t_unit": "s",
+                "ljp": 0.0,
+            }]
+        }
+
+    targets = [
+        {
+            "efeature": efeature,
+            "protocol": "Step",
+            "amplitude": 150.,
+            "tolerance": 50.,
+        }
+        for efeature in ["Spikecount", "AP_amplitude", "mean_frequency"]
+    ]
+
+    return files_metadata, targets
+
+
+class SharedTracePoolTest(unittest.TestCase):
+    def test_extract(self):
+
+        files_metadata, targets = get_config()
+
+        cells = bluepyefe.extract.read_recordings(files_metadata)
+        bluepyefe.extract.compute_rheobase(cells, protocols_rheobase=["IDRest"])
+        cells = bluepyefe.extract.extract_efeatures_at_targets(cells, targets)
+
+        with SharedTracePool(n_processes=2) as pool:
+            shared_cells = bluepyefe.extract.read_recordings(
+                files_metadata, map_function=pool.map
+            )
+
+            for cell in shared_cells:
+                for rec in cell.recordings:
+                    self.assertIsInstance(rec._lazy_voltage, SharedSeries)
+                    self.assertIsInstance(rec._lazy_current, SharedSeries)
+                    self.assertLess(len(pickle.dumps(rec)), rec.voltage.nbytes)
+
+            bluepyefe.extract.compute_rheobase(
+                shared_cells, protocols_rheobase=["IDRest"]
+            )
+            shared_cells = bluepyefe.extract.extract_efeatures_at_targets(
+                shared_cells, targets, map_function=pool.map
+            )
+            load_shared_series(shared_cells)
+            scratch_dir = pool.scratch_dir
+
+        self.assertFalse(os.path.exists(scratch_dir))
+
+        for cell, shared_cell in zip(cells, shared_cells):
+            self.assertEqual(cell.rheobase, shared_cell.rheobase)
+            for rec, shared_rec in zip(cell.recordings, shared_cell.recordings):
+                numpy.testing.assert_array_equal(rec.voltage, shared_rec.voltage)
+                numpy.testing.assert_array_equal(rec.current, shared_rec.current)
+                self.assertEqual(
+                    json.dumps(rec.efeatures, default=float),
+                    json.dumps(shared_rec.efeatures, default=float)
+                )
+
+    def test_low_memory_map_function(self):
+
+        files_metadata, targets = get_config()
+        kwargs = {
+            "output_directory": "MouseCells",
+            "targets": targets,
+            "protocols_rheobase": ["IDRest"],
+            "low_memory_mode": True,
+            "pickle_cells": True,
+        }
+
+        output = bluepyefe.extract.extract_efeatures(
+            files_metadata=files_metadata, **kwargs
+        )
+        with multiprocessing.Pool(2) as pool:
+            pool_output = bluepyefe.extract.extract_efeatures(
+                files_metadata=files_metadata, map_function=pool.map, **kwargs
+            )
+
+        self.assertEqual(
+            json.dumps(output, default=float),
+            json.dumps(pool_output, default=float)
+        )
+
+        with open(
+            bluepyefe.extract.cells_pickle_output_path(pathlib.Path("MouseCells")),
+            "rb"
+        ) as f:
+            cells = pickle.load(f)
+        self.assertEqual(len(cells), 2)
+        for cell in cells:
+            for rec in cell.recordings:
+                self.assertIsInstance(rec, RecordingSummary)
+
+
+def _slow_square(x):
+    return x * x
+
+
+class ExecutorMapTest(unittest.TestCase):
+    def test_order_and_progress(self):
+
+        progress = []
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            map_function = ExecutorMap(
+                executor,
+                chunksize=3,
+                callback=lambda done, total: progress.append((done, total))
+            )
+            results = map_function(_slow_square, range(10))
+
+        self.assertEqual(results, [x * x for x in range(10)])
+        self.assertEqual(progress, [(i, 4) for i in range(1, 5)])
+
+    def test_failed_task(self):
+
+        calls = []
+
+        def fail_first(x):
+            calls.append(x)
+            if x == 0:
+                raise ValueError("failed task")
+            return x
+
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            with self.assertRaises(ValueError):
+                ExecutorMap(executor)(fail_first, range(100))
+
+        # The tasks that had not started when the failure was seen are
+        # cancelled
+        self.assertLess(len(calls), 100)
+
+    def test_n_jobs(self):
+
+        files_metadata, targets = get_config()
+        kwargs = {
+            "output_directory": "MouseCells",
+            "targets": targets,
+            "protocols_rheobase": ["IDRest"],
+        }
+
+        output = bluepyefe.extract.extract_efeatures(
+            files_metadata=files_metadata, **kwargs
+        )
+        parallel_output = bluepyefe.extract.extract_efeatures(
+            files_metadata=files_metadata, n_jobs=2, chunksize=1, **kwargs
+        )
+        self.assertEqual(
+            json.dumps(output, default=float),
+            json.dumps(parallel_output, default=float)
+        )
+
+        with self.assertRaises(Exception):
+            bluepyefe.extract.read_recordings(
+                files_metadata, map_function=lambda f, x: list(map(f, x)), n_jobs=2
+            )
+
+    def test_threads(self):
+        """The threads give the same outputs as the serial extraction, also
+        when chunks of different groups of targets share recordings and
+        efeature names"""
+
+        files_metadata, _ = get_config()
+
+        for get_targets in [lambda: get_config()[1], get_overlapping_targets]:
+            kwargs = {
+                "output_directory": "MouseCells",
+                "files_metadata": files_metadata,
+                "protocols_rheobase": ["IDRest"],
+            }
+
+            output = bluepyefe.extract.extract_efeatures(
+                targets=get_targets(), **kwargs
+            )
+            for split_cells in [False, True, True, True]:
+                threads_output = bluepyefe.extract.extract_efeatures(
+                    targets=get_targets(),
+                    n_jobs=4,
+                    backend="threads",
+                    split_cells=split_cells,
+                    **kwargs
+                )
+                self.assertEqual(
+                    json.dumps(output, default=float),
+                    json.dumps(threads_output, default=float)
+                )
+
+    def test_threads_nwb(self):
+        """More NWB files than the file pool can hold are read and loaded
+        lazily by concurrent threads"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files_metadata, targets = get_nwb_config(tmp_dir, 6)
+            kwargs = {
+                "output_directory": "MouseCells",
+                "targets": targets,
+                "protocols_rheobase": ["Step"],
+                "lazy": True,
+            }
+
+            with mock.patch.object(file_pool, "max_size", 2):
+                output = bluepyefe.extract.extract_efeatures(
+                    files_metadata=files_metadata, **kwargs
+                )
+                threads_output = bluepyefe.extract.extract_efeatures(
+                    files_metadata=files_metadata,
+                    n_jobs=6,
+                    backend="threads",
+                    split_cells=True,
+                    **kwargs
+                )
+
+        self.assertTrue(output[0])
+        self.assertEqual(
+            json.dumps(output, default=float),
+            json.dumps(threads_output, default=float)
+        )
+
+
+class PipelineTest(unittest.TestCase):
+    def test_memory_budget(self):
+
+        in_flight = []
+        max_in_flight = []
+
+        def read(x):
+            in_flight.append(x)
+            max_in_flight.append(sum(in_flight))
+            return x
+
+        def process(x):
+            in_flight.remove(x)
+            return x * x
+
+        results = pipeline_map(
+            read, process, range(1, 11), range(1, 11), memory_budget=12,
+            n_readers=3
+        )
+
+        self.assertEqual(results, [x * x for x in range(1, 11)])
+        self.assertLessEqual(max(max_in_flight), 12)
+
+    def test_pipeline(self):
+
+        files_metadata, targets = get_config()
+        kwargs = {
+            "output_directory": "MouseCells",
+            "targets": targets,
+            "protocols_rheobase": ["IDRest"],
+        }
+
+        output = bluepyefe.extract.extract_efeatures(
+            files_metadata=files_metadata, low_memory_mode=True, **kwargs
+        )
+        for n_jobs, memory_budget in [(None, 1), (2, 2 ** 30)]:
+            pipeline_output = bluepyefe.extract.extract_efeatures(
+                files_metadata=files_metadata,
+                pipeline=True,
+                n_jobs=n_jobs,
+                memory_budget=memory_budget,
+                **kwargs
+            )
+            self.assertEqual(
+                json.dumps(output, default=float),
+                json.dumps(pipeline_output, default=float)
+            )
+
+    def test_pipeline_nwb(self):
+        """The readers hold NWB files open while the lazy voltages of the
+        cells read before are loaded by the executor"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files_metadata, targets = get_nwb_config(tmp_dir, 6)
+            kwargs = {
+                "output_directory": "MouseCells",
+                "targets": targets,
+                "protocols_rheobase": ["Step"],
+                "lazy": True,
+            }
+
+            with mock.patch.object(file_pool, "max_size", 2):
+                output = bluepyefe.extract.extract_efeatures(
+                    files_metadata=files_metadata, low_memory_mode=True,
+                    **kwargs
+                )
+                pipeline_output = bluepyefe.extract.extract_efeatures(
+                    files_metadata=files_metadata,
+                    pipeline=True,
+                    n_jobs=3,
+                    backend="threads",
+                    **kwargs
+                )
+
+        self.assertTrue(output[0])
+        self.assertEqual(
+            json.dumps(output, default=float),
+            json.dumps(pipeline_output, default=float)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
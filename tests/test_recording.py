@@ -1,13 +1,16 @@
 """bluepyefe.cell tests"""
 
 import unittest
+from unittest import mock
 
-from numpy.testing import assert_array_almost_equal
+import numpy
+from numpy.testing import assert_array_almost_equal, assert_array_equal
 from pytest import approx
 
 import bluepyefe.cell
 import bluepyefe.recording
 from bluepyefe.reader import igor_reader
+from bluepyefe.tools import TimeAxis
 from bluepyefe.ecode.step import Step
 
 
@@ -55,6 +58,140 @@ class RecordingTest(unittest.TestCase):
         self.assertFalse(self.recording.in_target(-100, 50))
         self.assertFalse(self.recording.in_target(90, 2))
 
+    def test_efel_memo(self):
+        settings = {
+            "strict_stiminterval": True,
+            "Threshold": self.recording.auto_threshold
+        }
+        self.recording.detect_spikes()
+
+        with mock.patch.object(
+            bluepyefe.recording,
+            "get_efel_values",
+            wraps=bluepyefe.recording.get_efel_values
+        ) as get_efel_values:
+            # peak_time from the spike detection is reused to get Spikecount
+            spikecount = self.recording.call_efel(["Spikecount"], settings)
+            self.assertEqual(get_efel_values.call_count, 0)
+            self.assertEqual(
+                spikecount[0]["Spikecount"][0], self.recording.spikecount
+            )
+
+            self.recording.compute_efeatures(["mean_frequency"], None, settings)
+            self.recording.compute_efeatures(["mean_frequency"], None, settings)
+            self.assertEqual(get_efel_values.call_count, 1)
+
+            # A different stimulus window is a different context
+            self.recording.call_efel(
+                ["mean_frequency"], {**settings, "stim_start": 1000.}
+            )
+            self.assertEqual(get_efel_values.call_count, 2)
+
+        self.recording.clear_efel_memo()
+        self.assertEqual(
+            self.recording.call_efel(["Spikecount"], settings),
+            spikecount
+        )
+
+    def test_deferred_spike_detection(self):
+        config_data = {
+            "i_file": "./tests/exp_data/B95_Ch0_IDRest_107.ibw",
+            "v_file": "./tests/exp_data/B95_Ch3_IDRest_107.ibw",
+            "i_unit": "pA",
+            "v_unit": "mV",
+            "t_unit": "s",
+            "dt": 0.00025,
+            "ljp": 14.0,
+        }
+        spikecount = self.recording.spikecount
+
+        with mock.patch.object(
+            bluepyefe.recording,
+            "get_efel_values",
+            wraps=bluepyefe.recording.get_efel_values
+        ) as get_efel_values:
+            recording = Step(
+                config_data,
+                igor_reader(config_data)[0],
+                protocol_name="Step",
+                efel_settings={}
+            )
+            self.assertEqual(get_efel_values.call_count, 0)
+            self.assertIsNone(recording._auto_threshold)
+
+            self.assertEqual(recording.spikecount, spikecount)
+            self.assertEqual(recording.spikecount, spikecount)
+            self.assertEqual(get_efel_values.call_count, 1)
+            self.assertEqual(
+                recording.auto_threshold, self.recording.auto_threshold
+            )
+
+    def test_summary(self):
+        self.recording.compute_relative_amp(0.1)
+        summary = self.recording.summary()
+
+        self.assertIsInstance(summary, bluepyefe.recording.RecordingSummary)
+        self.assertIsNone(summary.voltage)
+        self.assertIsNone(summary.auto_threshold)
+        self.assertEqual(summary.get_params(), self.recording.get_params())
+        self.assertEqual(summary.name, self.recording.name)
+        self.assertTrue(summary.in_target(self.recording.amp_rel, 1.))
+
+        self.recording.detect_spikes()
+        summary = self.recording.summary()
+        self.assertEqual(summary.spikecount, self.recording.spikecount)
+        self.assertEqual(summary.auto_threshold, self.recording.auto_threshold)
+
+    def test_reader_data_without_series(self):
+        for key in ["t", "voltage", "current"]:
+            self.assertNotIn(key, self.recording.reader_data)
+
+    def test_in_place_standardization(self):
+        config_data = {
+            "i_unit": "pA",
+            "v_unit": "V",
+            "t_unit": "s",
+            "dt": 0.00025,
+            "ton": 700.,
+            "toff": 2700.,
+        }
+        voltage = self.recording.voltage / 1e3
+        current = self.recording.current * 1e3
+
+        reader_data = {"voltage": voltage.copy(), "current": current.copy()}
+        recording = Step(config_data, reader_data, protocol_name="Step")
+        assert_array_equal(reader_data["voltage"], voltage)
+        assert_array_equal(reader_data["current"], current)
+
+        reader_data = {
+            "voltage": voltage.copy(),
+            "current": current.copy(),
+            "owns_buffers": True,
+        }
+        recording_in_place = Step(config_data, reader_data, protocol_name="Step")
+        self.assertIs(recording_in_place.voltage, reader_data["voltage"])
+        self.assertIs(recording_in_place.current, reader_data["current"])
+        assert_array_equal(recording_in_place.voltage, recording.voltage)
+        assert_array_equal(recording_in_place.current, recording.current)
+
+    def test_time_axis(self):
+        time_axis = self.recording.time_axis
+        self.assertIsInstance(time_axis, TimeAxis)
+        self.assertIsNone(self.recording._t)
+
+        n_samples = len(self.recording.voltage)
+        expected = numpy.arange(n_samples) * 0.00025 * 1e3
+        self.assertEqual(len(time_axis), n_samples)
+        assert_array_equal(self.recording.t, expected)
+        self.assertEqual(time_axis[-1], expected[-1])
+        assert_array_equal(time_axis[10:20], expected[10:20])
+        with self.assertRaises(IndexError):
+            time_axis[n_samples]
+
+        self.recording.t = expected
+        self.assertIs(self.recording.t, expected)
+        self.assertIs(self.recording.time_axis, expected)
+
 
 class RecordingTestNWB(unittest.TestCase):
 
@@ -81,6 +218,30 @@ class RecordingTestNWB(unittest.TestCase):
         assert self.cell.recordings[1].spikecount == 2
         assert_array_almost_equal(self.cell.recordings[1].peak_time, [85.4, 346.1])
 
+    def test_lazy_voltage(self):
+        """Test that lazy NWB recordings match the ones read in memory."""
+        cell = bluepyefe.cell.Cell(name="MouseNeuron")
+        file_metadata = {
+                        "filepath": "./tests/exp_data/hippocampus-portal/99111002.nwb",
+                        "i_unit": "A",
+                        "v_unit": "V",
+                        "t_unit": "s",
+                        "ljp": 0.0,
+                        "protocol_name": "Step",
+                        "lazy": True
+                    }
+        cell.read_recordings(protocol_data=[file_metadata], protocol_name="Step")
+
+        assert len(cell.recordings) == len(self.cell.recordings)
+        for rec, ref in zip(cell.recordings, self.cell.recordings):
+            assert rec.is_lazy
+            assert rec._voltage is None
+            assert rec.spikecount == ref.spikecount
+            assert_array_equal(rec.voltage, ref.voltage)
+            assert rec.voltage.dtype == ref.voltage.dtype
+            rec.release_voltage()
+            assert rec._voltage is None
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,93 @@
+"""bluepyefe.rheobase tests"""
+
+import unittest
+from unittest import mock
+
+import efel
+import numpy
+
+import bluepyefe.extract
+import bluepyefe.recording
+from bluepyefe.rheobase import count_spikes
+from tests.test_extractor import get_config
+
+
+def efel_spikecount(voltage, dt, threshold, stim_start, stim_end, strict):
+    efel.reset()
+    efel.set_setting("Threshold", threshold)
+    efel.set_setting("strict_stiminterval", strict)
+    trace = {
+        "T": numpy.arange(len(voltage)) * dt,
+        "V": voltage,
+        "stim_start": [stim_start],
+        "stim_end": [stim_end],
+    }
+    peak_time = efel.get_feature_values(
+        [trace], ["peak_time"], raise_warnings=False
+    )[0]["peak_time"]
+    efel.reset()
+    return 0 if peak_time is None else len(peak_time)
+
+
+class CountSpikesTest(unittest.TestCase):
+    def test_synthetic_sweeps(self):
+
+        dt = 0.1
+        voltages = numpy.full((7, 5000), -70.)
+        # Spikes inside and outside the stimulus window
+        voltages[0, [1000, 2000, 4800]] = 10.
+        # Starts and ends above the threshold
+        voltages[1, :5] = 10.
+        voltages[1, 2000:2005] = 10.
+        voltages[1, -5:] = 10.
+        # Rises and falls through samples exactly at the threshold
+        voltages[2, 1999] = -20.
+        voltages[2, 2000:2010] = 10.
+        voltages[2, 2010] = -20.
+        voltages[2, 3000:3010] = 10.
+        # Spike dipping exactly to the threshold
+        voltages[3, 2000:2010] = 10.
+        voltages[3, 2005] = -20.
+        # Touches the threshold from below
+        voltages[4, 2000] = -20.
+        # No spike
+        voltages[5, :] = -70.
+        # Spike with a plateau at its peak
+        voltages[6, 2000:2010] = 10.
+        voltages[6, 2004:2006] = 12.
+
+        for strict in [True, False]:
+            counts = count_spikes(voltages, dt, -20., 50., 450., strict)
+            expected = [
+                efel_spikecount(v, dt, -20., 50., 450., strict)
+                for v in voltages
+            ]
+            numpy.testing.assert_array_equal(counts, expected)
+
+    def test_rheobase_methods(self):
+
+        files_metadata, _ = get_config()
+
+        rheobases = {}
+        for method in ["efel", "numpy", "validate"]:
+            cells = bluepyefe.extract.read_recordings(files_metadata)
+            with mock.patch.object(
+                bluepyefe.recording,
+                "get_efel_values",
+                wraps=bluepyefe.recording.get_efel_values
+            ) as get_efel_values:
+                bluepyefe.extract.compute_rheobase(
+                    cells,
+                    protocols_rheobase=["IDRest"],
+                    spikecount_method=method
+                )
+            if method == "numpy":
+                self.assertEqual(get_efel_values.call_count, 0)
+            rheobases[method] = [c.rheobase for c in cells]
+
+        self.assertEqual(rheobases["numpy"], rheobases["efel"])
+        self.assertEqual(rheobases["validate"], rheobases["efel"])
+
+
+if __name__ == "__main__":
+    unittest.main()